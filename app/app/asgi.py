@@ -9,8 +9,24 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+
+from app.handlers import StreamingASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+os.environ.setdefault('ORDER_API_URLCONF', 'order.api.async_urls')
+
+# as `get_asgi_application()`, with exports streamed off the event loop
+django.setup(set_prefix=False)
+django_application = StreamingASGIHandler()
+
+# imported once the apps are loaded
+from django.conf import settings  # noqa: E402
+from order.api.events import order_events  # noqa: E402
+
 
-application = get_asgi_application()
+async def application(scope, receive, send):
+    # long-lived event streams bypass Django's request handling
+    if scope['type'] == 'http' and scope['path'] == settings.ORDER_EVENTS_PATH:
+        return await order_events(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,107 @@
+"""PostgreSQL backend with an optional per process connection pool.
+
+Enabled by a `POOL` entry in the database settings:
+
+    'POOL': {'SIZE': 10, 'MAX_LIFETIME': 1800, 'CHECK_IDLE': 30, 'TIMEOUT': 10}
+
+`close()` then hands the connection back to the pool instead of closing it,
+so with `CONN_MAX_AGE = 0` every request borrows a connection for its
+duration only. Without `POOL` it's Django's PostgreSQL backend unchanged.
+"""
+import functools
+import os
+import threading
+
+import psycopg2.extras
+from django.db.backends.postgresql import base, creation
+
+from .pool import ConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def connect(conn_params, options):
+    """What `get_new_connection()` does, without touching a wrapper, since
+    pooled connections are shared by all of them
+    """
+    connection = base.Database.connect(**conn_params)
+    isolation_level = options.get('isolation_level')
+    if isolation_level is not None and isolation_level != connection.isolation_level:
+        connection.set_session(isolation_level=isolation_level)
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+def get_pools():
+    """Pools of this process, by alias
+    """
+    pid = os.getpid()
+    with _pools_lock:
+        return {
+            key[1]: pool for key, pool in _pools.items() if key[0] == pid
+        }
+
+
+def close_idle_connections():
+    for pool in get_pools().values():
+        pool.close_idle()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # connections kept by pools and other threads (async views, event
+        # streams) would block `DROP DATABASE`
+        close_idle_connections()
+        with self.connection._nodb_cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+                'WHERE datname = %s AND pid <> pg_backend_pid()',
+                [test_database_name],
+            )
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+
+    def get_pool(self, conn_params):
+        config = self.settings_dict.get('POOL')
+        if not config:
+            return None
+
+        # forked workers (uWSGI) don't share their parent's connections, and
+        # the test database gets its own pool
+        key = (os.getpid(), self.alias, repr(sorted(conn_params.items())))
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = ConnectionPool(
+                    functools.partial(connect, conn_params, self.settings_dict['OPTIONS']),
+                    size=config.get('SIZE', 10),
+                    max_lifetime=config.get('MAX_LIFETIME', 1800),
+                    check_idle=config.get('CHECK_IDLE', 30),
+                    timeout=config.get('TIMEOUT', 10),
+                )
+            return _pools[key]
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+
+        connection = self.pool.getconn()
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # a connection that failed and wasn't found usable is dropped
+            self.pool.putconn(self.connection, discard=self.errors_occurred)
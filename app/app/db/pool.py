@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """No connection was released in time. Subclasses the driver's error so
+    Django reports it as `django.db.OperationalError`.
+    """
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections for one process.
+
+    Up to `size` connections are opened on demand and handed out LIFO, so a
+    few warm connections serve most requests. A connection is discarded on checkout once it
+    is older than `max_lifetime` seconds, and pinged with `SELECT 1` first
+    when it sat idle for `check_idle` seconds or more (`0` always pings).
+    Callers wait up to `timeout` seconds for a connection when all of them
+    are in use.
+    """
+
+    def __init__(self, connect, size=10, max_lifetime=1800, check_idle=30, timeout=10):
+        self.connect = connect
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self.timeout = timeout
+
+        self.condition = threading.Condition()
+        # (connection, opened_at, released_at)
+        self.idle = deque()
+        # connection -> opened_at
+        self.opened = {}
+        self.connecting = 0
+        self.waiting = 0
+        self.counters = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'timeouts': 0,
+            'failed_checkouts': 0,
+        }
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        while True:
+            with self.condition:
+                while not self.idle and len(self.opened) + self.connecting >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        self.record_wait(started, waited)
+                        raise PoolTimeout(
+                            f'No database connection available within {self.timeout}s '
+                            f'(pool size {self.size})'
+                        )
+                    waited = True
+                    self.waiting += 1
+                    try:
+                        self.condition.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+
+                if not self.idle:
+                    # the slot is taken while connecting outside the lock
+                    self.connecting += 1
+                    break
+                connection, opened_at, released_at = self.idle.pop()
+
+            # checked outside the lock, a ping may take a while
+            healthy = self.is_healthy(connection, opened_at, released_at)
+            with self.condition:
+                if healthy:
+                    return self.checked_out(connection, started, waited)
+                self.counters['failed_checkouts'] += 1
+                self.discard(connection)
+                self.condition.notify()
+
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.condition:
+                self.connecting -= 1
+                self.condition.notify()
+            raise
+
+        with self.condition:
+            self.connecting -= 1
+            self.opened[connection] = time.monotonic()
+            self.counters['connections_opened'] += 1
+            return self.checked_out(connection, started, waited)
+
+    def putconn(self, connection, discard=False):
+        with self.condition:
+            opened_at = self.opened.get(connection)
+            if opened_at is None:
+                # not ours, e.g. opened before a fork
+                connection.close()
+                return
+
+            if not discard and not connection.closed:
+                discard = not self.reset(connection)
+            if discard or self.is_expired(opened_at):
+                self.discard(connection)
+            else:
+                self.idle.append((connection, opened_at, time.monotonic()))
+            self.condition.notify()
+
+    def close_idle(self):
+        """Close the idle connections, e.g. before dropping their database
+        """
+        with self.condition:
+            while self.idle:
+                self.discard(self.idle.pop()[0])
+
+    def stats(self):
+        with self.condition:
+            opened = len(self.opened)
+            checkouts = self.counters['checkouts']
+            return {
+                'size': self.size,
+                'open': opened,
+                'in_use': opened - len(self.idle),
+                'idle': len(self.idle),
+                'waiting': self.waiting,
+                **self.counters,
+                'mean_wait_time': self.counters['wait_time'] / checkouts if checkouts else 0.0,
+            }
+
+    def checked_out(self, connection, started, waited):
+        self.counters['checkouts'] += 1
+        self.record_wait(started, waited)
+        return connection
+
+    def record_wait(self, started, waited):
+        wait_time = time.monotonic() - started
+        if waited:
+            self.counters['waits'] += 1
+        self.counters['wait_time'] += wait_time
+        self.counters['max_wait_time'] = max(self.counters['max_wait_time'], wait_time)
+
+    def is_expired(self, opened_at):
+        return self.max_lifetime is not None and time.monotonic() - opened_at >= self.max_lifetime
+
+    def is_healthy(self, connection, opened_at, released_at):
+        if connection.closed or self.is_expired(opened_at):
+            return False
+        if self.check_idle is None or time.monotonic() - released_at < self.check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def reset(connection):
+        """Leave no transaction open for the next user
+        """
+        if connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        try:
+            connection.rollback()
+            return connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+        except psycopg2.Error:
+            return False
+
+    def discard(self, connection):
+        self.opened.pop(connection, None)
+        self.counters['connections_closed'] += 1
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
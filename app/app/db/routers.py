@@ -0,0 +1,117 @@
+"""Routing of reads to the replicas in `settings.DATABASE_REPLICAS`.
+
+Nothing is sent to a replica unless a view asks for it with `read_from()`,
+see `order.api.mixins.ReplicaReadMixin`; writes always go to `default`.
+"""
+from contextlib import contextmanager
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils.module_loading import import_string
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+@contextmanager
+def read_from(alias):
+    """Route the reads made inside the block to `alias`, `None` leaves them
+    to the default routing
+    """
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def postgres_replication_lag(alias):
+    """Seconds the replica `alias` is behind its primary, `0` when it
+    replayed everything it received or isn't a replica at all
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT CASE '
+            'WHEN NOT pg_is_in_recovery() '
+            'OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+            'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) '
+            'END'
+        )
+        return float(cursor.fetchone()[0])
+
+
+class ReplicaSet:
+    """The configured replicas that are reachable and at most
+    `REPLICA_MAX_LAG` seconds behind, probed with `REPLICA_LAG_PROBE` once
+    every `REPLICA_LAG_CHECK_INTERVAL` seconds per process, or every
+    `REPLICA_RETRY_INTERVAL` seconds while they can't be reached
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # alias -> (checked_at, lag or None when unreachable)
+        self.lags = {}
+
+    def choose(self):
+        """
+        Returns:
+            str: alias of a fresh replica, `None` when there is none
+        """
+        fresh = [alias for alias in settings.DATABASE_REPLICAS if self.is_fresh(alias)]
+        return random.choice(fresh) if fresh else None
+
+    def is_fresh(self, alias):
+        lag = self.get_lag(alias)
+        return lag is not None and lag <= settings.REPLICA_MAX_LAG
+
+    def get_lag(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            checked_at, lag = self.lags.get(alias, (None, None))
+            interval = settings.REPLICA_LAG_CHECK_INTERVAL if lag is not None else settings.REPLICA_RETRY_INTERVAL
+            if checked_at is not None and now - checked_at < interval:
+                return lag
+            # other threads keep using the last result meanwhile
+            self.lags[alias] = (now, lag)
+
+        try:
+            lag = import_string(settings.REPLICA_LAG_PROBE)(alias)
+        except DatabaseError:
+            lag = None
+        with self.lock:
+            self.lags[alias] = (now, lag)
+        return lag
+
+    def reset(self):
+        with self.lock:
+            self.lags.clear()
+
+
+replicas = ReplicaSet()
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
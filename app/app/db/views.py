@@ -0,0 +1,33 @@
+import os
+
+from django.db import connection
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .base import get_pools
+
+
+class DatabasePoolView(APIView):
+    """Connection pool metrics of the process serving the request.
+
+    Each uWSGI worker or ASGI process has its own pools, so `pid` tells
+    them apart; pools times processes must stay below `max_connections`.
+    """
+    permission_classes = [IsAdminUser]
+    swagger_schema = None
+
+    def get(self, request, *args, **kwargs):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW max_connections')
+            max_connections = int(cursor.fetchone()[0])
+            cursor.execute(
+                'SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()')
+            server_connections = cursor.fetchone()[0]
+
+        return Response({
+            'pid': os.getpid(),
+            'max_connections': max_connections,
+            'server_connections': server_connections,
+            'pools': {alias: pool.stats() for alias, pool in get_pools().items()},
+        })
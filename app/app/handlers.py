@@ -0,0 +1,72 @@
+"""ASGI request handling that streams responses reading the database.
+
+Django 3.2 iterates the body of a `StreamingHttpResponse` on the event loop,
+where a generator using the ORM, like the order export, fails with
+`SynchronousOnlyOperation` after the headers were sent, and would hold up
+every other request of the process in any case.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """`ASGIHandler` producing the parts of streaming responses on a thread
+    of their own, one per response. Every part comes from the same thread,
+    so transactions and server-side cursors the generator opened stay usable
+    until it's done.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='asgi-stream')
+        loop = asyncio.get_running_loop()
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': self.get_response_headers(response),
+            })
+            # Access `__iter__` and not `streaming_content`, as Django does
+            parts = iter(response)
+            while True:
+                part = await loop.run_in_executor(executor, next, parts, None)
+                if part is None:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            await loop.run_in_executor(executor, self.close_response, response)
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def get_response_headers(response):
+        """Headers and cookies of `response` as ASGI wants them, header case
+        preserved
+        """
+        headers = [
+            (
+                header.encode('ascii') if isinstance(header, str) else bytes(header),
+                value.encode('latin1') if isinstance(value, str) else bytes(value),
+            )
+            for header, value in response.items()
+        ]
+        headers += [
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        ]
+        return headers
+
+    @staticmethod
+    def close_response(response):
+        # closes the generator first, then the connection it used, since the
+        # thread goes away with it
+        try:
+            response.close()
+        finally:
+            connections.close_all()
@@ -53,6 +53,7 @@ INSTALLED_APPS = DJANGO_APPS + THIRDPARTY_APPS + [
 ]
 
 MIDDLEWARE = [
+    'app.timing.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,7 +63,16 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# `Server-Timing` header and a log line per request, see `app.timing`
+REQUEST_TIMING = os.environ.get('REQUEST_TIMING', 'True') == 'True'
+# Fail requests over their query budget instead of logging a warning,
+# turned on by the test runner
+QUERY_BUDGETS_STRICT = os.environ.get('QUERY_BUDGETS_STRICT', False) == 'True'
+
 ROOT_URLCONF = 'app.urls'
+TEST_RUNNER = 'app.test_runner.TestRunner'
+# `order.api.async_urls` when served by `app/asgi.py`
+ORDER_API_URLCONF = os.environ.get('ORDER_API_URLCONF', 'order.api.urls')
 
 TEMPLATES = [
     {
@@ -86,9 +96,14 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Connections are either kept by the thread that opened them for
+# `CONN_MAX_AGE` seconds or, with `DB_POOL_SIZE`, borrowed from a pool of
+# the process for each request, see `app/db/base.py`
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 0))
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "app.db",
         "NAME": os.environ.get("POSTGRES_DB", "drf_api_db"),
         "USER": os.environ.get("POSTGRES_USER", "drf_api_db_user"),
         "PASSWORD": os.environ.get(
@@ -96,6 +111,16 @@ DATABASES = {
         ),
         "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
         "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        "CONN_MAX_AGE": 0 if DB_POOL_SIZE else int(os.environ.get("CONN_MAX_AGE", 60)),
+        "POOL": {
+            "SIZE": DB_POOL_SIZE,
+            # seconds before a connection is replaced
+            "MAX_LIFETIME": int(os.environ.get("DB_POOL_MAX_LIFETIME", 1800)),
+            # seconds idle after which it's pinged on checkout
+            "CHECK_IDLE": int(os.environ.get("DB_POOL_CHECK_IDLE", 30)),
+            # seconds to wait for a free connection
+            "TIMEOUT": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        } if DB_POOL_SIZE else None,
         'TEST': {
             'NAME': 'test',
             'USER': 'test',
@@ -107,6 +132,87 @@ DATABASES = {
 }
 
 
+# Seconds to wait for a replica to accept a connection, so an unreachable
+# one doesn't hold up the request probing it
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get("REPLICA_CONNECT_TIMEOUT", 2))
+
+# Read replicas as `host[:port]` list, e.g. "replica-1,replica-2:5433". Safe
+# requests of the order API read from them, see `app/db/routers.py`.
+for number, address in enumerate(filter(None, os.environ.get("POSTGRES_REPLICAS", "").split(",")), 1):
+    host, _, port = address.strip().partition(":")
+    DATABASES[f"replica_{number}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "OPTIONS": {"connect_timeout": REPLICA_CONNECT_TIMEOUT},
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ['app.db.routers.ReplicaRouter']
+# Seconds a replica may lag behind before reads go to the primary instead
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", 5))
+REPLICA_LAG_CHECK_INTERVAL = 5
+# Seconds a replica that couldn't be probed is left out before the next try
+REPLICA_RETRY_INTERVAL = int(os.environ.get("REPLICA_RETRY_INTERVAL", 30))
+REPLICA_LAG_PROBE = 'app.db.routers.postgres_replication_lag'
+# Seconds a client reads from the primary after writing, to see its writes
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 5))
+REPLICA_PIN_COOKIE = 'use_primary'
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+    # order list pages, see `order.api.cache.ListCache`; with several
+    # processes point it at a shared backend, or invalidations stay local
+    'order_list': {
+        'BACKEND': os.environ.get(
+            'ORDER_LIST_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('ORDER_LIST_CACHE_LOCATION', 'order-list'),
+        'OPTIONS': {
+            # entries kept before the backend starts culling
+            'MAX_ENTRIES': int(os.environ.get('ORDER_LIST_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+}
+
+# Pizza catalog responses, invalidated whenever a pizza changes
+PIZZA_CACHE = 'default'
+PIZZA_CACHE_TIMEOUT = 60 * 60 * 24
+# How long clients and proxies may reuse a catalog response without asking
+PIZZA_CACHE_MAX_AGE = int(os.environ.get('PIZZA_CACHE_MAX_AGE', 60))
+
+# Order list results, invalidated per status whenever orders change;
+# a timeout of 0 turns the cache off
+ORDER_LIST_CACHE = 'order_list'
+ORDER_LIST_CACHE_TIMEOUT = int(os.environ.get('ORDER_LIST_CACHE_TIMEOUT', 30))
+
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'app.timing': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_TIMING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -156,13 +262,72 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # https://www.django-rest-framework.org/
 
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'order.api.pagination.EstimatedCountPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'order.api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'PAGE_SIZE': 20
 }
 
+# Read serializers output through functions compiled from their fields,
+# see `order.api.compiled`; `False` runs DRF's own `to_representation()`
+COMPILED_SERIALIZERS = os.environ.get('COMPILED_SERIALIZERS', 'True') == 'True'
+# Most compiled serializers kept, least recently used go first; every
+# `?fields=` combination compiles one of its own
+COMPILED_SERIALIZERS_CACHE_SIZE = int(os.environ.get('COMPILED_SERIALIZERS_CACHE_SIZE', 128))
+
+# Lists whose planner estimate reaches this many rows report the estimate
+# instead of running an exact COUNT(*); set empty, `None`, to always count
+PAGINATION_EXACT_COUNT_THRESHOLD = (
+    int(os.environ.get('PAGINATION_EXACT_COUNT_THRESHOLD', 10000))
+    if os.environ.get('PAGINATION_EXACT_COUNT_THRESHOLD') != '' else None
+)
+PAGINATION_COUNT_CACHE = 'default'
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+
+# Customer searches whose planner estimate reaches this many orders are
+# sorted by the default ordering, as ranking them means sorting every match;
+# `None` always ranks
+ORDER_SEARCH_RANK_THRESHOLD = int(
+    os.environ.get('ORDER_SEARCH_RANK_THRESHOLD', 10000))
+
+# Largest batch accepted by `POST /api/v1/orders/bulk/`
+ORDER_BULK_CREATE_MAX_SIZE = int(os.environ.get('ORDER_BULK_CREATE_MAX_SIZE', 10000))
+# Most orders moved at once by `POST /api/v1/orders/bulk-status/`
+ORDER_BULK_STATUS_MAX_SIZE = int(os.environ.get('ORDER_BULK_STATUS_MAX_SIZE', 1000))
+# Most orders a kitchen station takes at once from `POST /api/v1/orders/claim/`
+ORDER_CLAIM_MAX_SIZE = int(os.environ.get('ORDER_CLAIM_MAX_SIZE', 50))
+# Seconds after which orders claimed, or renewed last, but still ACCEPTED can
+# be claimed again
+ORDER_CLAIM_LEASE = int(os.environ.get('ORDER_CLAIM_LEASE', 300))
+
 # Django REST Framework Extensions
 # http://chibisov.github.io/drf-extensions/docs/#settings
 
+# Threads serving the async read endpoints of the ASGI deployment
+ASYNC_READ_THREADS = int(os.environ.get('ASYNC_READ_THREADS', 8))
+
+# Order status feed, `GET /api/v1/orders/events/` served by `app/asgi.py`.
+# `order.broker.InProcessBroker` only sees changes made by its own process.
+ORDER_EVENTS_BROKER = os.environ.get('ORDER_EVENTS_BROKER', 'order.broker.PostgresBroker')
+ORDER_EVENTS_PATH = '/api/v1/orders/events/'
+# Seconds between keep-alive comments on idle streams
+ORDER_EVENTS_HEARTBEAT = int(os.environ.get('ORDER_EVENTS_HEARTBEAT', 15))
+# Events a client may fall behind before it's disconnected
+ORDER_EVENTS_QUEUE_SIZE = 1000
+# Most changes replayed after `Last-Event-ID`
+ORDER_EVENTS_CATCHUP_LIMIT = 1000
+
+# Status changes are logged to `OrderStatusEvent` off the request path, see
+# `order.history`: in batches of up to this many rows
+ORDER_STATUS_HISTORY_BATCH_SIZE = int(os.environ.get('ORDER_STATUS_HISTORY_BATCH_SIZE', 500))
+# Seconds changes may wait to be written; 0 writes them only once a batch
+# is full, or on `flush()`
+ORDER_STATUS_HISTORY_FLUSH_INTERVAL = float(os.environ.get('ORDER_STATUS_HISTORY_FLUSH_INTERVAL', 2))
+# Default window of `GET /api/v1/orders/status-durations/`, in seconds
+ORDER_STATUS_DURATIONS_WINDOW = 7 * 24 * 60 * 60
+
 REST_FRAMEWORK_EXTENSIONS = {
     'DEFAULT_PARENT_LOOKUP_KWARG_NAME_PREFIX': '',
 }
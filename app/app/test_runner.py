@@ -0,0 +1,33 @@
+import logging
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """Fails the requests over their query budget, see `app.timing`, keeps
+    the per-request log lines out of the test output, and has the status
+    history written by the tests rather than by a thread of its own, see
+    `order.history`
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.saved_budgets_strict = settings.QUERY_BUDGETS_STRICT
+        settings.QUERY_BUDGETS_STRICT = True
+        self.saved_history_flush_interval = settings.ORDER_STATUS_HISTORY_FLUSH_INTERVAL
+        settings.ORDER_STATUS_HISTORY_FLUSH_INTERVAL = 0
+        logger = logging.getLogger('app.timing')
+        self.saved_timing_log_level = logger.level
+        logger.setLevel(logging.WARNING)
+        # tests loading `app.asgi` set Django up, and logging, once more
+        logger_config = settings.LOGGING['loggers']['app.timing']
+        self.saved_timing_log_config_level = logger_config['level']
+        logger_config['level'] = 'WARNING'
+
+    def teardown_test_environment(self, **kwargs):
+        super().teardown_test_environment(**kwargs)
+        settings.QUERY_BUDGETS_STRICT = self.saved_budgets_strict
+        settings.ORDER_STATUS_HISTORY_FLUSH_INTERVAL = self.saved_history_flush_interval
+        logging.getLogger('app.timing').setLevel(self.saved_timing_log_level)
+        settings.LOGGING['loggers']['app.timing']['level'] = self.saved_timing_log_config_level
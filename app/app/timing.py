@@ -0,0 +1,233 @@
+"""Per-request timings: database queries, serialization and rendering.
+
+`RequestTimingMiddleware` reports them in a `Server-Timing` header and a log
+line per request, and checks the query budget the view declares for the
+action, see `order.api.mixins.QueryBudgetMixin`:
+
+    query_budgets = {'list': 4, 'retrieve': 3}
+
+A request over budget is logged as a warning, or fails with
+`QueryBudgetExceeded` when `QUERY_BUDGETS_STRICT` is on, as it is in tests.
+"""
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class Timings:
+    """What one request spent its time on, durations in seconds
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.durations = {'db': 0.0, 'serialize': 0.0, 'render': 0.0}
+        self.view = None
+        self.action = None
+        self.budget = None
+
+    def record_query(self, execute, sql, params, many, context):
+        """`execute_wrapper()` of the database connections
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += time.perf_counter() - started
+            self.queries += 1
+
+    @contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, duration):
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.queries > self.budget
+
+    def server_timing(self):
+        """Value of the `Server-Timing` header, durations in milliseconds
+        """
+        metrics = [
+            f'db;dur={self.durations["db"] * 1000:.1f};desc="{self.queries} queries"',
+            *(
+                f'{name};dur={duration * 1000:.1f}'
+                for name, duration in self.durations.items() if name != 'db'
+            ),
+            f'total;dur={self.total * 1000:.1f}',
+        ]
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            'view': self.view,
+            'action': self.action,
+            'queries': self.queries,
+            'query_budget': self.budget,
+            **{
+                f'{name}_ms': round(duration * 1000, 1)
+                for name, duration in self.durations.items()
+            },
+            'total_ms': round(self.total * 1000, 1),
+        }
+
+
+# `Timings` of the request being measured. Context variables follow it into
+# the threads its views run on, such as those of `sync_to_async()`.
+current_timings = ContextVar('current_timings', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """`execute_wrapper()` of every database connection, counting into
+    `current_timings`
+    """
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.record_query(execute, sql, params, many, context)
+
+
+def add_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(add_query_recorder)
+
+
+@contextmanager
+def recording_queries(timings):
+    """Count the queries made in this context into `timings`, once even when
+    nested, e.g. by views running on threads of their own. `None` counts
+    nothing
+    """
+    if timings is None:
+        yield
+        return
+
+    # connections of this thread opened before this module was loaded
+    for alias in connections:
+        add_query_recorder(connections[alias])
+    token = current_timings.set(timings)
+    try:
+        yield
+    finally:
+        current_timings.reset(token)
+
+
+def measure_rendering(timings, response):
+    """Add the time the next `response.render()` takes to `timings`
+    """
+    started = time.perf_counter()
+    response.add_post_render_callback(
+        lambda response: timings.add('render', time.perf_counter() - started))
+
+
+def get_query_budget(view_func, method):
+    """The budget `view_func` declares for the action serving `method`
+
+    Returns:
+        tuple: view name, action name and budget, `None` when not declared
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return None, None, None
+
+    # viewsets map methods to actions, other views are budgeted per method
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    budgets = getattr(view_class, 'query_budgets', None) or {}
+    return view_class.__name__, action, budgets.get(action)
+
+
+class RequestTimingMiddleware:
+    '''
+        Measures every request, see `Timings`. Place it first, so the
+        rendering of the other middleware's template responses is included.
+        Streaming responses are measured up to their first byte only.
+        Async under ASGI, so it doesn't put the whole chain on one thread.
+    '''
+    header = 'Server-Timing'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # makes Django await `__call__()`
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.REQUEST_TIMING:
+            return self.get_response(request)
+
+        timings = request.timings = Timings()
+        with recording_queries(timings):
+            response = self.get_response(request)
+        return self.report(request, response, timings)
+
+    async def __acall__(self, request):
+        if not settings.REQUEST_TIMING:
+            return await self.get_response(request)
+
+        timings = request.timings = Timings()
+        with recording_queries(timings):
+            response = await self.get_response(request)
+        return self.report(request, response, timings)
+
+    def report(self, request, response, timings):
+        response[self.header] = timings.server_timing()
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **timings.as_dict(),
+        }))
+
+        if timings.over_budget:
+            message = (
+                f'{timings.view}.{timings.action} made {timings.queries} queries, '
+                f'its budget is {timings.budget}: {request.method} {request.get_full_path()}'
+            )
+            if settings.QUERY_BUDGETS_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            timings.view, timings.action, timings.budget = get_query_budget(
+                view_func, request.method)
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            # rendering follows right after the last of these hooks
+            measure_rendering(timings, response)
+        return response
@@ -13,14 +13,17 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from app.db.views import DatabasePoolView
+
 api_urlpatterns = [
     path('api/v1/', include([
-        path('', include(('order.api.urls', 'order'), namespace='order')),
+        path('', include((settings.ORDER_API_URLCONF, 'order'), namespace='order')),
     ])),
 ]
 
@@ -39,4 +42,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('doc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('db/pool/', DatabasePoolView.as_view(), name='db-pool'),
 ] + api_urlpatterns
@@ -0,0 +1,21 @@
+"""Routes of `order.api.urls` for the ASGI deployment, with the read-heavy
+endpoints served by async views
+"""
+from django.urls import URLPattern
+
+from .async_views import async_view
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_ROUTES = (
+    'order-list',
+    'order-detail',
+    'order-items-list',
+    'pizza-list',
+    'pizza-detail',
+)
+
+urlpatterns = [
+    URLPattern(pattern.pattern, async_view(pattern.callback), pattern.default_args, pattern.name)
+    if pattern.name in ASYNC_ROUTES else pattern
+    for pattern in sync_urlpatterns
+]
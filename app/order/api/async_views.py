@@ -0,0 +1,64 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from app.timing import measure_rendering, recording_queries
+
+# Threads running the read endpoints under ASGI. Each keeps its own database
+# connection for `CONN_MAX_AGE`, so this also bounds the connections taken.
+read_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_READ_THREADS,
+    thread_name_prefix='api-read',
+)
+
+
+def run_view(view, request, *args, **kwargs):
+    """Run `view` and render its response on the calling thread
+    """
+    # see `app.timing.RequestTimingMiddleware`
+    timings = getattr(request, 'timings', None)
+    with recording_queries(timings):
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            if timings is not None:
+                measure_rendering(timings, response)
+            response.render()
+    return response
+
+
+def run_read(view, request, *args, **kwargs):
+    """`run_view()` as a request of its own as far as database connections
+    are concerned
+    """
+    close_old_connections()
+    try:
+        return run_view(view, request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Async version of a DRF view.
+
+    Django 3.2 runs every sync view of an ASGI process on one shared thread,
+    so a slow query would hold up all other requests. Safe methods run on
+    `read_executor` instead, concurrently; the response is exactly the one
+    of `view`. Other methods keep Django's default.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(
+                read_executor,
+                functools.partial(context.run, run_read, view, request, *args, **kwargs),
+            )
+        return await sync_to_async(run_view, thread_sensitive=True)(view, request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,208 @@
+from collections import Counter
+import hashlib
+import random
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.utils.http import quote_etag
+
+from order.models import Order
+from .fieldsets import split_param
+from .filters import search_words
+
+
+class ResponseCache:
+    """Serialized API responses stored in Django's cache framework.
+
+    Entries are keyed by a version token shared by the whole namespace, so
+    `invalidate()` drops every entry at once without having to find them,
+    which works the same on every cache backend.
+    """
+
+    def __init__(self, namespace, alias='default', timeout=None):
+        self.namespace = namespace
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def version_key(self):
+        return f'{self.namespace}:version'
+
+    def get_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            # an evicted token just means a fresh, empty namespace
+            self.cache.add(self.version_key, uuid.uuid4().hex, None)
+            version = self.cache.get(self.version_key)
+        return version
+
+    def invalidate(self):
+        self.cache.set(self.version_key, uuid.uuid4().hex, None)
+
+    def make_key(self, request, version):
+        path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+        return f'{self.namespace}:{version}:{path}'
+
+    def make_etag(self, key):
+        return quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, data):
+        self.cache.set(key, data, self.timeout)
+
+
+pizza_cache = ResponseCache(
+    'pizza',
+    alias=settings.PIZZA_CACHE,
+    timeout=settings.PIZZA_CACHE_TIMEOUT,
+)
+
+
+class ListCache:
+    """Serialized list responses keyed by their normalized query, with one
+    generation counter per status.
+
+    A key embeds the counters of every status the list can contain: the one
+    of its `?status=` filter, or all of them without a filter. `invalidate()`
+    bumps counters, so lists of untouched statuses stay cached. A counter
+    lost to eviction restarts at a random value and can't match old keys.
+
+    Only requests made of `query_params` are cached; their normalizers make
+    equivalent queries share an entry. Hit and miss counts are kept per
+    process, see `stats()`.
+    """
+
+    def __init__(self, namespace, statuses, query_params, alias='default', timeout=DEFAULT_TIMEOUT):
+        """
+        Args:
+            statuses (list): every status value
+            query_params (dict): query parameter -> normalizer of its values
+        """
+        self.namespace = namespace
+        self.statuses = [str(value) for value in statuses]
+        self.query_params = query_params
+        self.alias = alias
+        self.timeout = timeout
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def enabled(self):
+        return self.timeout != 0
+
+    def generation_key(self, status):
+        return f'{self.namespace}:generation:{status}'
+
+    def get_generations(self, statuses):
+        keys = [self.generation_key(status) for status in statuses]
+        generations = self.cache.get_many(keys)
+        for key in keys:
+            if key not in generations:
+                self.cache.add(key, random.getrandbits(48), None)
+                generations[key] = self.cache.get(key)
+        return [generations[key] for key in keys]
+
+    def invalidate(self, statuses=None):
+        """Bump the counters of `statuses`, all of them by default
+        """
+        statuses = self.statuses if statuses is None else statuses
+        for status in {str(status) for status in statuses if status is not None}:
+            key = self.generation_key(status)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, random.getrandbits(48), None)
+            self.count('invalidations')
+
+    def make_key(self, request, status=None):
+        """
+        Args:
+            status (str): value of the status filter, `None` without one
+
+        Returns:
+            str: cache key of the request, `None` when it can't be cached
+        """
+        params = request.query_params
+        if any(name not in self.query_params for name in params):
+            return None
+
+        query = [
+            (name, self.query_params[name](params.getlist(name)))
+            for name in sorted(params)
+        ]
+        generations = self.get_generations(self.statuses if status is None else [status])
+        value = repr((request.build_absolute_uri(request.path), query, generations))
+        return f'{self.namespace}:{hashlib.md5(value.encode("utf-8")).hexdigest()}'
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        self.count('misses' if entry is None else 'hits')
+        return entry
+
+    def set(self, key, entry):
+        self.cache.set(key, entry, self.timeout)
+        self.count('stores')
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters.get('hits', 0) + counters.get('misses', 0)
+        return {
+            **{
+                name: counters.get(name, 0)
+                for name in ('hits', 'misses', 'bypasses', 'stores', 'invalidations')
+            },
+            'hit_ratio': counters.get('hits', 0) / lookups if lookups else None,
+        }
+
+
+def last_value(values):
+    """What `QueryDict.get()` reads
+    """
+    return values[-1]
+
+
+def search_terms(values):
+    """The words `CustomerSearchFilter` matches, case-insensitively and in
+    any order
+    """
+    return ' '.join(search_words(values[-1:]))
+
+
+def field_names(values):
+    return ','.join(sorted(set(split_param(values))))
+
+
+order_list_cache = ListCache(
+    'order-list',
+    statuses=Order.DeliveryStatuses.values,
+    query_params={
+        'status': last_value,
+        'search': search_terms,
+        'limit': last_value,
+        'offset': last_value,
+        'cursor': last_value,
+        'pagination': last_value,
+        'fields': field_names,
+        'expand': field_names,
+    },
+    alias=settings.ORDER_LIST_CACHE,
+    timeout=settings.ORDER_LIST_CACHE_TIMEOUT,
+)
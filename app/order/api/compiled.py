@@ -0,0 +1,292 @@
+"""Serializer output through functions generated from the serializer fields.
+
+`Serializer.to_representation()` resolves every field of every row through
+DRF's generic machinery: `get_attribute()`, `SkipField` handling and an
+`OrderedDict` per object. For read-only output the fields don't change from
+row to row, so `compile_representation()` turns a serializer into plain
+Python code instead:
+
+    def serializer_0(obj):
+        ret = {}
+        value = obj.id
+        ret['id'] = None if value is None else int(value)
+        value = obj.orderitem_set
+        ret['items'] = None if value is None else [serializer_1(item) for item in iterate(value)]
+        ...
+
+The output is the same as the serializer's, as plain dicts. Fields the
+compiler doesn't know fall back to their own `to_representation()`.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.db.models.fields.related_descriptors import (
+    ForwardManyToOneDescriptor,
+    ReverseManyToOneDescriptor,
+    ReverseOneToOneDescriptor,
+)
+from django.db.models.query_utils import DeferredAttribute
+from rest_framework import fields, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
+
+# plain model attributes, read with `obj.<name>` instead of `get_attribute()`
+SIMPLE_DESCRIPTORS = (
+    DeferredAttribute,
+    ForwardManyToOneDescriptor,
+    ReverseManyToOneDescriptor,
+    ReverseOneToOneDescriptor,
+)
+# the ones raising `ObjectDoesNotExist`, which `get_attribute()` turns into `None`
+RELATED_OBJECT_DESCRIPTORS = (
+    ForwardManyToOneDescriptor,
+    ReverseOneToOneDescriptor,
+)
+
+# field classes whose `to_representation()` is inlined, see `Compiler.leaf`
+INLINE_FIELDS = {
+    fields.IntegerField: 'int({})',
+    fields.CharField: 'str({})',
+    fields.EmailField: 'str({})',
+}
+
+# compiled factories by the structure they output, the most recently used
+# last; `?fields=` makes new structures, so only so many are kept
+_factories = OrderedDict()
+_factories_lock = threading.Lock()
+
+
+def iterate(data):
+    """What `ListSerializer.to_representation()` iterates over
+    """
+    return data.all() if isinstance(data, models.Manager) else data
+
+
+def make_datetime_representation(field):
+    """`DateTimeField.to_representation()` with the format and the current
+    time zone resolved once, for the lifetime of the serializer
+    """
+    field_timezone = getattr(field, 'timezone', field.default_timezone())
+    enforce_timezone = field.enforce_timezone
+
+    def to_representation(value):
+        if not value:
+            return None
+        if isinstance(value, str):
+            return value
+        if field_timezone is not None and value.utcoffset() is not None:
+            try:
+                value = value.astimezone(field_timezone)
+            except OverflowError:
+                value = enforce_timezone(value)
+        else:
+            value = enforce_timezone(value)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return to_representation
+
+
+def make_choice_representation(field):
+    choices = field.choice_strings_to_values
+
+    def to_representation(value):
+        if value == '':
+            return value
+        return choices.get(str(value), value)
+
+    return to_representation
+
+
+def is_compilable(serializer):
+    return (
+        isinstance(serializer, serializers.Serializer)
+        and type(serializer).to_representation in (
+            serializers.Serializer.to_representation,
+            CompiledSerializerMixin.to_representation,
+        )
+    )
+
+
+def is_compilable_list(field):
+    return (
+        isinstance(field, serializers.ListSerializer)
+        and type(field).to_representation is serializers.ListSerializer.to_representation
+        and is_compilable(field.child)
+    )
+
+
+class Compiler:
+    """Generates the source of a factory taking the serializer's fields and
+    returning the representation function
+    """
+
+    def __init__(self):
+        self.fields = []
+        self.prologue = []
+        self.functions = []
+        self.key = []
+
+    def compile(self, serializer):
+        name = self.serializer(serializer)
+        arguments = ', '.join(f'f{index}' for index in range(len(self.fields)))
+        source = '\n'.join([
+            f'def factory({arguments}):',
+            *self.prologue,
+            *self.functions,
+            f'    return {name}',
+        ])
+        return tuple(self.key), source
+
+    def add_field(self, field):
+        self.fields.append(field)
+        return f'f{len(self.fields) - 1}'
+
+    def serializer(self, serializer):
+        name = f'serializer_{len(self.functions)}'
+        self.functions.append(None)
+        index = len(self.functions) - 1
+        self.key.append(('serializer', type(serializer)))
+
+        body = [f'    def {name}(obj):', '        ret = {}']
+        model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+        for field in serializer._readable_fields:
+            body += self.field(field, model)
+        body.append('        return ret')
+
+        self.functions[index] = '\n'.join(body)
+        self.key.append(('end',))
+        return name
+
+    def field(self, field, model):
+        key = repr(field.field_name)
+        reference = self.add_field(field)
+
+        attribute = self.simple_attribute(field, model)
+        if attribute is None:
+            self.key.append(('fallback', field.field_name))
+            return [
+                '        try:',
+                f'            value = {reference}.get_attribute(obj)',
+                '        except SkipField:',
+                '            pass',
+                '        else:',
+                '            check = value.pk if isinstance(value, PKOnlyObject) else value',
+                f'            ret[{key}] = None if check is None '
+                f'else {reference}.to_representation(value)',
+            ]
+
+        self.key.append(('field', field.field_name, attribute))
+        if isinstance(model.__dict__[attribute], RELATED_OBJECT_DESCRIPTORS):
+            read = [
+                '        try:',
+                f'            value = obj.{attribute}',
+                '        except ObjectDoesNotExist:',
+                '            value = None',
+            ]
+        else:
+            read = [f'        value = obj.{attribute}']
+        return read + [
+            f'        ret[{key}] = None if value is None else {self.leaf(field, reference)}',
+        ]
+
+    def leaf(self, field, reference):
+        """Expression turning a non-`None` `value` into its representation
+        """
+        if is_compilable_list(field):
+            self.key.append(('many',))
+            child = self.serializer(field.child)
+            return f'[{child}(item) for item in iterate(value)]'
+
+        if is_compilable(field):
+            self.key.append(('one',))
+            return f'{self.serializer(field)}(value)'
+
+        field_type = type(field)
+        if field_type in INLINE_FIELDS:
+            self.key.append(('inline', field_type))
+            return INLINE_FIELDS[field_type].format('value')
+
+        converter = f'{reference}_to_representation'
+        if (
+            field_type is fields.DateTimeField
+            and getattr(field, 'format', api_settings.DATETIME_FORMAT) == api_settings.DATETIME_FORMAT
+            and api_settings.DATETIME_FORMAT.lower() == fields.ISO_8601
+        ):
+            self.key.append(('datetime',))
+            self.prologue.append(f'    {converter} = make_datetime_representation({reference})')
+        elif field_type is fields.ChoiceField:
+            self.key.append(('choice',))
+            self.prologue.append(f'    {converter} = make_choice_representation({reference})')
+        else:
+            self.key.append(('to_representation',))
+            self.prologue.append(f'    {converter} = {reference}.to_representation')
+        return f'{converter}(value)'
+
+    @staticmethod
+    def simple_attribute(field, model):
+        """The attribute `field` reads when it's a plain model attribute
+        """
+        if model is None or len(field.source_attrs) != 1:
+            return None
+        if type(field).get_attribute is not fields.Field.get_attribute:
+            return None
+        attribute = field.source_attrs[0]
+        if not attribute.isidentifier():
+            return None
+        if not isinstance(model.__dict__.get(attribute), SIMPLE_DESCRIPTORS):
+            return None
+        return attribute
+
+
+def compile_representation(serializer):
+    """
+    Returns:
+        function: object -> representation of it by `serializer`
+    """
+    compiler = Compiler()
+    key, source = compiler.compile(serializer)
+
+    with _factories_lock:
+        factory = _factories.get(key)
+        if factory is not None:
+            _factories.move_to_end(key)
+    if factory is None:
+        namespace = {
+            'ObjectDoesNotExist': ObjectDoesNotExist,
+            'SkipField': SkipField,
+            'PKOnlyObject': PKOnlyObject,
+            'iterate': iterate,
+            'make_datetime_representation': make_datetime_representation,
+            'make_choice_representation': make_choice_representation,
+        }
+        exec(compile(source, f'<compiled {type(serializer).__name__}>', 'exec'), namespace)
+        factory = namespace['factory']
+        with _factories_lock:
+            _factories[key] = factory
+            while len(_factories) > settings.COMPILED_SERIALIZERS_CACHE_SIZE:
+                _factories.popitem(last=False)
+
+    return factory(*compiler.fields)
+
+
+class CompiledSerializerMixin:
+    '''
+        Read serializer whose `to_representation()` runs a function compiled
+        from its fields, see `compile_representation()`
+    '''
+
+    def to_representation(self, instance):
+        if not settings.COMPILED_SERIALIZERS:
+            return super().to_representation(instance)
+        try:
+            representation = self._compiled_representation
+        except AttributeError:
+            representation = self._compiled_representation = compile_representation(self)
+        return representation(instance)
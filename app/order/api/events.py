@@ -0,0 +1,176 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+
+from order.broker import get_broker
+from order.events import StatusChange, parse_event_id
+from order.history import status_history
+from order.models import Order, OrderStatusEvent
+
+
+class OrderEventStream:
+    """`text/event-stream` of order status changes.
+
+        GET /api/v1/orders/events/?status=READY&status=SHIPPED
+        Last-Event-ID: 1618524000000000-42
+
+    Each change is sent as an `order` event carrying `id`, `status` and
+    `updated_at`. With `Last-Event-ID` (or `?last_event_id=`) the status
+    changes since then are replayed first from `OrderStatusEvent`, which
+    other processes write a few seconds late, see `order.history`; when
+    more than `ORDER_EVENTS_CATCHUP_LIMIT` of them happened a `reset` event
+    tells the client to reload the list instead.
+
+    It's a plain ASGI application rather than a Django view, because
+    Django 3.2 consumes streaming responses synchronously and would hold a
+    worker thread per connected client.
+    """
+    retry = 3000
+    event_name = 'order'
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            return await self.send_error(
+                send, 405, {'detail': f'Method "{scope["method"]}" not allowed.'}, [(b'allow', b'GET')])
+
+        params = parse_qs(scope['query_string'].decode('latin-1'))
+        statuses = [
+            value for param in params.get('status', [])
+            for value in param.split(',') if value
+        ]
+        invalid = [value for value in statuses if value not in Order.DeliveryStatuses.values]
+        if invalid:
+            return await self.send_error(send, 400, {
+                'status': [f'"{value}" is not a valid choice.' for value in invalid],
+            })
+
+        headers = dict(scope['headers'])
+        last_event_id = (
+            headers.get(b'last-event-id', b'').decode('latin-1')
+            or params.get('last_event_id', [''])[0]
+        )
+        position = parse_event_id(last_event_id)
+
+        broker = get_broker()
+        # subscribed before the catch-up query, so nothing falls in between
+        subscription = broker.subscribe(statuses)
+        try:
+            stream = asyncio.ensure_future(self.stream(send, subscription, statuses, position))
+            disconnect = asyncio.ensure_future(self.wait_for_disconnect(receive))
+            done, pending = await asyncio.wait(
+                {stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                task.result()
+        finally:
+            broker.unsubscribe(subscription)
+
+    async def stream(self, send, subscription, statuses, position):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await self.send_body(send, f'retry: {self.retry}\n\n')
+
+        replayed = None
+        if position is not None:
+            changes, complete = await sync_to_async(self.get_changes_since)(position, statuses)
+            if not complete:
+                await self.send_body(send, 'event: reset\ndata: {}\n\n')
+            else:
+                for change in changes:
+                    await self.send_change(send, change)
+                if changes:
+                    replayed = changes[-1].position
+
+        while True:
+            try:
+                change = await asyncio.wait_for(
+                    subscription.get(), settings.ORDER_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                await self.send_body(send, ': ping\n\n')
+                continue
+
+            if change is None:
+                # too far behind, the client resumes from its last event
+                break
+            if replayed is not None and change.position <= replayed:
+                continue
+            await self.send_change(send, change)
+
+        await self.send_body(send, '', more_body=False)
+
+    def get_changes_since(self, position, statuses):
+        """
+        Returns:
+            tuple: status changes after `position`, ordered by position,
+                which is when their statements ran and not when they were
+                committed, and whether they are all of them
+        """
+        close_old_connections()
+        try:
+            # the ones of this process still waiting to be written
+            status_history.flush()
+            changed_at, pk = position
+            queryset = (
+                OrderStatusEvent.objects
+                .filter(Q(changed_at__gt=changed_at) | Q(changed_at=changed_at, order_id__gt=pk))
+                .order_by('changed_at', 'order_id', 'id')
+            )
+            if statuses:
+                queryset = queryset.filter(status__in=statuses)
+
+            limit = settings.ORDER_EVENTS_CATCHUP_LIMIT
+            changes = [
+                StatusChange(order_id, status, changed_at, previous_status)
+                for order_id, status, changed_at, previous_status in queryset.values_list(
+                    'order_id', 'status', 'changed_at', 'previous_status')[:limit + 1]
+            ]
+            return changes[:limit], len(changes) <= limit
+        finally:
+            close_old_connections()
+
+    async def send_change(self, send, change):
+        data = json.dumps(change.as_dict(), separators=(',', ':'))
+        await self.send_body(send, f'id: {change.event_id}\nevent: {self.event_name}\ndata: {data}\n\n')
+
+    @staticmethod
+    async def send_body(send, text, more_body=True):
+        await send({
+            'type': 'http.response.body',
+            'body': text.encode('utf-8'),
+            'more_body': more_body,
+        })
+
+    @staticmethod
+    async def send_error(send, status, detail, headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), *headers],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': json.dumps(detail).encode('utf-8'),
+        })
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+
+order_events = OrderEventStream()
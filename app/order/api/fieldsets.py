@@ -0,0 +1,198 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+
+
+def split_param(values):
+    """Values of a query parameter given repeated, comma-separated or both
+    """
+    return [value.strip() for param in values for value in param.split(',') if value.strip()]
+
+
+def get_serializer_of(field):
+    """The serializer behind a nested field, if it's one
+    """
+    if isinstance(field, serializers.ListSerializer):
+        return field.child
+    if isinstance(field, serializers.BaseSerializer):
+        return field
+    return None
+
+
+class Fieldset:
+    """Fields of a representation asked for with `?fields=` and `?expand=`.
+
+        ?fields=id,status,customer.email,items&expand=items.pizza
+
+    Only the listed fields are returned, dotted names select fields of
+    nested objects. Relations are returned as primary keys unless they are
+    expanded, by `?expand=` or by asking for their fields.
+
+    Attributes:
+        fields (set): names asked for on this level, `None` for all of them
+        expand (dict): name -> `Fieldset` of the expanded relations
+    """
+
+    def __init__(self, fields=None):
+        self.fields = fields
+        self.expand = {}
+
+    @classmethod
+    def from_params(cls, fields, expand):
+        """
+        Args:
+            fields (list): dotted field names
+            expand (list): dotted relation names
+        """
+        root = cls(set())
+        for path in fields:
+            fieldset = root
+            *relations, name = path.split('.')
+            for relation in relations:
+                fieldset.fields.add(relation)
+                fieldset = fieldset.get_expanded(relation)
+                if fieldset.fields is None:
+                    fieldset.fields = set()
+            fieldset.fields.add(name)
+
+        for path in expand:
+            fieldset = root
+            for relation in path.split('.'):
+                if fieldset.fields is not None:
+                    fieldset.fields.add(relation)
+                fieldset = fieldset.get_expanded(relation)
+        return root
+
+    def get_expanded(self, name):
+        if name not in self.expand:
+            self.expand[name] = Fieldset()
+        return self.expand[name]
+
+    def apply(self, serializer, path=''):
+        """Trim the fields of `serializer` in place.
+
+        Raises:
+            ValidationError: for names `serializer` has no field for
+        """
+        fields = serializer.fields
+        errors = {}
+        unknown = [name for name in sorted(self.fields or ()) if name not in fields]
+        if unknown:
+            errors['fields'] = [
+                _('"{name}" is not a field.').format(name=f'{path}{name}')
+                for name in unknown
+            ]
+        flat = [
+            name for name in sorted(self.expand)
+            if name in fields and get_serializer_of(fields[name]) is None
+        ]
+        if flat:
+            errors['expand'] = [
+                _('"{name}" is not an expandable field.').format(name=f'{path}{name}')
+                for name in flat
+            ]
+        if errors:
+            raise ValidationError(errors)
+
+        for name, field in list(fields.items()):
+            if self.fields is not None and name not in self.fields:
+                del fields[name]
+                continue
+
+            nested = get_serializer_of(field)
+            if nested is None:
+                continue
+            if name in self.expand:
+                self.expand[name].apply(nested, f'{path}{name}.')
+            else:
+                fields[name] = PrimaryKeyRelatedField(
+                    read_only=True,
+                    many=isinstance(field, serializers.ListSerializer),
+                    **({'source': field.source} if field.source != name else {}),
+                )
+
+
+def get_relations(model):
+    """
+    Returns:
+        dict: accessor name -> reverse relation, such as `orderitem_set`
+    """
+    return {
+        relation.get_accessor_name(): relation
+        for relation in model._meta.related_objects
+    }
+
+
+def collect_lookups(serializer, model, prefix=''):
+    """What to load for `serializer` to output `model` instances.
+
+    Returns:
+        tuple: `only()` names or `None` when that can't be told,
+            `select_related()` names and `Prefetch`es
+    """
+    only = [f'{prefix}{model._meta.pk.name}']
+    select = []
+    prefetches = []
+    relations = get_relations(model)
+
+    for field in serializer._readable_fields:
+        if len(field.source_attrs) != 1:
+            only = None
+            continue
+        name = field.source_attrs[0]
+        nested = get_serializer_of(field)
+
+        if name in relations and relations[name].one_to_many:
+            relation = relations[name]
+            queryset = relation.related_model._default_manager.all()
+            if nested is not None:
+                queryset = trim_queryset(queryset, nested, [relation.field.name])
+            elif isinstance(field, ManyRelatedField):
+                queryset = queryset.only(relation.field.name)
+            prefetches.append(Prefetch(f'{prefix}{name}', queryset=queryset))
+            continue
+
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            only = None
+            continue
+        if not model_field.concrete:
+            only = None
+            continue
+
+        if model_field.is_relation and nested is not None:
+            select.append(f'{prefix}{name}')
+            nested_only, nested_select, nested_prefetches = collect_lookups(
+                nested, model_field.related_model, f'{prefix}{name}__')
+            select += nested_select
+            prefetches += nested_prefetches
+            if only is not None and nested_only is not None:
+                only += nested_only
+            else:
+                only = None
+        elif only is not None:
+            only.append(f'{prefix}{name}')
+
+    return only, select, prefetches
+
+
+def trim_queryset(queryset, serializer, loaded_fields=()):
+    """`queryset` joining, prefetching and loading only what `serializer`
+    outputs
+
+    Args:
+        loaded_fields (iterable): names loaded in any case
+    """
+    only, select, prefetches = collect_lookups(serializer, queryset.model)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    if only is not None:
+        queryset = queryset.only(*only, *loaded_fields)
+    return queryset
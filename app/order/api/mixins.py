@@ -1,3 +1,21 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAcceptable
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from app.db.routers import read_from, replicas
+from order.models import Order
+from .fieldsets import Fieldset, split_param, trim_queryset
+
 
 class MultiSerializerViewSetMixin:
     '''
@@ -14,6 +32,8 @@ class MultiSerializerViewSetMixin:
         Raises:
             AttributeError: if there's no any default serializer defined
         """
+        # keeps `@action` overrides such as `renderer_classes`
+        super().__init__(*args, **kwargs)
 
         if hasattr(self, "serializer_class"):
             if self.serializer_classes['default'] is None:
@@ -39,3 +59,348 @@ class MultiSerializerViewSetMixin:
             )
         except Exception as exc:
             return super().get_serializer_class()
+
+
+class QueryBudgetMixin:
+    '''
+        Declares the most queries each action may make, checked by
+        `app.timing.RequestTimingMiddleware`, and reports it the time spent
+        in `to_representation()`
+    '''
+    # action -> most queries
+    query_budgets = {}
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        timings = getattr(self.request, 'timings', None)
+        if timings is not None:
+            # `.data` calls it on the instance, nested serializers are covered
+            to_representation = serializer.to_representation
+
+            def timed_representation(instance):
+                with timings.measure('serialize'):
+                    return to_representation(instance)
+
+            serializer.to_representation = timed_representation
+        return serializer
+
+
+class CachedResponseMixin:
+    '''
+        Serves `list` and `retrieve` from `response_cache`, with ETag and
+        Cache-Control headers so clients and proxies can revalidate cheaply
+    '''
+    response_cache = None
+    cache_max_age = 60
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        """Answers from the cache or with 304 when possible, otherwise calls
+        the handler and caches its data
+
+        Args:
+            handler (callable): the uncached action
+            request (Request): current request
+
+        Returns:
+            Response: response of the action, possibly `304 Not Modified`
+        """
+        key = self.response_cache.make_key(
+            request, self.response_cache.get_version())
+        etag = self.response_cache.make_etag(key)
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data = self.response_cache.get(key)
+            if data is not None:
+                response = Response(data)
+            else:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                self.response_cache.set(key, response.data)
+
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=self.cache_max_age)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
+class ListResultCacheMixin:
+    '''
+        Serves `list` from `list_cache`, see `ListCache`, validators included.
+        Misses are read from the primary database, so an entry can't be older
+        than the invalidation its key follows
+    '''
+    list_cache = None
+    # filter whose value picks the generation counter
+    list_cache_status_param = 'status'
+    list_cache_headers = ('ETag', 'Last-Modified', 'Cache-Control')
+
+    def list(self, request, *args, **kwargs):
+        if self.list_cache is None or not self.list_cache.enabled:
+            return super().list(request, *args, **kwargs)
+
+        key = self.list_cache.make_key(
+            request, request.query_params.get(self.list_cache_status_param))
+        if key is None:
+            self.list_cache.count('bypasses')
+            return super().list(request, *args, **kwargs)
+
+        entry = self.list_cache.get(key)
+        if entry is None:
+            with read_from(None):
+                response = super().list(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                self.list_cache.set(key, (response.data, {
+                    name: response[name]
+                    for name in self.list_cache_headers if response.has_header(name)
+                }))
+            return response
+
+        data, headers = entry
+        response = get_conditional_response(
+            request,
+            etag=headers.get('ETag'),
+            last_modified=parse_http_date_safe(headers.get('Last-Modified')),
+        )
+        if response is None:
+            response = Response(data)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+
+class ConditionalGetMixin:
+    '''
+        Answers `list` and `retrieve` with `304 Not Modified` when the client's
+        `If-None-Match`/`If-Modified-Since` still match, judged from the
+        `last_modified_field` alone, before any related rows are loaded.
+        Lists are judged from the rows of the page and the pagination around
+        them, so they cost no more than the page itself. They have an ETag
+        and no `Last-Modified`, which rows leaving the filter wouldn't change
+    '''
+    last_modified_field = 'updated_at'
+    # ETags of single objects start with it, for `ConditionalWriteMixin`
+    version_field = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookups = queryset._prefetch_related_lookups
+        page = self.paginate_queryset(queryset.prefetch_related(None))
+        if page is None:
+            return super().list(request, *args, **kwargs)
+
+        fields = [self.last_modified_field, *filter(None, [self.version_field])]
+        rows = [[obj.pk, *(getattr(obj, field) for field in fields)] for obj in page]
+        # count and links, whatever the paginator answers with
+        pagination = self.paginator.get_paginated_response([]).data
+
+        def respond(request, *args, **kwargs):
+            prefetch_related_objects(page, *lookups)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        return self.conditional_response(
+            respond, None, [rows, pagination], request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        validators = self.get_validators_queryset().filter(**{
+            self.lookup_field: self.kwargs[lookup_url_kwarg],
+        }).values(self.last_modified_field, *filter(None, [self.version_field])).first()
+
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        return self.conditional_response(
+            super().retrieve, validators[self.last_modified_field], 1, request, *args,
+            version=validators.get(self.version_field), **kwargs
+        )
+
+    def get_validators_queryset(self):
+        return self.get_queryset().select_related(None).prefetch_related(None)
+
+    def get_etag_salt(self):
+        """Extra input of the ETag, for anything else the representation
+        depends on
+        """
+        return ''
+
+    def get_etag(self, request, last_modified, state, version=None):
+        """
+        Args:
+            state: anything else the representation is judged from, its
+                `repr()` goes into the ETag
+        """
+        value = '|'.join([
+            request.get_full_path(),
+            last_modified.isoformat() if last_modified else '',
+            repr(state),
+            self.get_etag_salt(),
+        ])
+        digest = hashlib.md5(value.encode('utf-8')).hexdigest()
+        return quote_etag(digest if version is None else f'{version}-{digest}')
+
+    def conditional_response(self, handler, last_modified, state, request, *args, version=None, **kwargs):
+        etag = self.get_etag(request, last_modified, state, version)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = _('The order changed since you read it, read it again.')
+    default_code = 'precondition_failed'
+
+
+# `"<version>"`, or `"<version>-<digest>"` as `ConditionalGetMixin` makes them
+VERSION_ETAG = re.compile(r'(?:W/)?"(\d+)(?:-\w*)?"')
+
+
+class ConditionalWriteMixin:
+    '''
+        Writes conditional on the version of the order: clients send the ETag
+        they read back in `If-Match`, and a write finding the order at
+        another version fails with `412 Precondition Failed` instead of
+        overwriting the change it didn't see. Without `If-Match`, or with
+        `*`, any version goes. Orders that can't be changed anymore are
+        refused with `406 Not Acceptable` either way
+    '''
+    # path from the written model to the order's status
+    order_status_lookup = 'status'
+    # URL kwargs holding primary keys, besides the lookup one. They go into
+    # raw SQL, so they're checked before any action runs
+    id_url_kwargs = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        for name in (self.lookup_url_kwarg or self.lookup_field, *self.id_url_kwargs):
+            if name in self.kwargs:
+                self.kwargs[name] = self.get_url_id(name)
+
+    def get_url_id(self, name):
+        """The primary key in URL kwarg `name`
+
+        Raises:
+            Http404: if it isn't one
+        """
+        try:
+            value = int(self.kwargs[name])
+        except (TypeError, ValueError):
+            raise Http404()
+        # out of `bigint` range Postgres fails the statement
+        if not 0 < value < 2 ** 63:
+            raise Http404()
+        return value
+
+    def get_if_match_versions(self):
+        """
+        Returns:
+            list: versions the order may be at, `None` for any
+        """
+        header = self.request.headers.get('If-Match')
+        if header is None:
+            return None
+        etags = parse_etags(header)
+        if etags == ['*']:
+            return None
+        versions = [
+            int(match.group(1))
+            for match in map(VERSION_ETAG.fullmatch, etags) if match is not None
+        ]
+        if not versions:
+            raise PreconditionFailed()
+        return versions
+
+    def write_refused(self, queryset, order_status_lookup=None):
+        """The error explaining why a conditional write of the only object in
+        `queryset` changed nothing, read after the fact
+        """
+        order_status = queryset.values_list(
+            order_status_lookup or self.order_status_lookup, flat=True).first()
+        if order_status is None:
+            return Http404()
+        if order_status in Order.UNEDITABLE_STATUES:
+            return NotAcceptable(
+                detail=_('You can not change orders with the status %s' % order_status)
+            )
+        return PreconditionFailed()
+
+
+class SparseFieldsetMixin:
+    '''
+        `?fields=` and `?expand=` on the read actions, see `Fieldset`. Besides
+        the output, the queryset is trimmed to the columns, joins and
+        prefetches the requested fields need
+    '''
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+    sparse_actions = ('list', 'retrieve')
+    # columns loaded even when they aren't output
+    sparse_loaded_fields = ()
+
+    def get_fieldset(self):
+        """
+        Returns:
+            Fieldset: `None` for the full representation
+        """
+        if self.action not in self.sparse_actions:
+            return None
+        fields = split_param(self.request.query_params.getlist(self.fields_query_param))
+        if not fields:
+            return None
+        expand = split_param(self.request.query_params.getlist(self.expand_query_param))
+        return Fieldset.from_params(fields, expand)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            fieldset.apply(getattr(serializer, 'child', serializer))
+        return serializer
+
+    def trim_queryset(self, queryset):
+        """`queryset` loading only what `get_serializer()` outputs
+        """
+        return trim_queryset(queryset, self.get_serializer(), self.sparse_loaded_fields)
+
+
+class ReplicaReadMixin:
+    '''
+        Reads safe requests from a read replica. A successful write sets a
+        cookie that keeps the client's reads on the primary for
+        `REPLICA_PIN_SECONDS`, so it sees its own writes
+    '''
+
+    def dispatch(self, request, *args, **kwargs):
+        alias = None
+        if request.method in SAFE_METHODS and settings.REPLICA_PIN_COOKIE not in request.COOKIES:
+            alias = replicas.choose()
+
+        with read_from(alias):
+            response = super().dispatch(request, *args, **kwargs)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,341 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_str
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """Row estimate of the planner, `None` if the backend has none
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over a unique, index-backed ordering.
+
+    Unlike `LimitOffsetPagination` every page is fetched with a
+    `WHERE (created_at, id) < (...)` condition, so deep pages cost the same
+    as the first one and no `COUNT(*)` is needed.
+
+    Cursors are opaque to clients, e.g.:
+        http://api.example.org/orders/?cursor=eyJwIjpbIjIwMjEtMDQt...
+    """
+    ordering = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    page_size_query_description = _('Number of results to return per page.')
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    cursor_query_description = _('The pagination cursor value.')
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        reverse, position = self.decode_cursor(request)
+        ordering = self.reverse_ordering() if reverse else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(ordering, position))
+
+        # One extra row tells us whether there is a page beyond this one
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def reverse_ordering(self):
+        return tuple(
+            field[1:] if field.startswith('-') else '-' + field
+            for field in self.ordering
+        )
+
+    def get_position_filter(self, ordering, position):
+        """Rows strictly after `position` in the given ordering.
+
+        For `('-created_at', '-id')` it expands to
+        `created_at < x OR (created_at = x AND id < y)`.
+        """
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[index]})
+            for previous_index, previous in enumerate(ordering[:index]):
+                step &= Q(**{previous.lstrip('-'): position[previous_index]})
+            condition |= step
+        return condition
+
+    def get_position(self, instance):
+        return [
+            getattr(instance, field.lstrip('-'))
+            for field in self.ordering
+        ]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            tokens = json.loads(urlsafe_b64decode(encoded + padding))
+            created_at, pk = tokens['p']
+            position = [parse_datetime(created_at), int(pk)]
+            if position[0] is None:
+                raise ValueError(created_at)
+            return bool(tokens.get('r')), position
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse=False):
+        created_at, pk = position
+        tokens = {'p': [created_at.isoformat(), pk]}
+        if reverse:
+            tokens['r'] = 1
+
+        encoded = urlsafe_b64encode(
+            json.dumps(tokens, separators=(',', ':')).encode('ascii')
+        ).decode('ascii').rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'previous': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(
+                    title='Cursor',
+                    description=force_str(self.cursor_query_description)
+                )
+            ),
+        ]
+
+
+class EstimatedCountPagination(LimitOffsetPagination):
+    """Limit/offset pagination that avoids exact `COUNT(*)` on large lists.
+
+    The row count is first estimated by the Postgres planner, and the
+    estimate is cached for `PAGINATION_COUNT_CACHE_TIMEOUT` seconds keyed by
+    the filtered query. Estimates below `PAGINATION_EXACT_COUNT_THRESHOLD`
+    are replaced by an exact count. `count_is_exact` tells clients which
+    one they got.
+    """
+    count_cache_prefix = 'pagination:count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.request = request
+        self.count = self.get_count(queryset)
+        if self.count_is_exact and (self.count == 0 or self.offset > self.count):
+            return []
+
+        page = list(queryset[self.offset:self.offset + self.limit])
+        if not self.count_is_exact:
+            if page and len(page) < self.limit:
+                # Reached the last page, so we know the real count now
+                self.count, self.count_is_exact = self.offset + len(page), True
+            elif not page:
+                # past the end, there are at most `offset` rows
+                self.count = min(self.count, self.offset)
+            else:
+                self.count = max(self.count, self.offset + len(page))
+
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        return page
+
+    def get_count(self, queryset):
+        self.count_is_exact = True
+        threshold = settings.PAGINATION_EXACT_COUNT_THRESHOLD
+        if threshold is None:
+            return super().get_count(queryset)
+
+        cache = caches[settings.PAGINATION_COUNT_CACHE]
+        cache_key = self.get_count_cache_key(queryset)
+        estimate = cache.get(cache_key)
+        if estimate is None:
+            estimate = self.estimate_count(queryset)
+            if estimate is not None:
+                cache.set(cache_key, estimate,
+                          settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+
+        if estimate is None or estimate < threshold:
+            return super().get_count(queryset)
+
+        self.count_is_exact = False
+        return estimate
+
+    def get_count_cache_key(self, queryset):
+        query = str(queryset.query).encode('utf-8')
+        return '{}:{}:{}'.format(
+            self.count_cache_prefix,
+            queryset.model._meta.label_lower,
+            hashlib.md5(query).hexdigest(),
+        )
+
+    def estimate_count(self, queryset):
+        return estimate_count(queryset)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_is_exact', self.count_is_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_exact'] = {
+            'type': 'boolean',
+            'example': True,
+        }
+        return response_schema
+
+
+class OrderPagination(EstimatedCountPagination):
+    """Limit/offset pagination that switches to keyset pagination on demand.
+
+    Existing clients keep getting `count`/`next`/`previous` offset pages.
+    Keyset pages are used when the request carries a `cursor`, asks for
+    `?pagination=cursor`, or the view sets `pagination_mode = 'cursor'`.
+    """
+    cursor_pagination_class = KeysetPagination
+    mode_query_param = 'pagination'
+    mode_query_description = _('Pagination style, either "offset" or "cursor".')
+    default_mode = 'offset'
+    modes = ('offset', 'cursor')
+
+    def get_mode(self, request, view=None):
+        cursor_param = self.cursor_pagination_class.cursor_query_param
+        if request.query_params.get(cursor_param):
+            return 'cursor'
+
+        mode = request.query_params.get(self.mode_query_param)
+        if mode in self.modes:
+            return mode
+
+        return getattr(view, 'pagination_mode', self.default_mode)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.get_mode(request, view) == 'cursor':
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_fields(self, view):
+        fields = super().get_schema_fields(view)
+        fields += self.cursor_pagination_class().get_schema_fields(view)
+        fields.append(
+            coreapi.Field(
+                name=self.mode_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Enum(
+                    self.modes,
+                    title='Pagination',
+                    description=force_str(self.mode_query_description)
+                )
+            )
+        )
+        return fields
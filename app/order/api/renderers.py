@@ -0,0 +1,143 @@
+import csv
+import io
+import json
+
+import orjson
+from rest_framework import renderers, serializers
+from rest_framework.utils import encoders
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """`JSONRenderer` producing the same bytes with orjson.
+
+    Types orjson would write differently from DRF's encoder, datetimes and
+    dataclasses, still go through `encoder_class.default()`. Indented,
+    non-compact or ASCII-only output, and data orjson rejects (such as
+    integers over 64 bits), fall back to `JSONRenderer`. Unlike it, NaN and
+    infinite floats are written as `null` rather than rejected.
+    """
+    options = (
+        orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # same as `JSONRenderer`, for embedding in JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class StreamRenderer(renderers.BaseRenderer):
+    """Renderer that can also turn an iterable of records into a byte stream
+    for `StreamingHttpResponse`, one record at a time.
+
+    `render()` is still used for regular responses such as errors.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        records = data if isinstance(data, list) else [data]
+        return b''.join(self.render_stream(records))
+
+    def render_stream(self, records, serializer=None):
+        """
+        Args:
+            records (iterable): serialized records
+            serializer (Serializer, optional): serializer that produced them
+        """
+        raise NotImplementedError('Stream renderer class requires .render_stream() to be implemented')
+
+
+class NDJSONRenderer(StreamRenderer):
+    """Newline delimited JSON, one record per line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+    encoder_class = encoders.JSONEncoder
+
+    def render_stream(self, records, serializer=None):
+        encoder = self.encoder_class(ensure_ascii=False, separators=(',', ':'))
+        for record in records:
+            yield (encoder.encode(record) + '\n').encode('utf-8')
+
+
+class CSVRenderer(StreamRenderer):
+    """Flat CSV of the records.
+
+    Nested objects become dotted columns (`customer.email`) and a list of
+    objects (`items`) is exploded into one row per element, repeating the
+    parent's columns. The header comes from the serializer's fields when it
+    is given, otherwise from the first record.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render_stream(self, records, serializer=None):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        header = self.get_columns(serializer) if serializer is not None else None
+        if header is not None:
+            writer.writerow(header)
+
+        for record in records:
+            rows = self.flatten(record)
+            if header is None:
+                header = list(rows[0].keys())
+                writer.writerow(header)
+            for row in rows:
+                writer.writerow([self.format_value(row.get(column)) for column in header])
+
+            yield buffer.getvalue().encode(self.charset)
+            buffer.seek(0)
+            buffer.truncate()
+
+    def get_columns(self, serializer, prefix=''):
+        columns = []
+        for name, field in serializer.fields.items():
+            if isinstance(field, serializers.ListSerializer):
+                field = field.child
+            if isinstance(field, serializers.BaseSerializer):
+                columns += self.get_columns(field, f'{prefix}{name}.')
+            else:
+                columns.append(f'{prefix}{name}')
+        return columns
+
+    def flatten(self, record, prefix=''):
+        row = {}
+        exploded = [{}]
+        for key, value in record.items():
+            column = f'{prefix}{key}'
+            if isinstance(value, dict):
+                nested = self.flatten(value, f'{column}.')
+                row.update(nested[0])
+            elif isinstance(value, list) and all(isinstance(v, dict) for v in value):
+                exploded = [
+                    row for element in value
+                    for row in self.flatten(element, f'{column}.')
+                ] or [{}]
+            else:
+                row[column] = value
+
+        return [{**row, **element} for element in exploded]
+
+    @staticmethod
+    def format_value(value):
+        if value is None:
+            return ''
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, cls=encoders.JSONEncoder)
+        return value
@@ -1,11 +1,18 @@
-from itertools import groupby
+from collections import defaultdict
+from datetime import timedelta
 
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
+from order.api.compiled import CompiledSerializerMixin
+from order.events import order_status_changed
 from order.models import Order, Customer, OrderItem, Pizza
 
 
-class PizzaSerializer(serializers.ModelSerializer):
+class PizzaSerializer(CompiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Pizza
         fields = [
@@ -28,6 +35,13 @@ class OrderItemSerializerBase(serializers.ModelSerializer):
         ]
 
 
+class OrderItemCreateSerializer(OrderItemSerializerBase):
+    """Accepts pizza ids as they are, `OrderSerializerBase` checks all of
+    them with a single query instead of one lookup per item
+    """
+    pizza = serializers.IntegerField(source='pizza_id', min_value=1)
+
+
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
@@ -35,42 +49,138 @@ class CustomerSerializer(serializers.ModelSerializer):
             "full_name",
             "email",
         ]
+        extra_kwargs = {
+            # returning customers are matched by email, see `Customer.objects.upsert`
+            'email': {'validators': []},
+        }
+
+
+class OrderListSerializer(serializers.ListSerializer):
+    """Creates many orders with set-based inserts
+    """
+
+    def validate_each(self, data):
+        """Validate every order on its own, unlike `is_valid` which rejects
+        the whole list when one order is invalid. The child's fields are
+        built once and shared by all orders.
+
+        Returns:
+            list: `(validated_data, errors)` pairs, one of them `None`
+        """
+        results = []
+        for item in data:
+            try:
+                results.append((self.child.run_validation(item), None))
+            except serializers.ValidationError as exc:
+                results.append((None, exc.detail))
+        return results
+
+    @transaction.atomic
+    def create(self, validated_data):
+        customers = Customer.objects.bulk_upsert(
+            [data['customer'] for data in validated_data]
+        )
+
+        orders = Order.objects.bulk_create([
+            Order(
+                **{
+                    field: value for field, value in data.items()
+                    if field not in ('customer', 'orderitem_set')
+                },
+                customer=customers[Customer.normalize_email(data['customer']['email'])],
+                status=Order.DeliveryStatuses.NEW,
+            )
+            for data in validated_data
+        ])
+
+        OrderItem.objects.bulk_create([
+            item
+            for order, data in zip(orders, validated_data)
+            for item in self.child.build_order_items(data['orderitem_set'], order)
+        ])
+
+        # `bulk_create()` sends no `post_save`
+        order_status_changed.send(
+            sender=Order,
+            changes=[order.status_change for order in orders],
+            using=Order.objects.db,
+        )
+        return orders
+
+
+def check_pizzas(items, existing_ids, message):
+    """Fail validation for the items whose pizza isn't in `existing_ids`
+
+    Returns:
+        list: `items`
+    """
+    if {item['pizza_id'] for item in items} <= existing_ids:
+        return items
+
+    raise serializers.ValidationError([
+        {} if item['pizza_id'] in existing_ids else {
+            'pizza': [message.format(pk_value=item['pizza_id'])],
+        }
+        for item in items
+    ])
 
 
 class OrderSerializerBase(serializers.ModelSerializer):
     customer = CustomerSerializer()
-    items = OrderItemSerializerBase(many=True, source='orderitem_set')
+    items = OrderItemCreateSerializer(many=True, source='orderitem_set')
+
+    default_error_messages = {
+        'does_not_exist': _('Invalid pk "{pk_value}" - object does not exist.'),
+    }
 
     class Meta:
         model = Order
         fields = '__all__'
+        list_serializer_class = OrderListSerializer
         extra_kwargs = {
             'created_at': {'read_only': True},
             'updated_at': {'read_only': True},
             'status': {'read_only': True},
         }
 
+    @staticmethod
+    def get_existing_pizza_ids(pizza_ids):
+        return set(
+            Pizza.objects.filter(pk__in=pizza_ids).values_list('pk', flat=True)
+        )
+
+    def validate_items(self, items):
+        """Make sure every ordered pizza exists, using one query.
+
+        Callers validating many orders can look the ids up once for all
+        of them and pass the result as `existing_pizza_ids` in the context.
+        """
+        existing_ids = self.context.get('existing_pizza_ids')
+        if existing_ids is None:
+            existing_ids = self.get_existing_pizza_ids({item['pizza_id'] for item in items})
+        return check_pizzas(items, existing_ids, self.error_messages['does_not_exist'])
+
     def create_customer(self, validated_data):
-        customer_serializer = CustomerSerializer(data=validated_data)
-        customer_serializer.is_valid(raise_exception=True)
-        customer = customer_serializer.save()
-        return customer
+        return Customer.objects.upsert(**validated_data)
 
-    def create_order_items(self, validated_data, order_instance):
-        """Group items by size to calculate the quantity
+    def build_order_items(self, validated_data, order_instance):
+        """Sum up the quantity of items with the same pizza and size
         """
-        for size, items in groupby(validated_data, key=lambda x: x['size']):
-            for pizza, order_items in groupby(items, key=lambda x: x['pizza']):
-                grouped_item = list(order_items)
-                qty = sum(i['count'] for i in grouped_item)
-                item_serializer = OrderItemSerializerBase(data={
-                    "pizza": pizza.pk,
-                    "count": qty,
-                    "size": size,
-                })
-                item_serializer.is_valid(raise_exception=True)
-                item_serializer.save(order_id=order_instance.pk)
+        quantities = defaultdict(int)
+        for item in validated_data:
+            quantities[(item['pizza_id'], item['size'])] += item['count']
+
+        return [
+            OrderItem(order=order_instance, pizza_id=pizza_id, size=size, count=count)
+            for (pizza_id, size), count in quantities.items()
+        ]
+
+    def create_order_items(self, validated_data, order_instance):
+        return OrderItem.objects.bulk_create(
+            self.build_order_items(validated_data, order_instance)
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
         customer = validated_data.pop('customer')
         items = validated_data.pop('orderitem_set')
@@ -82,42 +192,87 @@ class OrderSerializerBase(serializers.ModelSerializer):
         return order_instance
 
 
-class OrderItemReadSerializer(OrderItemSerializerBase):
+class OrderStatusBulkUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.ORDER_BULK_STATUS_MAX_SIZE,
+    )
+    status = serializers.ChoiceField(choices=Order.DeliveryStatuses.choices)
+
+
+class OrderItemBulkListSerializer(serializers.ListSerializer):
+    """Checks the pizzas of all items with a single query
+    """
+    default_error_messages = {
+        'does_not_exist': OrderSerializerBase.default_error_messages['does_not_exist'],
+    }
+
+    def to_internal_value(self, data):
+        # errors per item, like those of the fields
+        items = super().to_internal_value(data)
+        existing_ids = OrderSerializerBase.get_existing_pizza_ids({item['pizza_id'] for item in items})
+        return check_pizzas(items, existing_ids, self.error_messages['does_not_exist'])
+
+
+class OrderItemBulkSerializer(OrderItemCreateSerializer):
+    """Items of the whole item list of an order, matched to the existing
+    ones by pizza and size, see `OrderItemViewSet.bulk_update`. A count of
+    0 stands for no such item
+    """
+    count = serializers.IntegerField(min_value=0)
+
+    class Meta(OrderItemCreateSerializer.Meta):
+        fields = [
+            "pizza",
+            "size",
+            "count",
+        ]
+        list_serializer_class = OrderItemBulkListSerializer
+
+
+class OrderClaimSerializer(serializers.Serializer):
+    station = serializers.CharField(max_length=64)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=settings.ORDER_CLAIM_MAX_SIZE, default=1)
+
+
+class OrderClaimRenewSerializer(serializers.Serializer):
+    station = serializers.CharField(max_length=64)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.ORDER_BULK_STATUS_MAX_SIZE,
+    )
+
+
+class StatusDurationsQuerySerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        until = data.get('until') or timezone.now()
+        since = data.get('since') or until - timedelta(seconds=settings.ORDER_STATUS_DURATIONS_WINDOW)
+        if since >= until:
+            raise serializers.ValidationError(_('`since` must be before `until`.'))
+        return {'since': since, 'until': until}
+
+
+class OrderItemReadSerializer(CompiledSerializerMixin, OrderItemSerializerBase):
     pizza = PizzaSerializer(read_only=True)
 
 
-class OrderReadSerializer(OrderSerializerBase):
+class OrderReadSerializer(CompiledSerializerMixin, OrderSerializerBase):
     items = OrderItemReadSerializer(many=True, source='orderitem_set')
 
 
 class OrderUpdateSerializer(OrderSerializerBase):
+    # `extra_kwargs` don't apply to declared fields
+    customer = CustomerSerializer(read_only=True)
+    items = OrderItemCreateSerializer(many=True, source='orderitem_set', read_only=True)
 
     class Meta(OrderSerializerBase.Meta):
         extra_kwargs = {
             'created_at': {'read_only': True},
             'updated_at': {'read_only': True},
-            'customer': {'read_only': True},
-            'items': {'read_only': True},
         }
-
-    def update_customer(self, instance, validated_data):
-        """
-        In documentation didn't specify to update the order's customer info, 
-        so this function sits here in case of a feature request
-        """
-        serializer = CustomerSerializer(instance=instance, data=validated_data)
-        serializer.is_valid(raise_exception=True)
-        return serializer.save()
-
-    def update(self, instance, validated_data, **kwargs):
-        if validated_data.get('customer'):
-            validated_data.pop('customer')
-            # self.update_customer(
-            #     instance=instance.customer,
-            #     validated_data=validated_data.pop('customer'),
-            # )
-
-        if validated_data.get('orderitem_set'):
-            validated_data.pop('orderitem_set')
-
-        return super().update(instance, validated_data)
@@ -18,7 +18,21 @@ from rest_framework_extensions.routers import ExtendedSimpleRouter
 from .viewsets import OrderViewSet, PizzaViewSet, OrderItemViewSet
 
 
-router = ExtendedSimpleRouter()
+class BulkRouter(ExtendedSimpleRouter):
+    """Also routes `PUT` and `PATCH` of list URLs, to the `bulk_update` and
+    `partial_bulk_update` methods of the viewsets that have them
+    """
+    routes = [
+        route._replace(mapping={
+            **route.mapping,
+            'put': 'bulk_update',
+            'patch': 'partial_bulk_update',
+        }) if route.name == '{basename}-list' else route
+        for route in ExtendedSimpleRouter.routes
+    ]
+
+
+router = BulkRouter()
 (
     router.register(r'orders', OrderViewSet, basename='order')
     .register(r'items',
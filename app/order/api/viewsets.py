@@ -1,24 +1,53 @@
+from collections import defaultdict
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.utils.translation import gettext_lazy as _
 from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
 
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
-from rest_framework.exceptions import NotAcceptable
-from rest_framework import filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework import status as http_status
 from rest_framework_extensions.mixins import NestedViewSetMixin
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 
 
-from order.models import Order, Pizza, OrderItem
+from order.models import Order, OrderStatusEvent, Pizza, OrderItem
 from .serializers import (
     OrderSerializerBase,
     OrderReadSerializer,
     OrderUpdateSerializer,
+    OrderStatusBulkUpdateSerializer,
+    OrderClaimSerializer,
+    OrderClaimRenewSerializer,
+    StatusDurationsQuerySerializer,
     PizzaSerializer,
     OrderItemSerializerBase,
+    OrderItemBulkSerializer,
     OrderItemReadSerializer,
 )
-from .mixins import MultiSerializerViewSetMixin
+from .cache import order_list_cache, pizza_cache
+from .filters import CustomerSearchFilter
+from .mixins import (
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    ConditionalWriteMixin,
+    ListResultCacheMixin,
+    MultiSerializerViewSetMixin,
+    QueryBudgetMixin,
+    ReplicaReadMixin,
+    SparseFieldsetMixin,
+)
+from .pagination import OrderPagination
+from .renderers import CSVRenderer, NDJSONRenderer
 
 
 @method_decorator(name='list', decorator=swagger_auto_schema(
@@ -31,12 +60,23 @@ from .mixins import MultiSerializerViewSetMixin
         ),
         openapi.Parameter(
             'search', openapi.IN_QUERY,
-            description=_("Search for given customer's orders"),
+            description=_("Search for given customer's orders by words starting their name or email, best matches first"),
             type=openapi.TYPE_STRING
-        )
+        ),
+        openapi.Parameter(
+            'fields', openapi.IN_QUERY,
+            description=_("Comma separated fields to return, e.g. `id,status,customer.email`"),
+            type=openapi.TYPE_STRING
+        ),
+        openapi.Parameter(
+            'expand', openapi.IN_QUERY,
+            description=_("Relations to return as objects instead of ids when `fields` is given, e.g. `items.pizza`"),
+            type=openapi.TYPE_STRING
+        ),
     ]
 ))
-class OrderViewSet(MultiSerializerViewSetMixin, NestedViewSetMixin, ModelViewSet):
+class OrderViewSet(QueryBudgetMixin, ReplicaReadMixin, ListResultCacheMixin, ConditionalGetMixin, ConditionalWriteMixin,
+                   SparseFieldsetMixin, MultiSerializerViewSetMixin, NestedViewSetMixin, ModelViewSet):
     model = Order
     queryset = Order.objects.all()
     serializer_classes = {
@@ -45,9 +85,36 @@ class OrderViewSet(MultiSerializerViewSetMixin, NestedViewSetMixin, ModelViewSet
         "retrieve": OrderReadSerializer,
         "update": OrderUpdateSerializer,
         "partial_update": OrderUpdateSerializer,
+        "bulk_status": OrderStatusBulkUpdateSerializer,
+        "claim": OrderReadSerializer,
     }
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['customer__full_name', 'customer__email']
+    filter_backends = [CustomerSearchFilter]
+    pagination_class = OrderPagination
+    pagination_mode = 'offset'
+    list_cache = order_list_cache
+    version_field = 'version'
+    query_budgets = {
+        # count estimate and count, page, items; a search adds a rank
+        # estimate and a count estimate
+        'list': 6,
+        'retrieve': 3,
+        'create': 7,
+        # conditional UPDATE, order with customer, items
+        'update': 3,
+        'partial_update': 3,
+        'destroy': 3,
+        'bulk_create': 6,
+        'bulk_status': 1,
+        # claiming UPDATE, claimed orders, items
+        'claim': 3,
+        'renew_claims': 1,
+        'cache_stats': 2,
+        'status_durations': 3,
+    }
+    read_actions = ('list', 'retrieve')
+    # keyset pages are positioned by it, list ETags are made of the others
+    sparse_loaded_fields = ('created_at', 'updated_at', 'version')
+    export_chunk_size = 2000
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -56,52 +123,369 @@ class OrderViewSet(MultiSerializerViewSetMixin, NestedViewSetMixin, ModelViewSet
         if status:
             queryset = queryset.filter(status=status)
 
+        if self.action in self.read_actions:
+            if self.get_fieldset() is None:
+                queryset = queryset.with_details()
+            else:
+                queryset = self.trim_queryset(queryset)
+
         return queryset
 
+    def get_etag_salt(self):
+        # orders embed pizza names
+        return pizza_cache.get_version()
+
     def update(self, request, *args, **kwargs):
-        instance = self.get_object()
+        """Change the order, in one statement conditional on `If-Match`
+        """
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_serializer(data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        version = Order.objects.update_editable(
+            pk, serializer.validated_data, self.get_if_match_versions())
+        if version is None:
+            raise self.write_refused(Order.objects.filter(pk=pk))
+
+        instance = Order.objects.with_details().get(pk=pk)
+        response = Response(self.get_serializer(instance).data)
+        response['ETag'] = self.get_etag(request, instance.updated_at, 1, instance.version)
+        return response
 
-        if instance.status in Order.UNEDITABLE_STATUES:
-            raise NotAcceptable(
-                detail=_('You can not change orders with the status %s' %
-                         instance.status)
+    @swagger_auto_schema(
+        request_body=OrderSerializerBase(many=True),
+        responses={
+            201: openapi.Response(_('All orders created')),
+            207: openapi.Response(_('Some orders created, see `results` for each order')),
+            400: openapi.Response(_('No orders created')),
+        },
+    )
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        """Create many orders at once.
+
+        Every order is validated on its own and reported in `results` in the
+        same position it was sent in. Valid orders are inserted together in
+        one transaction even when others fail.
+        """
+        payload = request.data
+        if not isinstance(payload, list) or not payload:
+            raise ValidationError(_('Expected a non-empty list of orders.'))
+        if len(payload) > settings.ORDER_BULK_CREATE_MAX_SIZE:
+            raise ValidationError(
+                _('Send at most %d orders at once.' % settings.ORDER_BULK_CREATE_MAX_SIZE)
             )
 
-        return super().update(request, *args, **kwargs)
+        context = self.get_serializer_context()
+        context['existing_pizza_ids'] = OrderSerializerBase.get_existing_pizza_ids(
+            self.get_ordered_pizza_ids(payload)
+        )
+        serializer = OrderSerializerBase(many=True, context=context)
+        validated = serializer.validate_each(payload)
+        valid = [data for data, errors in validated if errors is None]
+
+        orders = iter(serializer.create(valid) if valid else [])
+        results = [
+            {'status': http_status.HTTP_201_CREATED, 'id': next(orders).pk}
+            if errors is None else
+            {'status': http_status.HTTP_400_BAD_REQUEST, 'errors': errors}
+            for data, errors in validated
+        ]
+
+        if len(valid) == len(validated):
+            response_status = http_status.HTTP_201_CREATED
+        elif valid:
+            response_status = http_status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = http_status.HTTP_400_BAD_REQUEST
+
+        return Response({
+            'created': len(valid),
+            'failed': len(validated) - len(valid),
+            'results': results,
+        }, status=response_status)
+
+    @swagger_auto_schema(responses={200: openapi.Response(_('Ids of changed and refused orders'))})
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request, *args, **kwargs):
+        """Move many orders to the same status with a single UPDATE.
+
+        Orders that can't be changed anymore, or don't exist, are reported
+        as `refused`.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        status = serializer.validated_data['status']
+
+        changed = set(Order.objects.set_status(ids, status))
+
+        return Response({
+            'status': status,
+            'changed': [pk for pk in ids if pk in changed],
+            'refused': [pk for pk in ids if pk not in changed],
+        })
+
+    @swagger_auto_schema(request_body=OrderClaimSerializer, responses={200: OrderReadSerializer(many=True)})
+    @action(detail=False, methods=['post'])
+    def claim(self, request, *args, **kwargs):
+        """Take the oldest `limit` new orders for a kitchen station.
+
+        The orders are moved to ACCEPTED and returned, oldest first. Each
+        order goes to one station only, however many claim at the same
+        time; an empty list means there is nothing to do. Orders still
+        ACCEPTED `ORDER_CLAIM_LEASE` seconds after being claimed, or renewed
+        last, are handed out again.
+        """
+        serializer = OrderClaimSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        ids = Order.objects.claim(**serializer.validated_data)
+        orders = Order.objects.filter(pk__in=ids).order_by('created_at', 'id').with_details()
+        return Response(self.get_serializer(orders, many=True).data)
+
+    @swagger_auto_schema(
+        request_body=OrderClaimRenewSerializer,
+        responses={200: openapi.Response(_('Ids of renewed and lost orders'))},
+    )
+    @action(detail=False, methods=['post'], url_path='claim/renew')
+    def renew_claims(self, request, *args, **kwargs):
+        """Keep the orders a kitchen station is still working on.
+
+        Stations renew the orders they hold more often than every
+        `ORDER_CLAIM_LEASE` seconds, so dishes taking longer aren't handed
+        to another station. `lost` are those the station doesn't hold
+        anymore: claimed by another station once the lease ran out, or moved
+        on from ACCEPTED.
+        """
+        serializer = OrderClaimRenewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+
+        renewed = set(Order.objects.renew_claims(serializer.validated_data['station'], ids))
 
+        return Response({
+            'renewed': [pk for pk in ids if pk in renewed],
+            'lost': [pk for pk in ids if pk not in renewed],
+        })
 
-class OrderItemViewSet(MultiSerializerViewSetMixin, NestedViewSetMixin, ModelViewSet):
+    @swagger_auto_schema(auto_schema=None)
+    @action(detail=False, methods=['get'], url_path='cache', permission_classes=[IsAdminUser])
+    def cache_stats(self, request, *args, **kwargs):
+        """Hit and miss counts of the order list cache in the serving process
+        """
+        return Response({'pid': os.getpid(), **self.list_cache.stats()})
+
+    @swagger_auto_schema(
+        query_serializer=StatusDurationsQuerySerializer,
+        responses={200: openapi.Response(_('Count and p50/p95/p99 seconds by status'))},
+    )
+    @action(detail=False, methods=['get'], url_path='status-durations', permission_classes=[IsAdminUser])
+    def status_durations(self, request, *args, **kwargs):
+        """How long orders stay in each status, for capacity planning.
+
+        Covers the stays that began between `since` and `until`, the last
+        7 days by default, and are over; durations are in seconds.
+        """
+        serializer = StatusDurationsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        window = serializer.validated_data
+
+        return Response({
+            'since': window['since'],
+            'until': window['until'],
+            'statuses': OrderStatusEvent.objects.durations(**window),
+        })
+
+    @swagger_auto_schema(responses={
+        200: openapi.Response(_('Matching orders, one per line in NDJSON or one per item in CSV')),
+    })
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        """Stream every order matching the `status` and `search` filters.
+
+        Choose the format with `?format=ndjson` (default) or `?format=csv`.
+        Rows are read through a server-side cursor and items are fetched per
+        chunk, so memory use doesn't depend on the number of orders.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).select_related('customer')
+        # rows are read after `dispatch()` returned, on the database chosen now
+        queryset = queryset.using(queryset.db)
+        serializer = OrderReadSerializer(context=self.get_serializer_context())
+        renderer = request.accepted_renderer
+
+        response = StreamingHttpResponse(
+            renderer.render_stream(self.iter_export(queryset, serializer), serializer),
+            content_type=renderer.media_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="orders.{renderer.format}"'
+        return response
+
+    def iter_export(self, queryset, serializer):
+        # Without a transaction the server-side cursor is declared WITH HOLD,
+        # which makes Postgres materialize the whole result up front
+        with transaction.atomic(using=queryset.db):
+            chunk = []
+            for order in queryset.iterator(chunk_size=self.export_chunk_size):
+                chunk.append(order)
+                if len(chunk) == self.export_chunk_size:
+                    yield from self.serialize_export_chunk(chunk, serializer)
+                    chunk = []
+            yield from self.serialize_export_chunk(chunk, serializer)
+
+    def serialize_export_chunk(self, chunk, serializer):
+        prefetch_related_objects(chunk, Order.objects.items_prefetch())
+        for order in chunk:
+            yield serializer.to_representation(order)
+
+    @staticmethod
+    def get_ordered_pizza_ids(payload):
+        """Pizza ids of all items in a raw bulk payload, invalid ones skipped
+        """
+        pizza_ids = set()
+        for order in payload:
+            items = order.get('items') if isinstance(order, dict) else None
+            for item in items if isinstance(items, list) else []:
+                try:
+                    pizza_ids.add(int(item.get('pizza')))
+                except (AttributeError, TypeError, ValueError):
+                    continue
+        return pizza_ids
+
+
+class OrderItemViewSet(QueryBudgetMixin, ReplicaReadMixin, ConditionalWriteMixin, SparseFieldsetMixin,
+                       MultiSerializerViewSetMixin, NestedViewSetMixin, ModelViewSet):
     model = OrderItem
-    queryset = OrderItem.objects.all()
+    queryset = OrderItem.objects.select_related('pizza')
     serializer_classes = {
         "default": OrderItemSerializerBase,
         "list": OrderItemReadSerializer,
         "retrieve": OrderItemReadSerializer,
     }
+    query_budgets = {
+        'list': 3,
+        'retrieve': 1,
+        'create': 4,
+        # pizza, conditional UPDATE of the item and the order, and on
+        # refusal the order's status
+        'update': 3,
+        'partial_update': 3,
+        'destroy': 2,
+        # pizzas, order, items, one INSERT, UPDATE and DELETE each, and the
+        # savepoint pair inside an outer transaction
+        'bulk_update': 8,
+        'partial_bulk_update': 8,
+    }
+    order_status_lookup = 'order__status'
+    id_url_kwargs = ('order_id',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.get_fieldset() is not None:
+            queryset = self.trim_queryset(queryset)
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(order_id=self.kwargs['order_id'])
+        self.touch_order()
+
+    def touch_order(self):
+        """Item changes are order changes for ETag/Last-Modified purposes,
+        and for the cached order lists
+        """
+        orders = Order.objects.filter(pk=self.kwargs['order_id'])
+        orders.touch()
+        statuses = list(orders.values_list('status', flat=True))
+        transaction.on_commit(lambda: order_list_cache.invalidate(statuses))
 
     def update(self, request, *args, **kwargs):
-        instance = self.get_object()
+        """Change the item and touch its order, in one statement conditional
+        on the order's `If-Match`. The ETag returned is the order's new one
+        """
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_serializer(data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
 
-        if instance.order.status in Order.UNEDITABLE_STATUES:
-            raise NotAcceptable(
-                detail=_('You can not change orders with the status %s' %
-                         instance.order.status)
-            )
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        written = OrderItem.objects.update_editable(
+            self.kwargs['order_id'], pk, serializer.validated_data, self.get_if_match_versions())
+        if written is None:
+            raise self.write_refused(self.get_queryset().filter(pk=pk))
+
+        instance, order_status, version = written
+        transaction.on_commit(lambda: order_list_cache.invalidate([order_status]))
+        response = Response(self.get_serializer(instance).data)
+        response['ETag'] = quote_etag(str(version))
+        return response
+
+    @swagger_auto_schema(
+        request_body=OrderItemBulkSerializer(many=True),
+        responses={200: OrderItemSerializerBase(many=True)},
+    )
+    def bulk_update(self, request, *args, **kwargs):
+        """Replace all items of the order with the ones sent.
 
-        return super().update(request, *args, **kwargs)
+        Items are matched to the existing ones by pizza and size, and only
+        the differences are written, in one transaction. Answers with the
+        items of the order, and the order's new ETag.
+        """
+        return self.apply_items(request, replace=True)
+
+    @swagger_auto_schema(
+        request_body=OrderItemBulkSerializer(many=True),
+        responses={200: OrderItemSerializerBase(many=True)},
+    )
+    def partial_bulk_update(self, request, *args, **kwargs):
+        """Change the items of the order sent, keeping the others.
+
+        Items are matched by pizza and size, a count of 0 removes one.
+        Answers like `PUT`.
+        """
+        return self.apply_items(request, replace=False)
+
+    def apply_items(self, request, replace):
+        serializer = OrderItemBulkSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        quantities = defaultdict(int)
+        for item in serializer.validated_data:
+            quantities[(item['pizza_id'], item['size'])] += item['count']
+
+        order_id = self.kwargs['order_id']
+        with transaction.atomic():
+            # the order stays locked, so no other item change interleaves
+            touched = Order.objects.touch_editable(order_id, self.get_if_match_versions())
+            if touched is None:
+                raise self.write_refused(Order.objects.filter(pk=order_id), 'status')
+            items = OrderItem.objects.apply(order_id, quantities, replace)
+
+        order_status, version = touched
+        transaction.on_commit(lambda: order_list_cache.invalidate([order_status]))
+        response = Response(OrderItemSerializerBase(items, many=True).data)
+        response['ETag'] = quote_etag(str(version))
+        return response
 
     def destroy(self, request, *args, **kwargs):
-        instance = self.get_object()
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        written = OrderItem.objects.delete_editable(
+            self.kwargs['order_id'], pk, self.get_if_match_versions())
+        if written is None:
+            raise self.write_refused(self.get_queryset().filter(pk=pk))
 
-        if instance.order.status in Order.UNEDITABLE_STATUES:
-            raise NotAcceptable(
-                detail=_('You can not change orders with the status %s' %
-                         instance.order.status)
-            )
-        return super().destroy(request, *args, **kwargs)
+        order_status, version = written
+        transaction.on_commit(lambda: order_list_cache.invalidate([order_status]))
+        response = Response(status=http_status.HTTP_204_NO_CONTENT)
+        response['ETag'] = quote_etag(str(version))
+        return response
 
 
-class PizzaViewSet(ReadOnlyModelViewSet):
+class PizzaViewSet(QueryBudgetMixin, ReplicaReadMixin, CachedResponseMixin, ReadOnlyModelViewSet):
     model = Pizza
     queryset = Pizza.objects.all()
     serializer_class = PizzaSerializer
+    response_cache = pizza_cache
+    query_budgets = {
+        'list': 3,
+        'retrieve': 1,
+    }
+    cache_max_age = settings.PIZZA_CACHE_MAX_AGE
@@ -0,0 +1,10 @@
+"""Benchmarks of the order API against a local Postgres.
+
+* `seed` fills the database up to given volumes, see `seed_orders`
+* `scenarios` are the requests measured, drawn reproducibly from the data
+* `runner` times them in-process and reports JSON, see `bench_api`
+
+    python manage.py seed_orders --customers 1000000 --orders 10000000
+    python manage.py bench_api --output before.json
+    python manage.py bench_api --compare before.json
+"""
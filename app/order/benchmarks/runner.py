@@ -0,0 +1,171 @@
+"""Times the scenarios in-process, through the whole middleware stack,
+one request at a time. Throughput is therefore what a single worker
+achieves; put the API behind its servers and use `bench_http` for
+concurrency.
+"""
+import logging
+import random
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from order.api.cache import order_list_cache
+from order.api.pagination import estimate_count
+from order.models import Customer, Order, OrderItem, Pizza
+from .scenarios import SCENARIOS, Sample
+
+
+def percentile(values, percent):
+    """Of sorted `values`
+    """
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'mean': round(statistics.mean(values), 2),
+        'p50': round(percentile(values, 50), 2),
+        'p95': round(percentile(values, 95), 2),
+        'p99': round(percentile(values, 99), 2),
+        'max': round(values[-1], 2),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Runner:
+    """
+    Args:
+        requests (int): measured requests per scenario
+        warmup (int): requests per scenario made before measuring
+        seed (int): seed of the sample and of every scenario's requests
+        cache (bool): keep the order list cache on; off, every list
+            request reaches the database
+        host (str): `Host` of the requests, one of `ALLOWED_HOSTS`
+    """
+
+    def __init__(self, requests=200, warmup=20, seed=0, cache=False, host='localhost'):
+        self.requests = requests
+        self.warmup = warmup
+        self.seed = seed
+        self.cache = cache
+        self.client = APIClient(SERVER_NAME=host, raise_request_exception=False)
+
+    def run(self, names=None):
+        """
+        Returns:
+            dict: the environment and the results per scenario, JSON ready
+        """
+        names = names or list(SCENARIOS)
+        sample = Sample(random.Random(self.seed))
+        results = {
+            'commit': get_commit(),
+            'started_at': timezone.now().isoformat(),
+            'postgres': connection.pg_version,
+            'estimated_rows': {
+                model._meta.db_table: estimate_count(model.objects.all())
+                for model in (Pizza, Customer, Order, OrderItem)
+            },
+            'options': {
+                'requests': self.requests,
+                'warmup': self.warmup,
+                'seed': self.seed,
+                'cache': self.cache,
+                'compiled_serializers': settings.COMPILED_SERIALIZERS,
+            },
+            'scenarios': {},
+        }
+
+        logger = logging.getLogger('app.timing')
+        log_level, timeout = logger.level, order_list_cache.timeout
+        # over budget requests are counted instead
+        logger.setLevel(logging.ERROR)
+        if not self.cache:
+            order_list_cache.timeout = 0
+        try:
+            for name in names:
+                results['scenarios'][name] = self.run_scenario(name, sample)
+        finally:
+            logger.setLevel(log_level)
+            order_list_cache.timeout = timeout
+        return results
+
+    def run_scenario(self, name, sample):
+        rng = random.Random(f'{self.seed}:{name}')
+        requests = [SCENARIOS[name](sample, rng) for _ in range(self.warmup + self.requests)]
+
+        with transaction.atomic():
+            for request in requests[:self.warmup]:
+                self.send(request)
+
+            measured = [self.measure(request) for request in requests[self.warmup:]]
+            # the next run starts from the same data
+            transaction.set_rollback(True)
+
+        latencies = [latency for latency, status, timings in measured]
+        timings = [timings for latency, status, timings in measured if timings is not None]
+        statuses = {}
+        for latency, status, _ in measured:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        return {
+            'requests': len(measured),
+            'errors': sum(1 for _, status, _ in measured if status >= 400),
+            'statuses': statuses,
+            'throughput_rps': round(len(measured) / (sum(latencies) / 1000), 1),
+            'latency_ms': summarize(latencies),
+            'queries': summarize([timing.queries for timing in timings]) if timings else None,
+            'db_ms': summarize([timing.durations['db'] * 1000 for timing in timings]) if timings else None,
+            'over_budget': sum(1 for timing in timings if timing.over_budget),
+        }
+
+    def send(self, request):
+        if request.data is None:
+            return getattr(self.client, request.method)(request.path)
+        return getattr(self.client, request.method)(request.path, request.data, format='json')
+
+    def measure(self, request):
+        """
+        Returns:
+            tuple: milliseconds, status code and `Timings` of the request,
+                see `app.timing`
+        """
+        started = time.perf_counter()
+        response = self.send(request)
+        latency = (time.perf_counter() - started) * 1000
+        return latency, response.status_code, getattr(response.wsgi_request, 'timings', None)
+
+
+def compare(before, after, metrics=('throughput_rps', 'latency_ms.p50', 'latency_ms.p95', 'queries.max')):
+    """Rows of `scenario, metric, before, after, change` for the scenarios
+    both results have
+    """
+    def get(result, metric):
+        for key in metric.split('.'):
+            result = result.get(key) if result is not None else None
+        return result
+
+    rows = []
+    for name, result in after['scenarios'].items():
+        if name not in before['scenarios']:
+            continue
+        for metric in metrics:
+            old, new = get(before['scenarios'][name], metric), get(result, metric)
+            change = (new - old) / old * 100 if old and new is not None else None
+            rows.append((name, metric, old, new, change))
+    return rows
@@ -0,0 +1,151 @@
+"""Requests the benchmarks time.
+
+A scenario is a function building one request from the `Sample` and a
+seeded `random.Random`, so a run can be repeated request for request on the
+same data. Writes are rolled back by the runner.
+"""
+from typing import NamedTuple, Optional
+from urllib.parse import urlencode
+
+from django.urls import reverse
+
+from order.api.pagination import KeysetPagination, estimate_count
+from order.models import Customer, Order, OrderItem, Pizza
+
+SCENARIOS = {}
+
+# statuses a write may move an order to, and away from again
+EDITABLE_STATUSES = [
+    status for status in Order.DeliveryStatuses.values
+    if status not in Order.UNEDITABLE_STATUES
+]
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    data: Optional[object] = None
+
+
+def scenario(function):
+    SCENARIOS[function.__name__] = function
+    return function
+
+
+class Sample:
+    """Rows the scenarios draw from, picked at random ids so it's cheap on
+    any volume
+
+    Args:
+        rng (random.Random): picks the rows
+        size (int): orders to pick
+    """
+
+    def __init__(self, rng, size=1000):
+        self.orders = self.pick_orders(rng, size)
+        self.editable_orders = [order for order in self.orders if order.status in EDITABLE_STATUSES]
+        self.items = list(
+            OrderItem.objects.filter(order__in=self.editable_orders)
+            .order_by('pk').values_list('order_id', 'pk')
+        )
+        self.names = list(
+            Customer.objects.filter(pk__in={order.customer_id for order in self.orders})
+            .order_by('pk').values_list('full_name', flat=True)
+        )
+        self.pizza_ids = list(Pizza.objects.order_by('pk').values_list('pk', flat=True)[:1000])
+        self.order_count = estimate_count(Order.objects.all())
+
+        if not (self.editable_orders and self.items and self.pizza_ids):
+            raise ValueError('Not enough data to benchmark, run `seed_orders` first')
+
+    @staticmethod
+    def pick_orders(rng, size):
+        bounds = Order.objects.order_by('pk').values_list('pk', flat=True)
+        first, last = bounds.first(), bounds.last()
+        if first is None:
+            return []
+
+        orders = {}
+        # ids have gaps, so draw a few times
+        for _ in range(10):
+            candidates = {rng.randint(first, last) for _ in range(size - len(orders))}
+            orders.update(
+                (order.pk, order) for order in
+                Order.objects.filter(pk__in=candidates).only('pk', 'customer_id', 'status', 'created_at')
+            )
+            if len(orders) >= size or len(orders) == last - first + 1:
+                break
+        return sorted(orders.values(), key=lambda order: order.pk)
+
+
+def list_path(**params):
+    return f'{reverse("order:order-list")}?{urlencode(params)}'
+
+
+@scenario
+def order_create(sample, rng):
+    return Request('post', reverse('order:order-list'), {
+        'customer': {
+            'full_name': rng.choice(sample.names),
+            'email': f'bench_{rng.randrange(10 ** 9)}@example.com',
+        },
+        'items': [
+            {
+                'pizza': rng.choice(sample.pizza_ids),
+                'size': rng.choice(OrderItem.Sizes.values),
+                'count': rng.randint(1, 5),
+            }
+            for _ in range(rng.randint(1, 3))
+        ],
+    })
+
+
+@scenario
+def order_list_status(sample, rng):
+    return Request('get', list_path(status=rng.choice(Order.DeliveryStatuses.values)))
+
+
+@scenario
+def order_list_search(sample, rng):
+    words = rng.choice(sample.names).split() or ['']
+    return Request('get', list_path(search=rng.choice([
+        words[0], words[-1][:3], f'{words[0]} {words[-1]}',
+    ])))
+
+
+@scenario
+def order_list_deep_offset(sample, rng):
+    return Request('get', list_path(offset=rng.randrange(sample.order_count // 2, sample.order_count)))
+
+
+@scenario
+def order_list_deep_cursor(sample, rng):
+    paginator = KeysetPagination()
+    paginator.base_url = list_path(pagination='cursor')
+    return Request('get', paginator.encode_cursor(paginator.get_position(rng.choice(sample.orders))))
+
+
+@scenario
+def order_retrieve(sample, rng):
+    order = rng.choice(sample.orders)
+    return Request('get', reverse('order:order-detail', kwargs={'pk': order.pk}))
+
+
+@scenario
+def order_item_update(sample, rng):
+    order_id, pk = rng.choice(sample.items)
+    return Request(
+        'patch',
+        reverse('order:order-items-detail', kwargs={'order_id': order_id, 'pk': pk}),
+        {'count': rng.randint(1, 5)},
+    )
+
+
+@scenario
+def order_status_update(sample, rng):
+    order = rng.choice(sample.editable_orders)
+    return Request(
+        'patch',
+        reverse('order:order-detail', kwargs={'pk': order.pk}),
+        {'status': rng.choice(EDITABLE_STATUSES)},
+    )
@@ -0,0 +1,190 @@
+"""Volume data for the benchmarks.
+
+Pizzas are few and go through `bulk_create()`, customers, orders and items
+are streamed with `COPY`, one transaction per batch. Primary keys are taken
+from the sequences up front, so items can refer to orders not written yet.
+"""
+import datetime
+import io
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from order.models import Customer, Order, OrderItem, Pizza
+
+FIRST_NAMES = (
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda',
+    'William', 'Elizabeth', 'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica',
+    'Thomas', 'Sarah', 'Charles', 'Karen', 'Daniel', 'Nancy', 'Matthew', 'Lisa',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+    'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson',
+    'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White',
+)
+# most orders of a busy service are history
+STATUS_WEIGHTS = {
+    Order.DeliveryStatuses.NEW: 2,
+    Order.DeliveryStatuses.ACCEPTED: 2,
+    Order.DeliveryStatuses.READY: 1,
+    Order.DeliveryStatuses.SHIPPED: 2,
+    Order.DeliveryStatuses.DELIVERED: 93,
+}
+SEED_EMAIL_SUFFIX = '@seed.example.com'
+
+
+def reserve_ids(model, count):
+    """Take `count` consecutive primary keys from the model's sequence.
+    Meant for a database nobody else writes to at the same time.
+
+    Returns:
+        int: the first of them
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [model._meta.db_table])
+        sequence = cursor.fetchone()[0]
+        cursor.execute('SELECT nextval(%s)', [sequence])
+        first = cursor.fetchone()[0]
+        cursor.execute('SELECT setval(%s, %s)', [sequence, first + count - 1])
+    return first
+
+
+def copy_rows(model, columns, rows):
+    """Write `rows`, tuples of values without tabs, newlines or
+    backslashes, with one `COPY`
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(map(str, row)))
+        buffer.write('\n')
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY "{model._meta.db_table}" ({", ".join(columns)}) FROM STDIN', buffer)
+
+
+def batches(total, size):
+    """Sizes of the batches `total` rows are written in
+    """
+    for start in range(0, total, size):
+        yield min(size, total - start)
+
+
+class Seeder:
+    """Adds rows until the tables hold the given volumes.
+
+    Args:
+        rng (random.Random): source of every random choice
+        batch_size (int): rows per `COPY` and transaction
+        days (int): orders are spread over this many days until now
+        log (callable): called with a progress message per batch
+    """
+
+    def __init__(self, rng, batch_size=100000, days=365, log=None):
+        self.rng = rng
+        self.batch_size = batch_size
+        self.days = days
+        self.log = log or (lambda message: None)
+
+    def seed(self, pizzas, customers, orders, items):
+        """
+        Args:
+            items (int): most items of an order, at least one each
+
+        Returns:
+            dict: rows added per table
+        """
+        return {
+            'pizzas': self.seed_pizzas(pizzas),
+            'customers': self.seed_customers(customers),
+            'orders': self.seed_orders(orders, items),
+        }
+
+    def seed_pizzas(self, total):
+        missing = total - Pizza.objects.count()
+        if missing <= 0:
+            return 0
+        Pizza.objects.bulk_create(
+            (Pizza(name=f'Pizza #{self.rng.randrange(10 ** 6)}') for _ in range(missing)),
+            batch_size=self.batch_size,
+        )
+        self.log(f'pizzas: {missing}')
+        return missing
+
+    def seed_customers(self, total):
+        missing = total - Customer.objects.count()
+        if missing <= 0:
+            return 0
+
+        now = timezone.now()
+        for size in batches(missing, self.batch_size):
+            with transaction.atomic():
+                first = reserve_ids(Customer, size)
+                # the search vector is filled by the trigger of migration 0008
+                copy_rows(Customer, ['id', 'full_name', 'email', 'created_at', 'updated_at'], (
+                    (
+                        pk,
+                        f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}',
+                        f'customer_{pk}{SEED_EMAIL_SUFFIX}',
+                        now.isoformat(),
+                        now.isoformat(),
+                    )
+                    for pk in range(first, first + size)
+                ))
+            self.log(f'customers: {size}')
+        return missing
+
+    def seed_orders(self, total, items):
+        missing = total - Order.objects.count()
+        if missing <= 0:
+            return 0
+
+        customer_ids = list(Customer.objects.values_list('id', flat=True))
+        pizza_ids = list(Pizza.objects.values_list('id', flat=True))
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+        sizes = OrderItem.Sizes.values
+        now = timezone.now()
+        span = datetime.timedelta(days=self.days).total_seconds()
+
+        for size in batches(missing, self.batch_size):
+            order_rows = []
+            item_rows = []
+            with transaction.atomic():
+                first = reserve_ids(Order, size)
+                for pk in range(first, first + size):
+                    created_at = now - datetime.timedelta(seconds=self.rng.random() * span)
+                    order_rows.append((
+                        pk,
+                        self.rng.choice(customer_ids),
+                        self.rng.choices(statuses, weights)[0],
+                        created_at.isoformat(),
+                        created_at.isoformat(),
+                        '',
+                        1,
+                    ))
+                    item_rows += [
+                        (pk, self.rng.choice(pizza_ids), self.rng.choice(sizes), self.rng.randint(1, 5))
+                        for _ in range(self.rng.randint(1, items))
+                    ]
+
+                with connection.cursor() as cursor:
+                    # seeded orders aren't announced on the `order_status` channel
+                    cursor.execute("SELECT set_config('order.status_notify', 'off', true)")
+                copy_rows(
+                    Order, ['id', 'customer_id', 'status', 'created_at', 'updated_at', 'claimed_by', 'version'],
+                    order_rows,
+                )
+                copy_rows(OrderItem, ['order_id', 'pizza_id', 'size', 'count'], item_rows)
+            self.log(f'orders: {size}, items: {len(item_rows)}')
+        return missing
+
+
+def vacuum():
+    """Refresh the planner statistics and visibility maps of the seeded
+    tables, and merge pending GIN entries, as autovacuum eventually would.
+    Can't run in a transaction.
+    """
+    with connection.cursor() as cursor:
+        for model in (Pizza, Customer, Order, OrderItem):
+            cursor.execute(f'VACUUM ANALYZE "{model._meta.db_table}"')
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+from order.events import StatusChange, order_status_changed
+
+logger = logging.getLogger(__name__)
+
+# `NOTIFY` channel of the `order_status_notify` trigger, see migration 0007
+ORDER_STATUS_CHANNEL = 'order_status'
+
+
+class Subscription:
+    """Status changes for one connected client, consumed on the event loop
+    it was created on.
+
+    A client that falls `maxsize` events behind gets `None` instead of the
+    next change and is expected to reconnect with its last event id.
+    """
+
+    def __init__(self, statuses=None, maxsize=0):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.statuses = frozenset(statuses or ())
+
+    def push(self, change):
+        if self.statuses and change.status not in self.statuses:
+            return
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Broker:
+    """Fans status changes out to every subscription of the process.
+
+    `publish()` may be called from any thread; the changes are handed over
+    to each event loop once and dispatched to its subscriptions there.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+        self.started = False
+
+    def subscribe(self, statuses=None):
+        self.ensure_started()
+        subscription = Subscription(statuses, settings.ORDER_EVENTS_QUEUE_SIZE)
+        with self.lock:
+            self.subscriptions.setdefault(subscription.loop, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.loop)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[subscription.loop]
+
+    def publish(self, changes):
+        with self.lock:
+            loops = list(self.subscriptions)
+
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self.dispatch, loop, changes)
+            except RuntimeError:
+                # loop closed without unsubscribing its clients
+                with self.lock:
+                    self.subscriptions.pop(loop, None)
+
+    def dispatch(self, loop, changes):
+        for subscription in list(self.subscriptions.get(loop, ())):
+            for change in changes:
+                subscription.push(change)
+
+    def ensure_started(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        self.start()
+
+    def start(self):
+        """Hook up the source of status changes, called on first subscribe
+        """
+
+
+class InProcessBroker(Broker):
+    """Changes made by this process only, through `order_status_changed`.
+
+    Meant for tests and single process development servers.
+    """
+
+    def start(self):
+        order_status_changed.connect(
+            self.on_status_changed, weak=False, dispatch_uid=f'{__name__}.{id(self)}')
+
+    def on_status_changed(self, sender, changes, using, **kwargs):
+        transaction.on_commit(lambda: self.publish(changes), using=using)
+
+
+class PostgresBroker(Broker):
+    """Changes committed by any process, through `LISTEN/NOTIFY`.
+
+    A single daemon thread holds the listening connection for the whole
+    process, however many clients are subscribed.
+    """
+    channel = ORDER_STATUS_CHANNEL
+    using = 'default'
+    poll_interval = 5
+    reconnect_delay = 1
+
+    def start(self):
+        threading.Thread(target=self.listen, name='order-status-listener', daemon=True).start()
+
+    def listen(self):
+        while True:
+            try:
+                self.consume(self.connect())
+            except Exception:
+                logger.exception('Order status listener failed, reconnecting')
+                time.sleep(self.reconnect_delay)
+
+    def connect(self):
+        connection = psycopg2.connect(**connections[self.using].get_connection_params())
+        connection.set_session(autocommit=True)
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.channel}')
+        return connection
+
+    def consume(self, connection):
+        try:
+            while True:
+                readable, _, _ = select.select([connection], [], [], self.poll_interval)
+                if not readable:
+                    continue
+
+                connection.poll()
+                changes = []
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    changes.append(StatusChange.from_payload(notify.payload))
+                if changes:
+                    self.publish(changes)
+        finally:
+            connection.close()
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    """The process wide instance of `settings.ORDER_EVENTS_BROKER`
+    """
+    path = settings.ORDER_EVENTS_BROKER
+    with _brokers_lock:
+        if path not in _brokers:
+            _brokers[path] = import_string(path)()
+        return _brokers[path]
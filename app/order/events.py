@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+import json
+from typing import NamedTuple, Optional
+
+from django.dispatch import Signal
+from django.utils.dateparse import parse_datetime
+
+# Sent inside the writing transaction whenever orders are created or change
+# status, with `changes` (list of `StatusChange`) and `using` arguments
+order_status_changed = Signal()
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class StatusChange(NamedTuple):
+    order_id: int
+    status: str
+    updated_at: datetime
+    # status before the change, `None` for new orders or when it isn't known
+    previous_status: Optional[str] = None
+
+    @classmethod
+    def from_payload(cls, payload):
+        data = json.loads(payload)
+        return cls(data['id'], data['status'], parse_datetime(data['updated_at']))
+
+    @property
+    def position(self):
+        return self.updated_at, self.order_id
+
+    @property
+    def event_id(self):
+        """`<updated_at in microseconds>-<order id>`, clients send it back as
+        `Last-Event-ID` to resume
+        """
+        return f'{(self.updated_at - EPOCH) // MICROSECOND}-{self.order_id}'
+
+    def as_dict(self):
+        return {
+            'id': self.order_id,
+            'status': self.status,
+            'updated_at': self.updated_at.isoformat(),
+        }
+
+
+def parse_event_id(event_id):
+    """
+    Returns:
+        tuple: `(updated_at, order_id)` position, `None` if it's malformed
+    """
+    try:
+        micros, order_id = event_id.split('-')
+        return EPOCH + int(micros) * MICROSECOND, int(order_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
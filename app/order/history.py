@@ -0,0 +1,88 @@
+"""Order status history: every committed status change, whichever code path
+made it (API, bulk updates, claims, admin), is appended to `OrderStatusEvent`.
+
+Changes are buffered per process and written in batches by a daemon thread,
+so requests changing statuses make no extra queries, but for the one filling
+a batch. Under uWSGI the thread needs `enable-threads`.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from order.models import OrderStatusEvent
+
+logger = logging.getLogger(__name__)
+
+
+class StatusHistory:
+    """Status changes waiting to be written, process wide.
+
+    They are written every `ORDER_STATUS_HISTORY_FLUSH_INTERVAL` seconds, or
+    as soon as `ORDER_STATUS_HISTORY_BATCH_SIZE` are waiting, by the thread
+    that got there, on the connection it holds anyway. Changes still buffered
+    when the process is killed are lost; a regular exit writes them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []
+        self.started = False
+
+    def add(self, changes):
+        """Buffer committed `changes` (list of `StatusChange`)
+        """
+        # e.g. claims renewing the lease of ACCEPTED orders
+        changes = [change for change in changes if change.status != change.previous_status]
+        if not changes:
+            return
+
+        with self.lock:
+            self.pending.extend(changes)
+            full = len(self.pending) >= settings.ORDER_STATUS_HISTORY_BATCH_SIZE
+
+        if full:
+            self.flush()
+        elif settings.ORDER_STATUS_HISTORY_FLUSH_INTERVAL:
+            self.ensure_started()
+
+    def flush(self):
+        """Write the waiting changes
+
+        Returns:
+            int: number of changes written
+        """
+        with self.lock:
+            changes, self.pending = self.pending, []
+        if not changes:
+            return 0
+
+        try:
+            OrderStatusEvent.objects.append(changes)
+        except Exception:
+            logger.exception('Failed to write %d order status changes, they are lost', len(changes))
+            return 0
+        return len(changes)
+
+    def ensure_started(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        threading.Thread(target=self.run, name='order-status-history', daemon=True).start()
+        atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            time.sleep(settings.ORDER_STATUS_HISTORY_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            finally:
+                # nothing held between batches
+                connections.close_all()
+
+
+status_history = StatusHistory()
@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from order.benchmarks.runner import Runner, compare
+from order.benchmarks.scenarios import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the order API benchmark scenarios and report throughput, '
+        'latency percentiles and queries per request as JSON. Writes are '
+        'rolled back. Seed the database with `seed_orders` first, and '
+        'compare runs between commits with `--compare`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+            help='Scenarios to run, all by default',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Measured requests per scenario',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=20,
+            help='Requests per scenario before measuring',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the sampled rows and requests',
+        )
+        parser.add_argument(
+            '--cache', action='store_true',
+            help='Keep the order list cache on',
+        )
+        parser.add_argument(
+            '--output',
+            help='File to write the JSON results to, instead of stdout',
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON results of an earlier run to compare with',
+        )
+
+    def handle(self, *args, **options):
+        runner = Runner(
+            requests=options['requests'],
+            warmup=options['warmup'],
+            seed=options['seed'],
+            cache=options['cache'],
+        )
+        results = runner.run(options['scenarios'])
+
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                rows = compare(json.load(baseline), results)
+            for name, metric, before, after, change in rows:
+                self.stderr.write(
+                    f'{name:<24}{metric:<16}{before!s:>10} -> {after!s:<10}'
+                    f'{f"{change:+.1f}%" if change is not None else ""}'
+                )
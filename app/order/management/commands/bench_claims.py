@@ -0,0 +1,92 @@
+from collections import Counter
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from order.models import Customer, Order
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure orders/sec claimed from the kitchen work queue by several '
+        'stations claiming at the same time, one thread and database '
+        'connection each, and check that no order is claimed twice. The '
+        'queued orders are committed, since stations need to see them, and '
+        'deleted afterwards.'
+    )
+    email = 'bench-claims@example.com'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+            help='Numbers of stations claiming in parallel to measure',
+        )
+        parser.add_argument(
+            '--orders', type=int, default=10000,
+            help='Orders queued per measurement',
+        )
+        parser.add_argument(
+            '--batch', type=int, default=1,
+            help='Orders taken per claim',
+        )
+
+    def handle(self, *args, **options):
+        customer = Customer.objects.upsert('Benchmark customer', self.email)
+        try:
+            baseline = None
+            for workers in options['workers']:
+                self.queue(customer, options['orders'])
+                claimed, elapsed = self.run(customer, workers, options['batch'])
+
+                twice = [pk for pk, count in Counter(claimed).items() if count > 1]
+                if twice:
+                    raise CommandError(f'{len(twice)} orders were claimed twice, e.g. {twice[:10]}')
+                if len(claimed) != options['orders']:
+                    raise CommandError(f'{len(claimed)} of {options["orders"]} orders were claimed')
+
+                rate = len(claimed) / elapsed
+                baseline = baseline or rate / workers
+                self.stdout.write(
+                    f'{workers:>3} workers: {len(claimed):>7} orders in {elapsed:8.3f}s, '
+                    f'{rate:10.1f} orders/s, {rate / baseline / workers:6.0%} of linear'
+                )
+        finally:
+            Order.objects.filter(customer=customer).delete()
+            customer.delete()
+
+    def queue(self, customer, orders):
+        Order.objects.filter(customer=customer).delete()
+        Order.objects.bulk_create(
+            [Order(customer=customer, status=Order.DeliveryStatuses.NEW) for _ in range(orders)],
+            batch_size=10000,
+        )
+
+    def run(self, customer, workers, batch):
+        queue = Order.objects.filter(customer=customer)
+        claimed = []
+        start = threading.Barrier(workers + 1)
+
+        def station(name):
+            try:
+                start.wait()
+                while True:
+                    ids = queue.claim(name, batch)
+                    if not ids:
+                        return
+                    claimed.extend(ids)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=station, args=(f'bench-{number}',))
+            for number in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return claimed, time.perf_counter() - started
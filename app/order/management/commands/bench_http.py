@@ -0,0 +1,142 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test running deployments: requests/sec and latency percentiles '
+        'of GET requests at a fixed concurrency, over keep-alive connections. '
+        'Run it against the uWSGI (`api`) and ASGI (`api-asgi`) services to '
+        'compare them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls', nargs='+',
+            help='URLs to request, round robin, e.g. http://localhost:8015/api/v1/orders/',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=50,
+            help='Connections requesting in parallel',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=5000,
+            help='Total number of requests',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='Seconds to wait for a single response',
+        )
+
+    def handle(self, *args, **options):
+        for url in options['urls']:
+            if urlsplit(url).scheme != 'http':
+                raise CommandError(f'Only http:// URLs are supported: {url}')
+
+        latencies, errors, elapsed = asyncio.run(self.run(options))
+
+        latencies.sort()
+        done = len(latencies)
+        self.stdout.write(
+            f'{done} requests ({errors} failed) in {elapsed:.2f}s at concurrency '
+            f'{options["concurrency"]}: {done / elapsed:.1f} req/s'
+        )
+        if done:
+            self.stdout.write(
+                f'latency ms: mean {statistics.mean(latencies) * 1000:.1f}, '
+                f'p50 {self.percentile(latencies, 50) * 1000:.1f}, '
+                f'p99 {self.percentile(latencies, 99) * 1000:.1f}, '
+                f'max {latencies[-1] * 1000:.1f}'
+            )
+
+    async def run(self, options):
+        remaining = iter(range(options['requests']))
+        urls = options['urls']
+        latencies = []
+        errors = 0
+
+        async def worker():
+            nonlocal errors
+            connections = {}
+            try:
+                for number in remaining:
+                    url = urlsplit(urls[number % len(urls)])
+                    started = time.perf_counter()
+                    try:
+                        status = await asyncio.wait_for(
+                            self.get(connections, url), options['timeout'])
+                    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                        connections.pop(url.netloc, None)
+                        errors += 1
+                        continue
+                    if status == 200:
+                        latencies.append(time.perf_counter() - started)
+                    else:
+                        errors += 1
+            finally:
+                for _, writer in connections.values():
+                    writer.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(options['concurrency'])))
+        return latencies, errors, time.perf_counter() - started
+
+    async def get(self, connections, url):
+        """Minimal HTTP/1.1 GET, over a reused connection when the server
+        keeps it open
+        """
+        if url.netloc in connections:
+            try:
+                return await self.request(connections, url)
+            except (OSError, asyncio.IncompleteReadError):
+                # closed by the server since the last response
+                connections.pop(url.netloc)[1].close()
+
+        connections[url.netloc] = await asyncio.open_connection(url.hostname, url.port or 80)
+        return await self.request(connections, url)
+
+    async def request(self, connections, url):
+        reader, writer = connections[url.netloc]
+        target = url.path + (f'?{url.query}' if url.query else '')
+        writer.write(
+            f'GET {target} HTTP/1.1\r\nHost: {url.netloc}\r\n'
+            f'Accept: application/json\r\n\r\n'.encode('latin-1')
+        )
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError(url.netloc)
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if not size:
+                    break
+        elif 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        else:
+            await reader.read()
+            headers['connection'] = 'close'
+
+        if headers.get('connection', '').lower() == 'close':
+            connections.pop(url.netloc)[1].close()
+        return status
+
+    @staticmethod
+    def percentile(values, percent):
+        index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+        return values[index]
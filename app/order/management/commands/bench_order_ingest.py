@@ -0,0 +1,86 @@
+import random
+import time
+
+from django.db import transaction
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from order.api.viewsets import OrderViewSet
+from order.models import OrderItem, Pizza
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure orders/sec of POST /api/v1/orders/bulk/ at several batch sizes. '
+        'Everything is written in a transaction that is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1, 100, 10000],
+            help='Batch sizes to measure',
+        )
+        parser.add_argument(
+            '--orders', type=int, default=10000,
+            help='Orders to ingest per batch size (at least one batch)',
+        )
+        parser.add_argument(
+            '--items', type=int, default=3,
+            help='Items per order',
+        )
+        parser.add_argument(
+            '--customers', type=int, default=1000,
+            help='Distinct customer emails to pick from',
+        )
+
+    def handle(self, *args, **options):
+        view = OrderViewSet.as_view({'post': 'bulk_create'})
+        factory = APIRequestFactory()
+
+        with transaction.atomic():
+            pizza_ids = [
+                pizza.pk for pizza in Pizza.objects.bulk_create(
+                    Pizza(name=f'Benchmark #{n}') for n in range(10)
+                )
+            ]
+
+            for size in options['sizes']:
+                batches = max(1, options['orders'] // size)
+                payloads = [
+                    self.build_batch(size, pizza_ids, options)
+                    for _ in range(batches)
+                ]
+
+                started = time.perf_counter()
+                for payload in payloads:
+                    response = view(factory.post('/', payload, format='json'))
+                    assert response.status_code == 201, response.data
+                elapsed = time.perf_counter() - started
+
+                ingested = batches * size
+                self.stdout.write(
+                    f'batch size {size:>6}: {ingested:>7} orders in {elapsed:8.3f}s, '
+                    f'{ingested / elapsed:10.1f} orders/s'
+                )
+
+            transaction.set_rollback(True)
+
+    def build_batch(self, size, pizza_ids, options):
+        return [
+            {
+                'customer': {
+                    'full_name': 'Benchmark customer',
+                    'email': 'bench_{}@example.com'.format(
+                        random.randrange(options['customers'])),
+                },
+                'items': [
+                    {
+                        'pizza': random.choice(pizza_ids),
+                        'size': random.choice(OrderItem.Sizes.values),
+                        'count': random.randint(1, 5),
+                    }
+                    for _ in range(options['items'])
+                ],
+            }
+            for _ in range(size)
+        ]
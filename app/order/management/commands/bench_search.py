@@ -0,0 +1,140 @@
+import random
+import statistics
+import time
+
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from order.api.filters import CustomerSearchFilter
+from order.api.pagination import OrderPagination
+from order.models import Customer, Order
+
+FIRST_NAMES = (
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda',
+    'William', 'Elizabeth', 'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica',
+    'Thomas', 'Sarah', 'Charles', 'Karen', 'Daniel', 'Nancy', 'Matthew', 'Lisa',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+    'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson',
+    'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White',
+)
+
+# one INSERT ... SELECT each, the search vectors are filled by the trigger
+SEED_CUSTOMERS = """
+INSERT INTO order_customer (full_name, email, created_at, updated_at)
+SELECT first_names[1 + n %% array_length(first_names, 1)] || ' ' ||
+       last_names[1 + (n / array_length(first_names, 1)) %% array_length(last_names, 1)],
+       'bench_search_' || n || '@example.com', now(), now()
+FROM generate_series(1, %(customers)s) AS n,
+     (SELECT %(first_names)s::text[] AS first_names, %(last_names)s::text[] AS last_names) AS names
+"""
+
+SEED_ORDERS = """
+INSERT INTO order_order (customer_id, status, created_at, updated_at)
+SELECT customers.ids[1 + floor(random() * array_length(customers.ids, 1))::int],
+       'NEW', now() - n * interval '1 second', now()
+FROM generate_series(1, %(orders)s) AS n,
+     (SELECT array_agg(id) AS ids FROM order_customer) AS customers
+"""
+
+
+class LegacySearchView:
+    # what `OrderViewSet` searched with before the full-text search
+    search_fields = ['customer__full_name', 'customer__email']
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the latency of the first page of an order search, with '
+        '`icontains` lookups (`SearchFilter`) against `CustomerSearchFilter`. '
+        'Missing customers and orders are created in a transaction that is '
+        'rolled back, unless `--keep` is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders', type=int, default=1000000,
+            help='Orders to search through',
+        )
+        parser.add_argument(
+            '--customers', type=int, default=100000,
+            help='Customers to spread them over',
+        )
+        parser.add_argument(
+            '--queries', type=int, default=20,
+            help='Searches per kind of search and filter',
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Commit the created rows',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options)
+            self.stdout.write(
+                f'{Order.objects.count()} orders, {Customer.objects.count()} customers, '
+                f'median and 95th percentile of {options["queries"]} searches'
+            )
+
+            names = list(
+                Customer.objects.filter(email__startswith='bench_search_')
+                .values_list('full_name', flat=True)[:10000]
+            )
+            random.seed(0)
+            picks = [name.split() for name in random.sample(names, min(options['queries'], len(names)))]
+            searches = {
+                'first name': [first for first, last in picks],
+                'last name prefix': [last[:3] for first, last in picks],
+                'full name': [f'{first} {last}' for first, last in picks],
+            }
+
+            for label, texts in searches.items():
+                for backend, view in ((filters.SearchFilter, LegacySearchView), (CustomerSearchFilter, None)):
+                    timings = sorted(self.time(backend, view, text) for text in texts)
+                    self.stdout.write(
+                        f'{label:<18}{backend.__name__:<22}'
+                        f'{statistics.median(timings):10.1f} ms'
+                        f'{timings[round(0.95 * (len(timings) - 1))]:10.1f} ms'
+                    )
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def seed(self, options):
+        seeded = Customer.objects.filter(email__startswith='bench_search_').count()
+        missing_orders = options['orders'] - Order.objects.count()
+        with connection.cursor() as cursor:
+            if seeded < options['customers']:
+                cursor.execute(
+                    SEED_CUSTOMERS.replace('generate_series(1,', f'generate_series({seeded + 1},'),
+                    {
+                        'customers': options['customers'],
+                        'first_names': list(FIRST_NAMES),
+                        'last_names': list(LAST_NAMES),
+                    },
+                )
+            if missing_orders > 0:
+                cursor.execute(SEED_ORDERS, {'orders': missing_orders})
+            # as autovacuum would, rather than searching the GIN pending list
+            cursor.execute("SELECT gin_clean_pending_list('order_customer_search_idx')")
+            cursor.execute('ANALYZE order_customer')
+            cursor.execute('ANALYZE order_order')
+
+    @staticmethod
+    def time(backend, view, text):
+        """
+        Returns:
+            float: milliseconds to paginate the matches like the order list
+                does, count included
+        """
+        request = Request(APIRequestFactory().get('/', {'search': text}))
+        started = time.perf_counter()
+        queryset = backend().filter_queryset(
+            request, Order.objects.select_related('customer'), view)
+        OrderPagination().paginate_queryset(queryset, request)
+        return (time.perf_counter() - started) * 1000
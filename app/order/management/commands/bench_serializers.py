@@ -0,0 +1,106 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from order.api.renderers import ORJSONRenderer
+from order.api.serializers import OrderReadSerializer
+from order.models import Customer, Order, OrderItem, Pizza
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure rows/sec of order list output: `OrderReadSerializer` with DRF '
+        'fields against the compiled one, and `JSONRenderer` against '
+        '`ORJSONRenderer`. Checks first that both produce the same bytes. '
+        'Missing orders are created in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1000,
+            help='Orders serialized per round',
+        )
+        parser.add_argument(
+            '--items', type=int, default=3,
+            help='Items per created order',
+        )
+        parser.add_argument(
+            '--rounds', type=int, default=5,
+            help='Rounds per variant, the fastest one is reported',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options)
+            orders = list(
+                Order.objects.with_details().order_by('-created_at')[:options['rows']]
+            )
+
+            with override_settings(COMPILED_SERIALIZERS=False):
+                expected = self.serialize(orders)
+            data = self.serialize(orders)
+            if ORJSONRenderer().render(data) != JSONRenderer().render(expected):
+                raise CommandError('Compiled serializer output differs from DRF')
+
+            self.stdout.write(f'{len(orders)} orders, best of {options["rounds"]} rounds')
+            with override_settings(COMPILED_SERIALIZERS=False):
+                drf = self.report('serialize: DRF', self.serialize, orders, options)
+            compiled = self.report('serialize: compiled', self.serialize, orders, options)
+            json_render = self.report('render: JSONRenderer', JSONRenderer().render, data, options)
+            orjson_render = self.report('render: ORJSONRenderer', ORJSONRenderer().render, data, options)
+
+            before = len(orders) / (len(orders) / drf + len(orders) / json_render)
+            after = len(orders) / (len(orders) / compiled + len(orders) / orjson_render)
+            self.stdout.write(
+                f'{"total":<24}{before:12.0f} -> {after:.0f} rows/s ({after / before:.1f}x)'
+            )
+
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        missing = options['rows'] - Order.objects.count()
+        if missing <= 0:
+            return
+
+        pizzas = Pizza.objects.bulk_create(Pizza(name=f'Benchmark #{n}') for n in range(10))
+        customers = Customer.objects.bulk_create(
+            Customer(full_name='Benchmark customer', email=f'bench_serializers_{n}@example.com')
+            for n in range(100)
+        )
+        orders = Order.objects.bulk_create(
+            Order(customer=random.choice(customers), status=random.choice(Order.DeliveryStatuses.values))
+            for _ in range(missing)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(
+                order=order,
+                pizza=random.choice(pizzas),
+                size=random.choice(OrderItem.Sizes.values),
+                count=random.randint(1, 5),
+            )
+            for order in orders for _ in range(options['items'])
+        )
+
+    @staticmethod
+    def serialize(orders):
+        return OrderReadSerializer(orders, many=True).data
+
+    def report(self, label, function, argument, options):
+        """
+        Returns:
+            float: rows/sec of the fastest round
+        """
+        rows = len(argument)
+        best = min(self.time(function, argument) for _ in range(options['rounds']))
+        self.stdout.write(f'{label:<24}{rows / best:12.0f} rows/s')
+        return rows / best
+
+    @staticmethod
+    def time(function, argument):
+        started = time.perf_counter()
+        function(argument)
+        return time.perf_counter() - started
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from order.api.cache import order_list_cache
+from order.models import Customer, Order
+from order.services import merge_duplicate_customers
+
+
+class Command(BaseCommand):
+    help = 'Merge customers sharing the same normalized email into one'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of duplicated emails merged per transaction',
+        )
+
+    def handle(self, *args, **options):
+        removed = merge_duplicate_customers(
+            Customer, Order, batch_size=options['batch_size'])
+        # orders moved to other customers
+        if removed:
+            order_list_cache.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {removed} duplicate customers'))
@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from order.benchmarks.seed import Seeder, vacuum
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database up to the given volumes for benchmarks, adding '
+        'only what is missing. Rows are written with COPY, one transaction '
+        'per batch, and the tables are vacuumed at the end. Keep other '
+        'writers away while it runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pizzas', type=int, default=10000,
+            help='Pizzas in total',
+        )
+        parser.add_argument(
+            '--customers', type=int, default=1000000,
+            help='Customers in total',
+        )
+        parser.add_argument(
+            '--orders', type=int, default=10000000,
+            help='Orders in total',
+        )
+        parser.add_argument(
+            '--items', type=int, default=3,
+            help='Most items per order',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Days the orders are spread over',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100000,
+            help='Rows per COPY',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the generated values',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        seeder = Seeder(
+            random.Random(options['seed']),
+            batch_size=options['batch_size'],
+            days=options['days'],
+            log=self.stdout.write,
+        )
+        added = seeder.seed(
+            options['pizzas'], options['customers'], options['orders'], options['items'])
+        vacuum()
+        self.stdout.write(
+            f'added {added["pizzas"]} pizzas, {added["customers"]} customers and '
+            f'{added["orders"]} orders in {time.perf_counter() - started:.0f}s'
+        )
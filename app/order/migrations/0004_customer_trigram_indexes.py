@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 09:05
+
+from django.db import migrations
+
+
+# `SearchFilter` turns `icontains` into `UPPER(column) LIKE UPPER('%term%')`,
+# so the trigram indexes are built on the same expressions. Servers without
+# the contrib extensions keep working, just without the indexes.
+CREATE_TRIGRAM_INDEXES = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS order_customer_name_trgm_idx
+            ON order_customer USING gin (UPPER(full_name::text) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS order_customer_email_trgm_idx
+            ON order_customer USING gin (UPPER(email::text) gin_trgm_ops);
+    END IF;
+END
+$$;
+"""
+
+DROP_TRIGRAM_INDEXES = """
+DROP INDEX IF EXISTS order_customer_name_trgm_idx;
+DROP INDEX IF EXISTS order_customer_email_trgm_idx;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGRAM_INDEXES, DROP_TRIGRAM_INDEXES),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2 on 2026-10-18 09:20
+
+from django.db import migrations
+from django.db.models import Case, Count, IntegerField, Max, Value, When
+from django.db.models.functions import Lower, Trim
+
+BATCH_SIZE = 500
+
+
+def merge_customers(apps, schema_editor):
+    """Collapse customers sharing a normalized email into the newest of them,
+    as `order.services.merge_duplicate_customers` did when this was written,
+    and store the remaining emails normalized
+    """
+    Customer = apps.get_model('order', 'Customer')
+    Order = apps.get_model('order', 'Order')
+    db = schema_editor.connection.alias
+    normalized_email = Lower(Trim('email'))
+
+    duplicated_emails = (
+        Customer.objects.using(db)
+        .annotate(normalized_email=normalized_email)
+        .values('normalized_email')
+        .annotate(rows=Count('id'), keep_id=Max('id'))
+        .filter(rows__gt=1)
+        .order_by('normalized_email')
+    )
+    while True:
+        batch = {
+            group['normalized_email']: group['keep_id']
+            for group in duplicated_emails[:BATCH_SIZE]
+        }
+        if not batch:
+            break
+
+        duplicates = (
+            Customer.objects.using(db)
+            .annotate(normalized_email=normalized_email)
+            .filter(normalized_email__in=batch.keys())
+            .exclude(pk__in=batch.values())
+            .values_list('pk', 'normalized_email')
+        )
+        replacements = {pk: batch[email] for pk, email in duplicates}
+        Order.objects.using(db).filter(customer_id__in=replacements).update(
+            customer_id=Case(
+                *[When(customer_id=duplicate_id, then=Value(keep_id))
+                  for duplicate_id, keep_id in replacements.items()],
+                output_field=IntegerField(),
+            )
+        )
+        Customer.objects.using(db).filter(pk__in=replacements).delete()
+
+    Customer.objects.using(db).exclude(email=normalized_email).update(email=normalized_email)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_customer_trigram_indexes'),
+    ]
+
+    # Committed before the unique constraint is added: a table with foreign
+    # key checks still pending in the transaction can't be altered.
+    operations = [
+        migrations.RunPython(merge_customers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0005_customer_merge_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='email',
+            field=models.EmailField(max_length=254, unique=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+# Every committed status change is announced on the `order_status` channel,
+# whichever code path (ORM, bulk UPDATE, admin, psql) made it, unless the
+# transaction turned `order.status_notify` off, as the benchmark seeder does:
+# `SELECT set_config('order.status_notify', 'off', true)`.
+CREATE_NOTIFY_TRIGGER = """
+CREATE OR REPLACE FUNCTION order_status_notify() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('order.status_notify', true) IS DISTINCT FROM 'off'
+            AND (TG_OP = 'INSERT' OR NEW.status IS DISTINCT FROM OLD.status) THEN
+        PERFORM pg_notify('order_status', json_build_object(
+            'id', NEW.id,
+            'status', NEW.status,
+            'updated_at', NEW.updated_at
+        )::text);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER order_status_notify
+    AFTER INSERT OR UPDATE OF status ON order_order
+    FOR EACH ROW EXECUTE PROCEDURE order_status_notify();
+"""
+
+DROP_NOTIFY_TRIGGER = """
+DROP TRIGGER IF EXISTS order_status_notify ON order_order;
+DROP FUNCTION IF EXISTS order_status_notify();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0006_customer_unique_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at', 'id'], name='order_updated_id_idx'),
+        ),
+        migrations.RunSQL(CREATE_NOTIFY_TRIGGER, DROP_NOTIFY_TRIGGER),
+    ]
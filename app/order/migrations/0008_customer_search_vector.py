@@ -0,0 +1,73 @@
+# Generated by Django 3.2 on 2026-10-18 16:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Names weigh more than emails. Emails are split into their words, so
+# `john.doe@example.com` is found by `doe` or `exam` as well. The trigger
+# covers every path that writes customers: the ORM, `bulk_upsert` and psql.
+CREATE_SEARCH_TRIGGER = """
+CREATE OR REPLACE FUNCTION order_customer_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.full_name, '')), 'A') ||
+        setweight(to_tsvector('simple', regexp_replace(
+            coalesce(NEW.email, ''), '[^[:alnum:]]+', ' ', 'g')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER order_customer_search_vector
+    BEFORE INSERT OR UPDATE OF full_name, email, search_vector ON order_customer
+    FOR EACH ROW EXECUTE PROCEDURE order_customer_search_vector();
+
+-- fills the existing rows through the trigger
+UPDATE order_customer SET search_vector = NULL;
+"""
+
+DROP_SEARCH_TRIGGER = """
+DROP TRIGGER IF EXISTS order_customer_search_vector ON order_customer;
+DROP FUNCTION IF EXISTS order_customer_search_vector();
+"""
+
+# Emails are searched through `search_vector` now, nothing reads the
+# `icontains` trigram index of 0004 any more. The one on names stays for
+# the typo matches.
+DROP_EMAIL_TRIGRAM_INDEX = """
+DROP INDEX IF EXISTS order_customer_email_trgm_idx;
+"""
+
+CREATE_EMAIL_TRIGRAM_INDEX = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS order_customer_email_trgm_idx
+            ON order_customer USING gin (UPPER(email::text) gin_trgm_ops);
+    END IF;
+END
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_order_status_notify'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_SEARCH_TRIGGER, DROP_SEARCH_TRIGGER),
+        migrations.RunSQL(DROP_EMAIL_TRIGRAM_INDEX, CREATE_EMAIL_TRIGRAM_INDEX),
+        # built after the backfill, in one pass
+        migrations.AddIndex(
+            model_name='customer',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='order_customer_search_idx'),
+        ),
+    ]
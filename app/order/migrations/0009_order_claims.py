@@ -0,0 +1,27 @@
+# Generated by Django 3.2 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0008_customer_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(status__in=['NEW', 'ACCEPTED']), fields=['created_at', 'id'], name='order_claimable_idx'),
+        ),
+    ]
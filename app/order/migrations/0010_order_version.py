@@ -0,0 +1,41 @@
+# Generated by Django 3.2 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+# Every change of an order moves it to a new version, whichever code path
+# (conditional API writes, bulk UPDATEs, claims, admin, psql) made it, so
+# writes conditional on the version can't miss one.
+CREATE_VERSION_TRIGGER = """
+CREATE OR REPLACE FUNCTION order_version_bump() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER order_version_bump
+    BEFORE UPDATE ON order_order
+    FOR EACH ROW EXECUTE PROCEDURE order_version_bump();
+"""
+
+DROP_VERSION_TRIGGER = """
+DROP TRIGGER IF EXISTS order_version_bump ON order_order;
+DROP FUNCTION IF EXISTS order_version_bump();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0009_order_claims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunSQL(CREATE_VERSION_TRIGGER, DROP_VERSION_TRIGGER),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2 on 2026-10-18 10:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Django can't create partitioned tables, so the table is made by hand and
+# the model describes it. The partition key has to be part of the primary
+# key. Monthly partitions are created as events for them are written, see
+# `OrderStatusEventQuerySet.ensure_partitions`; old ones can be detached and
+# dropped without touching the rest, and are created again for late events.
+CREATE_EVENT_TABLE = """
+CREATE TABLE order_orderstatusevent (
+    id bigserial NOT NULL,
+    order_id bigint NOT NULL,
+    status varchar(10) NOT NULL,
+    previous_status varchar(10) NULL,
+    changed_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, changed_at)
+) PARTITION BY RANGE (changed_at);
+
+CREATE INDEX order_status_event_order_idx ON order_orderstatusevent (order_id, changed_at);
+CREATE INDEX order_status_event_time_idx ON order_orderstatusevent (changed_at);
+"""
+
+DROP_EVENT_TABLE = """
+DROP TABLE IF EXISTS order_orderstatusevent;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0010_order_version'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_EVENT_TABLE, DROP_EVENT_TABLE),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderStatusEvent',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('status', models.CharField(choices=[('NEW', 'New order placed'), ('ACCEPTED', 'Order accepted by restaurant'), ('READY', 'Order ready for delivery'), ('SHIPPED', 'Order on its way to customer'), ('DELIVERED', 'Delivered')], max_length=10)),
+                        ('previous_status', models.CharField(blank=True, choices=[('NEW', 'New order placed'), ('ACCEPTED', 'Order accepted by restaurant'), ('READY', 'Order ready for delivery'), ('SHIPPED', 'Order on its way to customer'), ('DELIVERED', 'Delivered')], max_length=10, null=True)),
+                        ('changed_at', models.DateTimeField()),
+                        ('order', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='status_events', to='order.order')),
+                    ],
+                    options={
+                        'ordering': ('changed_at', 'id'),
+                    },
+                ),
+                migrations.AddIndex(
+                    model_name='orderstatusevent',
+                    index=models.Index(fields=['order', 'changed_at'], name='order_status_event_order_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='orderstatusevent',
+                    index=models.Index(fields=['changed_at'], name='order_status_event_time_idx'),
+                ),
+            ],
+        ),
+    ]
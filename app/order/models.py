@@ -1,6 +1,14 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, connections, models, router, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from psycopg2 import errorcodes
+
+from order.events import StatusChange, order_status_changed
 
 # Create your models here.
 
@@ -14,25 +22,314 @@ class Pizza(models.Model):
 
     class Meta:
         ordering = ("-created_at", )
+        indexes = [
+            models.Index(fields=['-created_at'], name='order_pizza_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return str(self.name)
 
 
+class CustomerQuerySet(models.QuerySet):
+    upsert_fields = ['id', 'full_name', 'email', 'created_at', 'updated_at']
+
+    def upsert(self, full_name, email):
+        """Get the customer with the given email or create it, atomically and
+        in one statement, relying on the unique index on `email`
+        """
+        customers = self.bulk_upsert([{'full_name': full_name, 'email': email}])
+        return customers[self.model.normalize_email(email)]
+
+    def bulk_upsert(self, customers):
+        """`upsert` for many customers with a single INSERT ... ON CONFLICT
+
+        Args:
+            customers (list): dicts with `full_name` and `email`
+
+        Returns:
+            dict: customers by their normalized email
+        """
+        model = self.model
+        now = timezone.now()
+
+        # ON CONFLICT can't touch the same row twice in one statement
+        rows = {}
+        for customer in customers:
+            email = model.normalize_email(customer['email'])
+            rows.setdefault(email, [customer['full_name'], email, now, now])
+        if not rows:
+            return {}
+
+        db = router.db_for_write(model)
+        with connections[db].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO "{model._meta.db_table}" '
+                f'(full_name, email, created_at, updated_at) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s)"] * len(rows))} '
+                f'ON CONFLICT (email) DO UPDATE SET updated_at = EXCLUDED.updated_at '
+                f'RETURNING {", ".join(self.upsert_fields)}',
+                [value for row in rows.values() for value in row],
+            )
+            instances = [
+                model.from_db(db, self.upsert_fields, row)
+                for row in cursor.fetchall()
+            ]
+
+        return {customer.email: customer for customer in instances}
+
+
 class Customer(models.Model):
     # information
     full_name = models.CharField(max_length=128)
-    email = models.EmailField()
+    email = models.EmailField(unique=True)
+    # name and email words, kept up to date by a database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CustomerQuerySet.as_manager()
+
     class Meta:
         ordering = ("-created_at", )
+        indexes = [
+            models.Index(fields=['-created_at'], name='order_customer_created_idx'),
+            GinIndex(fields=['search_vector'], name='order_customer_search_idx'),
+        ]
 
     def __str__(self) -> str:
         return str(self.full_name)
 
+    def clean(self):
+        self.email = self.normalize_email(self.email)
+
+    def save(self, *args, **kwargs):
+        self.email = self.normalize_email(self.email)
+        return super().save(*args, **kwargs)
+
+    @staticmethod
+    def normalize_email(email):
+        return (email or '').strip().lower()
+
+
+def get_assignments(model, values, connection):
+    """`SET` list and parameters of an UPDATE writing `values`, which are
+    keyed by field name as in `model(**values)`
+    """
+    instance = model(**values)
+    fields = [model._meta.get_field(name) for name in values]
+    return (
+        ', '.join(f'"{field.column}" = %s' for field in fields),
+        [field.get_db_prep_save(getattr(instance, field.attname), connection) for field in fields],
+    )
+
+
+class OrderQuerySet(models.QuerySet):
+    def set_status(self, pks, status):
+        """Move the given orders to `status` with one conditional UPDATE,
+        leaving alone those whose status can't be changed anymore
+
+        Returns:
+            list: ids of the orders that were changed
+        """
+        model = self.model
+        db = router.db_for_write(model)
+        now = timezone.now()
+        table = model._meta.db_table
+        with connections[db].cursor() as cursor:
+            # the locked rows give the status each order had before
+            cursor.execute(
+                f'WITH previous AS ('
+                f'SELECT id, status FROM "{table}" '
+                f'WHERE id = ANY(%s) AND NOT (status = ANY(%s)) '
+                f'FOR UPDATE) '
+                f'UPDATE "{table}" SET status = %s, updated_at = %s '
+                f'FROM previous WHERE "{table}".id = previous.id '
+                f'RETURNING "{table}".id, previous.status',
+                [
+                    list(pks),
+                    [str(value) for value in model.UNEDITABLE_STATUES],
+                    status,
+                    now,
+                ],
+            )
+            rows = cursor.fetchall()
+
+        order_status_changed.send(
+            sender=model,
+            changes=[StatusChange(pk, str(status), now, previous) for pk, previous in rows],
+            using=db,
+        )
+        return [pk for pk, previous in rows]
+
+    def claim(self, station, limit):
+        """Move the oldest `limit` orders waiting in the kitchen to ACCEPTED
+        on behalf of `station`, atomically.
+
+        Orders are `NEW` ones and those still ACCEPTED whose claim was
+        taken, or last renewed, more than `ORDER_CLAIM_LEASE` seconds ago,
+        see `renew_claims()`. Rows
+        locked by concurrent claims are skipped rather than waited for, so
+        every order is claimed by one station only and stations don't queue
+        up behind each other.
+
+        Returns:
+            list: ids of the claimed orders, oldest first
+        """
+        model = self.model
+        db = router.db_for_write(model)
+        now = timezone.now()
+        statuses = model.DeliveryStatuses
+        table = model._meta.db_table
+
+        # FOR UPDATE needs a transaction, the lock is held until it ends
+        with transaction.atomic(using=db):
+            claimable = self.using(db).filter(
+                models.Q(status=statuses.NEW)
+                | models.Q(
+                    status=statuses.ACCEPTED,
+                    claimed_at__lt=now - timedelta(seconds=settings.ORDER_CLAIM_LEASE),
+                )
+            ).order_by('created_at', 'id').select_for_update(skip_locked=True)
+            claimable = claimable.values('id', 'status', 'created_at')[:limit]
+            claimable_sql, claimable_params = claimable.query.get_compiler(db).as_sql()
+
+            with connections[db].cursor() as cursor:
+                cursor.execute(
+                    f'WITH claimable AS ({claimable_sql}) '
+                    f'UPDATE "{table}" SET status = %s, claimed_by = %s, claimed_at = %s, updated_at = %s '
+                    f'FROM claimable WHERE "{table}".id = claimable.id '
+                    f'RETURNING "{table}".id, claimable.status, claimable.created_at',
+                    [*claimable_params, statuses.ACCEPTED, station, now, now],
+                )
+                rows = sorted(cursor.fetchall(), key=lambda row: (row[2], row[0]))
+
+            order_status_changed.send(
+                sender=model,
+                changes=[
+                    StatusChange(pk, str(statuses.ACCEPTED), now, previous)
+                    for pk, previous, created_at in rows
+                ],
+                using=db,
+            )
+        return [pk for pk, previous, created_at in rows]
+
+    def renew_claims(self, station, pks):
+        """Restart the lease of those of the given orders `station` still
+        holds: ACCEPTED and claimed by it last, expired or not
+
+        Returns:
+            list: ids of the renewed orders
+        """
+        model = self.model
+        db = router.db_for_write(model)
+        table = model._meta.db_table
+        with connections[db].cursor() as cursor:
+            # a claim taking over an expired order first changes `claimed_by`
+            cursor.execute(
+                f'UPDATE "{table}" SET claimed_at = %s '
+                f'WHERE id = ANY(%s) AND status = %s AND claimed_by = %s '
+                f'RETURNING id',
+                [timezone.now(), list(pks), model.DeliveryStatuses.ACCEPTED, station],
+            )
+            return [pk for pk, in cursor.fetchall()]
+
+    def editable_condition(self, versions=None):
+        """WHERE clause matching orders that can still be changed and, unless
+        `versions` is `None`, are at one of `versions`
+
+        Returns:
+            tuple: SQL and its parameters
+        """
+        condition = 'NOT (status = ANY(%s))'
+        params = [[str(value) for value in self.model.UNEDITABLE_STATUES]]
+        if versions is not None:
+            condition += ' AND version = ANY(%s)'
+            params.append(list(versions))
+        return condition, params
+
+    def touch_editable(self, pk, versions=None):
+        """Bump `updated_at` of the order `pk` if it meets `editable_condition`,
+        which keeps it locked until the end of the transaction
+
+        Returns:
+            tuple: status and version of the order, `None` when it wasn't
+            touched
+        """
+        model = self.model
+        db = router.db_for_write(model)
+        condition, params = self.editable_condition(versions)
+        with connections[db].cursor() as cursor:
+            cursor.execute(
+                f'UPDATE "{model._meta.db_table}" SET updated_at = %s '
+                f'WHERE id = %s AND {condition} '
+                f'RETURNING status, version',
+                [timezone.now(), pk, *params],
+            )
+            return cursor.fetchone()
+
+    def update_editable(self, pk, values, versions=None):
+        """Write `values` to the order `pk` with one conditional UPDATE, see
+        `editable_condition`. Nothing stays locked after the statement, a
+        concurrent change just makes the condition fail.
+
+        Returns:
+            int: version the order is at now, `None` when it wasn't changed
+        """
+        model = self.model
+        db = router.db_for_write(model)
+        now = timezone.now()
+        table = model._meta.db_table
+        condition, condition_params = self.editable_condition(versions)
+        assignments, params = get_assignments(model, {**values, 'updated_at': now}, connections[db])
+
+        with connections[db].cursor() as cursor:
+            # the locked row gives the status the order had before
+            cursor.execute(
+                f'WITH previous AS ('
+                f'SELECT id, status FROM "{table}" '
+                f'WHERE id = %s AND {condition} '
+                f'FOR UPDATE) '
+                f'UPDATE "{table}" SET {assignments} '
+                f'FROM previous WHERE "{table}".id = previous.id '
+                f'RETURNING previous.status, "{table}".status, "{table}".version',
+                [pk, *condition_params, *params],
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+        previous, status, version = row
+        if status != previous:
+            order_status_changed.send(
+                sender=model,
+                changes=[StatusChange(int(pk), status, now, previous)],
+                using=db,
+            )
+        return version
+
+    def touch(self):
+        """Bump `updated_at`, e.g. after the order's items changed
+        """
+        return self.update(updated_at=timezone.now())
+
+    def with_details(self):
+        """Load the customer and the items with their pizzas up front,
+        so serializing a page of orders takes a fixed number of queries
+        """
+        return self.select_related('customer').defer(
+            'customer__search_vector'
+        ).prefetch_related(
+            self.items_prefetch()
+        )
+
+    @staticmethod
+    def items_prefetch():
+        return models.Prefetch(
+            'orderitem_set',
+            queryset=OrderItem.objects.select_related('pizza'),
+        )
+
 
 class Order(models.Model):
     class DeliveryStatuses(models.TextChoices):
@@ -53,16 +350,171 @@ class Order(models.Model):
 
     # information
     status = models.CharField(max_length=10, choices=DeliveryStatuses.choices)
+    # kitchen station that claimed the order, see `OrderQuerySet.claim`
+    claimed_by = models.CharField(max_length=64, blank=True, default='', editable=False)
+    claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # bumped by a database trigger on every UPDATE of the row, items
+    # changes included as they touch the order, see `update_editable`
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ("-created_at", )
+        indexes = [
+            # status filter sorted by the default ordering
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            # default ordering, with `id` as the keyset pagination tie-breaker
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            # status feed catch-up after `Last-Event-ID`
+            models.Index(fields=['updated_at', 'id'], name='order_updated_id_idx'),
+            # kitchen work queue, oldest first
+            models.Index(
+                fields=['created_at', 'id'], name='order_claimable_idx',
+                condition=models.Q(status__in=['NEW', 'ACCEPTED']),
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.customer}'s Order ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # compared on save to tell status changes from other updates
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    @property
+    def status_change(self):
+        return StatusChange(self.pk, str(self.status), self.updated_at)
+
+
+class OrderItemQuerySet(models.QuerySet):
+    def apply(self, order_id, quantities, replace=True):
+        """Bring the items of the order `order_id` to `quantities`, with at
+        most one INSERT, one UPDATE and one DELETE. Items of the same pizza
+        and size are merged into the oldest one.
+
+        Args:
+            quantities (dict): count by `(pizza_id, size)`, 0 for no item
+            replace (bool): whether items missing from `quantities` go too
+
+        Returns:
+            list: items of the order, oldest first
+        """
+        current = {}
+        deleted = []
+        for item in self.filter(order_id=order_id).order_by('id'):
+            key = (item.pizza_id, item.size)
+            if key in current:
+                deleted.append(item.pk)
+            else:
+                current[key] = item
+
+        created = []
+        updated = []
+        kept = []
+        for (pizza_id, size), count in quantities.items():
+            item = current.pop((pizza_id, size), None)
+            if not count:
+                if item is not None:
+                    deleted.append(item.pk)
+            elif item is None:
+                created.append(self.model(order_id=order_id, pizza_id=pizza_id, size=size, count=count))
+            elif item.count != count:
+                item.count = count
+                updated.append(item)
+            else:
+                kept.append(item)
+
+        # the items not mentioned
+        if replace:
+            deleted += [item.pk for item in current.values()]
+        else:
+            kept += current.values()
+
+        if created:
+            self.bulk_create(created)
+        if updated:
+            self.bulk_update(updated, ['count'])
+        if deleted:
+            self.filter(pk__in=deleted).delete()
+
+        return sorted([*kept, *updated, *created], key=lambda item: item.pk)
+
+    def update_editable(self, order_id, pk, values, versions=None):
+        """Write `values` to the item `pk` of the order `order_id` and touch
+        the order, in one statement conditional on the order, see
+        `OrderQuerySet.editable_condition`
+
+        Returns:
+            tuple: the item, status and version of the order, `None` when
+            nothing was changed
+        """
+        model = self.model
+        db = router.db_for_write(model)
+        table = model._meta.db_table
+        touched, touched_params = self.touched_order(order_id, pk, versions)
+        assignments, params = get_assignments(model, values, connections[db])
+        # an empty PATCH changes nothing but is still conditional
+        assignments = assignments or f'id = "{table}".id'
+        columns = ', '.join(f'"{table}"."{field.column}"' for field in model._meta.concrete_fields)
+
+        with connections[db].cursor() as cursor:
+            cursor.execute(
+                f'{touched} '
+                f'UPDATE "{table}" SET {assignments} '
+                f'FROM touched WHERE "{table}".id = %s AND "{table}".order_id = touched.id '
+                f'RETURNING {columns}, touched.status, touched.version',
+                [*touched_params, *params, pk],
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+        item = model.from_db(db, [field.attname for field in model._meta.concrete_fields], row[:-2])
+        return (item, *row[-2:])
+
+    def delete_editable(self, order_id, pk, versions=None):
+        """`update_editable` deleting the item
+
+        Returns:
+            tuple: status and version of the order, `None` when nothing was
+            deleted
+        """
+        model = self.model
+        db = router.db_for_write(model)
+        table = model._meta.db_table
+        touched, touched_params = self.touched_order(order_id, pk, versions)
+
+        with connections[db].cursor() as cursor:
+            cursor.execute(
+                f'{touched} '
+                f'DELETE FROM "{table}" USING touched '
+                f'WHERE "{table}".id = %s AND "{table}".order_id = touched.id '
+                f'RETURNING touched.status, touched.version',
+                [*touched_params, pk],
+            )
+            return cursor.fetchone()
+
+    def touched_order(self, order_id, pk, versions):
+        """`touched` CTE bumping the order `order_id`, if it has the item `pk`
+        and meets `OrderQuerySet.editable_condition`
+        """
+        condition, params = Order.objects.editable_condition(versions)
+        return (
+            f'WITH touched AS ('
+            f'UPDATE "{Order._meta.db_table}" SET updated_at = %s '
+            f'WHERE id = %s AND {condition} '
+            f'AND EXISTS (SELECT 1 FROM "{self.model._meta.db_table}" WHERE id = %s AND order_id = %s) '
+            f'RETURNING id, status, version)',
+            [timezone.now(), order_id, *params, pk, order_id],
+        )
+
 
 class OrderItem(models.Model):
     class Sizes(models.TextChoices):
@@ -75,5 +527,141 @@ class OrderItem(models.Model):
     size = models.CharField(choices=Sizes.choices, max_length=6)
     count = models.PositiveIntegerField(default=1)
 
+    objects = OrderItemQuerySet.as_manager()
+
     def __str__(self) -> str:
         return f'{self.order}: {self.pizza} - {self.size} ({self.count})'
+
+
+def month_start(moment):
+    """First instant of the UTC month of `moment`
+    """
+    return moment.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+# months known to have a partition of `OrderStatusEvent`, per process
+known_partitions = set()
+
+
+def forget_partitions():
+    """Have the partitions of `OrderStatusEvent` looked up again on the next
+    write, once some were detached or dropped
+    """
+    known_partitions.clear()
+
+
+class OrderStatusEventQuerySet(models.QuerySet):
+
+    def append(self, changes):
+        """Write `changes` (list of `StatusChange`) with one INSERT per batch,
+        creating the monthly partitions they go to first
+        """
+        db = router.db_for_write(self.model)
+        months = {month_start(change.updated_at) for change in changes}
+        self.ensure_partitions(months, db)
+        try:
+            with transaction.atomic(using=db):
+                return self.insert(changes, db)
+        except IntegrityError as exc:
+            if getattr(exc.__cause__, 'pgcode', None) != errorcodes.CHECK_VIOLATION:
+                raise
+            # a partition known here was detached since
+            forget_partitions()
+            self.ensure_partitions(months, db)
+            return self.insert(changes, db)
+
+    def insert(self, changes, db):
+        model = self.model
+        return self.using(db).bulk_create([
+            model(
+                order_id=change.order_id,
+                status=change.status,
+                previous_status=change.previous_status,
+                changed_at=change.updated_at,
+            )
+            for change in changes
+        ], batch_size=settings.ORDER_STATUS_HISTORY_BATCH_SIZE)
+
+    def ensure_partitions(self, months, db):
+        missing = sorted(set(months) - known_partitions)
+        if not missing:
+            return
+
+        table = self.model._meta.db_table
+        with transaction.atomic(using=db), connections[db].cursor() as cursor:
+            # IF NOT EXISTS doesn't stop concurrent creations from colliding
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [table])
+            for month in missing:
+                next_month = month_start(month + timedelta(days=32))
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{table}_p{month:%Y_%m}" '
+                    f'PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s)',
+                    [month, next_month],
+                )
+        transaction.on_commit(lambda: known_partitions.update(missing), using=db)
+
+    def durations(self, since, until):
+        """Percentiles of the time orders stayed in each status, counting the
+        stays that began between `since` and `until` and have ended since
+
+        Returns:
+            dict: `count`, `p50`, `p95` and `p99` in seconds, by status
+        """
+        db = router.db_for_read(self.model)
+        with connections[db].cursor() as cursor:
+            # a stay ends with the order's next event, which may be after `until`
+            cursor.execute(
+                f'SELECT status, count(*), '
+                f'percentile_cont(ARRAY[0.5, 0.95, 0.99]) WITHIN GROUP (ORDER BY seconds) '
+                f'FROM ('
+                f'SELECT status, changed_at, EXTRACT(EPOCH FROM '
+                f'lead(changed_at) OVER (PARTITION BY order_id ORDER BY changed_at, id) - changed_at'
+                f') AS seconds '
+                f'FROM "{self.model._meta.db_table}" WHERE changed_at >= %s'
+                f') AS stays '
+                f'WHERE changed_at < %s AND seconds IS NOT NULL '
+                f'GROUP BY status',
+                [since, until],
+            )
+            rows = {status: (count, percentiles) for status, count, percentiles in cursor.fetchall()}
+
+        return {
+            status: {
+                'count': rows[status][0],
+                **{
+                    name: round(value, 3)
+                    for name, value in zip(('p50', 'p95', 'p99'), rows[status][1])
+                },
+            }
+            for status in Order.DeliveryStatuses.values if status in rows
+        }
+
+
+class OrderStatusEvent(models.Model):
+    """Append-only log of the status changes of orders, see `order.history`.
+
+    The table is partitioned by month of `changed_at`, so old months can be
+    dropped or archived as whole tables, see migration 0011. Events outlive
+    their orders.
+    """
+    order = models.ForeignKey(
+        'Order', on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        related_name='status_events')
+    status = models.CharField(max_length=10, choices=Order.DeliveryStatuses.choices)
+    # `None` for new orders
+    previous_status = models.CharField(
+        max_length=10, choices=Order.DeliveryStatuses.choices, null=True, blank=True)
+    changed_at = models.DateTimeField()
+
+    objects = OrderStatusEventQuerySet.as_manager()
+
+    class Meta:
+        ordering = ("changed_at", "id")
+        indexes = [
+            # history of an order, and stays ordered per order
+            models.Index(fields=['order', 'changed_at'], name='order_status_event_order_idx'),
+            models.Index(fields=['changed_at'], name='order_status_event_time_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'Order #{self.order_id}: {self.previous_status} -> {self.status}'
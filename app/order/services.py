@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, Value, When
+from django.db.models.functions import Lower, Trim
+
+
+def merge_duplicate_customers(customer_model, order_model, batch_size=500):
+    """Collapse customers sharing a normalized email into the newest of them.
+
+    Orders of the duplicates are repointed to the kept customer, then the
+    duplicates are removed, `batch_size` emails per transaction so large
+    tables are not locked for the whole run. Remaining emails are stored in
+    their normalized form afterwards.
+
+    Models are passed in so migrations can run it with historical models.
+
+    Returns:
+        int: number of removed duplicate customers
+    """
+    normalized_email = Lower(Trim('email'))
+    duplicated_emails = (
+        customer_model.objects
+        .annotate(normalized_email=normalized_email)
+        .values('normalized_email')
+        .annotate(rows=Count('id'), keep_id=Max('id'))
+        .filter(rows__gt=1)
+        .order_by('normalized_email')
+    )
+
+    removed = 0
+    while True:
+        batch = {
+            group['normalized_email']: group['keep_id']
+            for group in duplicated_emails[:batch_size]
+        }
+        if not batch:
+            break
+
+        duplicates = (
+            customer_model.objects
+            .annotate(normalized_email=normalized_email)
+            .filter(normalized_email__in=batch.keys())
+            .exclude(pk__in=batch.values())
+            .values_list('pk', 'normalized_email')
+        )
+        replacements = {pk: batch[email] for pk, email in duplicates}
+
+        with transaction.atomic(using=customer_model.objects.db):
+            order_model.objects.filter(customer_id__in=replacements).update(
+                customer_id=Case(
+                    *[When(customer_id=duplicate_id, then=Value(keep_id))
+                      for duplicate_id, keep_id in replacements.items()],
+                    output_field=IntegerField(),
+                )
+            )
+            customer_model.objects.filter(pk__in=replacements).delete()
+        removed += len(replacements)
+
+    not_normalized = (
+        customer_model.objects
+        .annotate(normalized_email=normalized_email)
+        .exclude(email=normalized_email)
+    )
+    while True:
+        pks = list(not_normalized.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        customer_model.objects.filter(pk__in=pks).update(email=normalized_email)
+
+    return removed
@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from order.api.cache import order_list_cache, pizza_cache
+from order.events import order_status_changed
+from order.history import status_history
+from order.models import Order, Pizza
+
+
+@receiver([post_save, post_delete], sender=Pizza)
+def invalidate_pizza_cache(sender, **kwargs):
+    # after commit, so no request can cache the old rows again in between
+    transaction.on_commit(pizza_cache.invalidate)
+    # orders embed pizza names
+    transaction.on_commit(order_list_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_lists(sender, instance, **kwargs):
+    status = instance.__dict__.get('status')
+    # all of them when the status wasn't loaded
+    statuses = None if status is None else [status]
+    transaction.on_commit(lambda: order_list_cache.invalidate(statuses))
+
+
+@receiver(order_status_changed)
+def invalidate_changed_order_lists(sender, changes, **kwargs):
+    statuses = {
+        status for change in changes
+        for status in (change.status, change.previous_status)
+    }
+    transaction.on_commit(lambda: order_list_cache.invalidate(statuses))
+
+
+@receiver(order_status_changed)
+def record_status_history(sender, changes, using, **kwargs):
+    transaction.on_commit(lambda: status_history.add(changes), using=using)
+
+
+@receiver(post_save, sender=Order)
+def send_order_status_changed(sender, instance, created, using, update_fields=None, **kwargs):
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    if 'status' not in instance.__dict__:
+        return
+    if not created and instance.status == getattr(instance, '_loaded_status', None):
+        return
+
+    change = instance.status_change._replace(
+        previous_status=None if created else getattr(instance, '_loaded_status', None))
+    instance._loaded_status = instance.status
+    order_status_changed.send(sender=sender, changes=[change], using=using)
@@ -1,11 +1,58 @@
+import asyncio
+import csv
+import datetime
+import decimal
+import functools
+import io
+import json
 import random
+import select
+import threading
+import time
+from unittest import mock
 
-from django.urls import reverse
+import psycopg2
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery
+from django.core.cache import cache, caches
+from django.db import OperationalError, connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
 from rest_framework import serializers, status
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APITestCase, APIRequestFactory
 
-from .models import Pizza, Order, OrderItem, Customer
+from app.db.base import DatabaseWrapper
+from app.db.pool import ConnectionPool, PoolTimeout
+from app.db.routers import replicas
+from app.timing import QueryBudgetExceeded
+from .models import (
+    Pizza, Order, OrderItem, OrderQuerySet, OrderStatusEvent, Customer, forget_partitions, known_partitions,
+    month_start,
+)
+from .api.cache import order_list_cache
+from .api.filters import CustomerSearchFilter
+from .api import compiled
+from .api.compiled import CompiledSerializerMixin, compile_representation
+from .api.renderers import ORJSONRenderer
 from .api.serializers import PizzaSerializer, OrderSerializerBase, OrderReadSerializer, OrderItemReadSerializer
+from .api.viewsets import OrderViewSet
+from .benchmarks.runner import Runner
+from .benchmarks.scenarios import SCENARIOS
+from .benchmarks.seed import Seeder
+from .broker import PostgresBroker
+from .events import StatusChange
+from .history import status_history
+from .services import merge_duplicate_customers
 # Create your tests here.
 
 FLAVORS = ("margarita", "marinara", "salami")
@@ -14,6 +61,7 @@ FLAVORS = ("margarita", "marinara", "salami")
 class PizzaViewSetTestCase(APITestCase):
 
     def setUp(self) -> None:
+        cache.clear()
         self.pizzas = [
             Pizza.objects.create(
                 name=flavor
@@ -40,10 +88,48 @@ class PizzaViewSetTestCase(APITestCase):
         self.assertEqual(response.data, serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_pizza_list_cached(self):
+        list_url = reverse('order:pizza-list')
+        response = self.client.get(list_url)
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(list_url)
+
+        self.assertEqual(cached_response.data, response.data)
+        self.assertEqual(cached_response['ETag'], response['ETag'])
+        self.assertIn('max-age', cached_response['Cache-Control'])
 
+    def test_pizza_not_modified(self):
+        detail_url = reverse('order:pizza-detail', args=[self.pizzas[0].id])
+        etag = self.client.get(detail_url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_pizza_cache_invalidated_on_write(self):
+        list_url = reverse('order:pizza-list')
+        detail_url = reverse('order:pizza-detail', args=[self.pizzas[0].id])
+        etag = self.client.get(list_url)['ETag']
+        self.client.get(detail_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Pizza.objects.filter(pk=self.pizzas[0].id).get().delete()
+
+        response = self.client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data.get('count'), len(self.pizzas) - 1)
+        self.assertEqual(
+            self.client.get(detail_url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+@mock.patch.object(order_list_cache, 'timeout', 0)
 class OrderViewSetTestCase(APITestCase):
 
     def setUp(self) -> None:
+        cache.clear()
         self.pizzas = [
             Pizza.objects.create(
                 name=flavor
@@ -51,9 +137,9 @@ class OrderViewSetTestCase(APITestCase):
         ]
         self.orders = self.setup_dummy_orders()
 
-    def setup_dummy_orders(self):
+    def setup_dummy_orders(self, first=1):
         orders = []
-        for n in range(1, 5):
+        for n in range(first, first + 4):
             customer = Customer.objects.create(
                 full_name=f"John #{n}", email=f"john_{n}@example.com")
             order = Order.objects.create(customer=customer)
@@ -78,6 +164,238 @@ class OrderViewSetTestCase(APITestCase):
         self.assertEqual(response.data.get('results'), serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_order_list_query_count(self):
+        list_url = reverse('order:order-list')
+        # the first request also asks the planner for a row estimate
+        self.client.get(list_url)
+
+        # count, orders with customers, items with pizzas
+        with self.assertNumQueries(3):
+            self.client.get(list_url)
+
+        self.setup_dummy_orders(first=5)
+        with self.assertNumQueries(3):
+            response = self.client.get(list_url)
+
+        self.assertEqual(response.data.get('count'), 8)
+
+    def test_order_detail_query_count(self):
+        detail_url = reverse('order:order-detail', args=[self.orders[0].id])
+
+        # validators, order with customer, items with pizzas
+        with self.assertNumQueries(3):
+            self.client.get(detail_url)
+
+    def test_order_list_sparse_fields(self):
+        list_url = reverse('order:order-list')
+        params = {'fields': 'id,status,updated_at'}
+        self.client.get(list_url, params)
+
+        # count, orders
+        with self.assertNumQueries(2), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(list_url, params)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order = Order.objects.get(pk=response.data['results'][0]['id'])
+        self.assertEqual(response.data['results'][0], {
+            'id': order.pk,
+            'status': order.status,
+            'updated_at': serializers.DateTimeField().to_representation(order.updated_at),
+        })
+        self.assertNotIn('order_customer', queries[-1]['sql'])
+        self.assertNotIn('"order_order"."customer_id"', queries[-1]['sql'])
+
+    def test_order_list_relations_as_ids(self):
+        list_url = reverse('order:order-list')
+        params = {'fields': 'id,customer,items'}
+        self.client.get(list_url, params)
+
+        # count, orders, item ids
+        with self.assertNumQueries(3):
+            response = self.client.get(list_url, params)
+
+        order = Order.objects.get(pk=response.data['results'][0]['id'])
+        self.assertEqual(response.data['results'][0]['customer'], order.customer_id)
+        self.assertEqual(
+            sorted(response.data['results'][0]['items']),
+            sorted(order.orderitem_set.values_list('pk', flat=True)),
+        )
+
+    def test_order_detail_expand(self):
+        order = self.orders[0]
+        detail_url = reverse('order:order-detail', args=[order.id])
+        full = self.client.get(detail_url).data
+
+        # validators, order with customer, items with pizzas
+        with self.assertNumQueries(3):
+            response = self.client.get(detail_url, {
+                'fields': 'customer.email,items',
+                'expand': 'items.pizza',
+            })
+
+        self.assertEqual(response.data, {
+            'customer': {'email': full['customer']['email']},
+            'items': full['items'],
+        })
+
+        response = self.client.get(detail_url, {'fields': 'items', 'expand': 'items'})
+        self.assertEqual(response.data['items'], [
+            {**item, 'pizza': item['pizza']['id']} for item in full['items']
+        ])
+
+    def test_order_list_unknown_fields(self):
+        list_url = reverse('order:order-list')
+        response = self.client.get(list_url, {'fields': 'id,total', 'expand': 'status'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'fields', 'expand'})
+
+    def test_order_list_cursor_pagination(self):
+        list_url = reverse('order:order-list')
+        expected = list(
+            Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+        response = self.client.get(list_url, {'pagination': 'cursor', 'limit': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data.get('previous'))
+
+        ids = [order['id'] for order in response.data.get('results')]
+        next_url = response.data.get('next')
+        while next_url:
+            response = self.client.get(next_url)
+            ids += [order['id'] for order in response.data.get('results')]
+            next_url = response.data.get('next')
+
+        self.assertEqual(ids, expected)
+
+        response = self.client.get(response.data.get('previous'))
+        self.assertEqual(
+            [order['id'] for order in response.data.get('results')],
+            expected[:3]
+        )
+
+    def test_order_list_cursor_pagination_ties(self):
+        Order.objects.update(created_at=self.orders[0].created_at)
+        list_url = reverse('order:order-list')
+
+        response = self.client.get(list_url, {'pagination': 'cursor', 'limit': 2})
+        first_page = [order['id'] for order in response.data.get('results')]
+        response = self.client.get(response.data.get('next'))
+        second_page = [order['id'] for order in response.data.get('results')]
+
+        self.assertEqual(
+            first_page + second_page,
+            sorted([order.id for order in self.orders], reverse=True)
+        )
+
+    def test_order_list_invalid_cursor(self):
+        list_url = reverse('order:order-list')
+        response = self.client.get(list_url, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_order_list_exact_count(self):
+        list_url = reverse('order:order-list')
+        response = self.client.get(list_url)
+
+        self.assertEqual(response.data.get('count'), len(self.orders))
+        self.assertTrue(response.data.get('count_is_exact'))
+
+    @override_settings(PAGINATION_EXACT_COUNT_THRESHOLD=0)
+    def test_order_list_estimated_count(self):
+        list_url = reverse('order:order-list')
+        response = self.client.get(list_url, {'limit': 2})
+
+        self.assertFalse(response.data.get('count_is_exact'))
+        self.assertGreaterEqual(response.data.get('count'), 2)
+
+        # estimate is cached, so no EXPLAIN and no COUNT(*) this time
+        with self.assertNumQueries(2):
+            response = self.client.get(list_url, {'limit': 2, 'offset': 1})
+
+        # and revalidating takes the page alone
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(
+                list_url, {'limit': 2, 'offset': 1}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # a short last page reveals the exact count
+        response = self.client.get(list_url, {'limit': 2, 'offset': 3})
+        self.assertEqual(response.data.get('count'), len(self.orders))
+        self.assertTrue(response.data.get('count_is_exact'))
+
+    @override_settings(PAGINATION_EXACT_COUNT_THRESHOLD=0)
+    def test_order_list_estimated_count_past_the_end(self):
+        list_url = reverse('order:order-list')
+        with mock.patch('order.api.pagination.estimate_count', return_value=1000):
+            response = self.client.get(list_url, {'limit': 2, 'offset': 10})
+
+        self.assertEqual(response.data.get('results'), [])
+        self.assertEqual(response.data.get('count'), 10)
+        self.assertFalse(response.data.get('count_is_exact'))
+        self.assertIsNone(response.data.get('next'))
+
+    def test_order_detail_not_modified(self):
+        detail_url = reverse('order:order-detail', args=[self.orders[0].id])
+        response = self.client.get(detail_url)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(detail_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        not_modified = self.client.get(
+            detail_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_order_list_not_modified(self):
+        list_url = reverse('order:order-list')
+        etag = self.client.get(list_url)['ETag']
+
+        # count and the page, without their items
+        with self.assertNumQueries(2):
+            response = self.client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # other filters are other representations
+        response = self.client.get(
+            list_url, {'status': Order.DeliveryStatuses.NEW.value}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        Order.objects.filter(pk=self.orders[0].id).delete()
+        response = self.client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_order_list_order_leaving_filter(self):
+        list_url = reverse('order:order-list')
+        Order.objects.set_status([self.orders[0].id, self.orders[1].id], Order.DeliveryStatuses.READY)
+        params = {'status': Order.DeliveryStatuses.READY.value}
+        response = self.client.get(list_url, params)
+        self.assertEqual(response.data['count'], 2)
+        self.assertNotIn('Last-Modified', response)
+
+        Order.objects.set_status([self.orders[0].id], Order.DeliveryStatuses.SHIPPED)
+
+        response = self.client.get(list_url, params, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+
+    def test_order_etag_changes_with_items(self):
+        order = self.orders[0]
+        detail_url = reverse('order:order-detail', args=[order.id])
+        etag = self.client.get(detail_url)['ETag']
+
+        item = order.orderitem_set.first()
+        item_url = reverse('order:order-items-detail', args=[order.id, item.id])
+        self.client.patch(item_url, data={"count": item.count + 1}, format='json')
+
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
     def test_order_detail(self):
         pk = self.orders[0].id
         detail_url = reverse('order:order-detail', args=[pk])
@@ -114,6 +432,145 @@ class OrderViewSetTestCase(APITestCase):
         self.assertEqual(response.data, serializer.data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def post_order(self, items):
+        return self.client.post(
+            reverse('order:order-list'),
+            data={
+                "customer": {
+                    "full_name": "John Doe",
+                    "email": "john@example.com"
+                },
+                "items": items,
+            },
+            format='json'
+        )
+
+    def test_orders_create_query_count(self):
+        item = {"pizza": self.pizzas[0].id, "size": "S", "count": 1}
+
+        with CaptureQueriesContext(connection) as single_item:
+            self.post_order([item])
+        with CaptureQueriesContext(connection) as many_items:
+            response = self.post_order([
+                {"pizza": pizza.id, "size": size, "count": 1}
+                for pizza in self.pizzas
+                for size in [x.value for x in OrderItem.Sizes]
+            ])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data.get('items')), 9)
+        self.assertEqual(len(single_item), len(many_items))
+
+    def test_orders_create_merges_items(self):
+        margarita, marinara = self.pizzas[0].id, self.pizzas[1].id
+        response = self.post_order([
+            {"pizza": margarita, "size": "S", "count": 1},
+            {"pizza": marinara, "size": "S", "count": 1},
+            {"pizza": margarita, "size": "L", "count": 1},
+            {"pizza": margarita, "size": "S", "count": 2},
+        ])
+
+        order = Order.objects.get(pk=response.data.get('id'))
+        self.assertEqual(
+            sorted(order.orderitem_set.values_list('pizza_id', 'size', 'count')),
+            sorted([(margarita, 'S', 3), (marinara, 'S', 1), (margarita, 'L', 1)])
+        )
+
+    def test_orders_create_invalid_pizza(self):
+        orders_count = Order.objects.count()
+        response = self.post_order([
+            {"pizza": self.pizzas[0].id, "size": "S", "count": 1},
+            {"pizza": 0xdead, "size": "S", "count": 1},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['items'][0], {})
+        self.assertIn('pizza', response.data['items'][1])
+        self.assertEqual(Order.objects.count(), orders_count)
+
+    def test_orders_create_returning_customer(self):
+        item = {"pizza": self.pizzas[0].id, "size": "S", "count": 1}
+        first = self.post_order([item])
+        self.client.post(
+            reverse('order:order-list'),
+            data={
+                "customer": {
+                    "full_name": "John Doe",
+                    "email": " John@Example.com"
+                },
+                "items": [item],
+            },
+            format='json'
+        )
+
+        customer = Order.objects.get(pk=first.data.get('id')).customer
+        self.assertEqual(customer.email, "john@example.com")
+        self.assertEqual(customer.orders.count(), 2)
+        self.assertEqual(
+            Customer.objects.filter(email="john@example.com").count(), 1)
+
+    def build_bulk_orders(self, count):
+        return [
+            {
+                "customer": {
+                    "full_name": f"Jane #{n}",
+                    "email": f"jane_{n % 3}@example.com"
+                },
+                "items": [
+                    {"pizza": pizza.id, "size": "M", "count": 2}
+                    for pizza in self.pizzas
+                ],
+            }
+            for n in range(count)
+        ]
+
+    def test_orders_bulk_create(self):
+        bulk_url = reverse('order:order-bulk-create')
+        orders = self.build_bulk_orders(3)
+        orders.insert(1, {"customer": orders[0]["customer"], "items": [
+            {"pizza": 0xdead, "size": "M", "count": 1}
+        ]})
+
+        response = self.client.post(bulk_url, data=orders, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data.get('created'), 3)
+        self.assertEqual(response.data.get('failed'), 1)
+
+        results = response.data.get('results')
+        self.assertEqual(
+            [result['status'] for result in results], [201, 400, 201, 201])
+        self.assertIn('items', results[1]['errors'])
+
+        created = Order.objects.filter(pk__in=[results[i]['id'] for i in (0, 2, 3)])
+        self.assertEqual(created.count(), 3)
+        for order in created:
+            self.assertEqual(order.status, Order.DeliveryStatuses.NEW)
+            self.assertEqual(order.orderitem_set.count(), len(self.pizzas))
+
+    def test_orders_bulk_create_query_count(self):
+        bulk_url = reverse('order:order-bulk-create')
+
+        with CaptureQueriesContext(connection) as small_batch:
+            response = self.client.post(
+                bulk_url, data=self.build_bulk_orders(2), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with CaptureQueriesContext(connection) as large_batch:
+            response = self.client.post(
+                bulk_url, data=self.build_bulk_orders(30), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(len(small_batch), len(large_batch))
+        self.assertEqual(
+            Customer.objects.filter(email__startswith='jane_').count(), 3)
+
+    def test_orders_bulk_create_invalid_payload(self):
+        bulk_url = reverse('order:order-bulk-create')
+        response = self.client.post(bulk_url, data={}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_orders_update(self):
         pk = self.orders[0].id
         update_url = reverse('order:order-detail', args=[pk, ])
@@ -130,6 +587,158 @@ class OrderViewSetTestCase(APITestCase):
                          Order.DeliveryStatuses.ACCEPTED.value)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_orders_put(self):
+        order = self.orders[0]
+        detail_url = reverse('order:order-detail', args=[order.id])
+        data = self.client.get(detail_url).json()
+        items = list(order.orderitem_set.values_list('pizza_id', 'size', 'count'))
+
+        data['status'] = Order.DeliveryStatuses.ACCEPTED.value
+        data['customer'] = {"full_name": "Someone Else", "email": "else@example.com"}
+        data['items'] = [{"pizza": self.pizzas[0].id, "size": "S", "count": 9}]
+        response = self.client.put(detail_url, data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], Order.DeliveryStatuses.ACCEPTED.value)
+        # only the status can be changed
+        customer_id = order.customer_id
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.DeliveryStatuses.ACCEPTED)
+        self.assertEqual(order.customer_id, customer_id)
+        self.assertEqual(list(order.orderitem_set.values_list('pizza_id', 'size', 'count')), items)
+
+        response = self.client.put(detail_url, data={}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('status', response.data)
+
+    def test_orders_update_ignores_customer_and_items(self):
+        order = self.orders[0]
+        detail_url = reverse('order:order-detail', args=[order.id])
+
+        for data in ({"customer": {"full_name": "Someone Else", "email": "else@example.com"}},
+                     {"items": [{"pizza": self.pizzas[0].id, "size": "S", "count": 9}]}):
+            response = self.client.patch(detail_url, data=data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(Customer.objects.filter(email="else@example.com").count(), 0)
+        self.assertFalse(order.orderitem_set.filter(count=9).exists())
+
+    def test_orders_bulk_status(self):
+        bulk_status_url = reverse('order:order-bulk-status')
+        delivered = self.orders[-1]
+        delivered.status = Order.DeliveryStatuses.DELIVERED
+        delivered.save(update_fields=['status'])
+        ids = [order.id for order in self.orders] + [0xdead]
+
+        with self.assertNumQueries(1):
+            response = self.client.post(bulk_status_url, data={
+                "ids": ids,
+                "status": Order.DeliveryStatuses.READY.value,
+            }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data.get('changed'), ids[:-2])
+        self.assertEqual(response.data.get('refused'), [delivered.id, 0xdead])
+        self.assertEqual(
+            Order.objects.filter(status=Order.DeliveryStatuses.READY).count(), 3)
+
+    def test_orders_bulk_status_invalid(self):
+        bulk_status_url = reverse('order:order-bulk-status')
+        response = self.client.post(bulk_status_url, data={
+            "ids": [self.orders[0].id],
+            "status": "EATEN",
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_orders_export_ndjson(self):
+        export_url = reverse('order:order-export')
+        response = self.client.get(export_url, {'format': 'ndjson'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        exported = [json.loads(line) for line in lines]
+        serializer = OrderReadSerializer(Order.objects.all(), many=True)
+        self.assertEqual(exported, json.loads(json.dumps(serializer.data)))
+
+    @mock.patch.object(OrderViewSet, 'export_chunk_size', 3)
+    def test_orders_export_csv(self):
+        export_url = reverse('order:order-export')
+        accepted = self.orders[0]
+        accepted.status = Order.DeliveryStatuses.ACCEPTED
+        accepted.save(update_fields=['status'])
+
+        response = self.client.get(export_url, {'format': 'csv'})
+        rows = list(csv.DictReader(io.StringIO(
+            b''.join(response.streaming_content).decode())))
+
+        self.assertEqual(len(rows), OrderItem.objects.count())
+        self.assertEqual(
+            {int(row['id']) for row in rows},
+            {order.id for order in self.orders}
+        )
+        self.assertIn('customer.email', rows[0])
+        self.assertIn('items.pizza.name', rows[0])
+
+        response = self.client.get(export_url, {
+            'format': 'csv',
+            'status': Order.DeliveryStatuses.ACCEPTED.value,
+        })
+        rows = list(csv.DictReader(io.StringIO(
+            b''.join(response.streaming_content).decode())))
+        self.assertEqual({int(row['id']) for row in rows}, {accepted.id})
+
+    def test_orders_update_if_match(self):
+        detail_url = reverse('order:order-detail', args=[self.orders[0].id])
+        etag = self.client.get(detail_url)['ETag']
+
+        with self.assertNumQueries(3):
+            response = self.client.patch(
+                detail_url, data={"status": Order.DeliveryStatuses.ACCEPTED.value},
+                format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data.get('version'), 2)
+        self.assertEqual(response['ETag'], self.client.get(detail_url)['ETag'])
+
+        # somebody else's change in between
+        response = self.client.patch(
+            detail_url, data={"status": Order.DeliveryStatuses.READY.value},
+            format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Order.objects.get(pk=self.orders[0].id).status, Order.DeliveryStatuses.ACCEPTED)
+
+        for if_match in ('*', f'"1", {etag}, "3"'):
+            response = self.client.patch(
+                detail_url, data={"status": Order.DeliveryStatuses.READY.value},
+                format='json', HTTP_IF_MATCH=if_match)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.patch(
+            detail_url, data={"status": Order.DeliveryStatuses.READY.value},
+            format='json', HTTP_IF_MATCH='"not a version"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+    def test_orders_update_delivered_meanwhile(self):
+        detail_url = reverse('order:order-detail', args=[self.orders[0].id])
+        etag = self.client.get(detail_url)['ETag']
+        Order.objects.set_status([self.orders[0].id], Order.DeliveryStatuses.DELIVERED)
+
+        for headers in ({'HTTP_IF_MATCH': etag}, {}):
+            response = self.client.patch(
+                detail_url, data={"status": Order.DeliveryStatuses.ACCEPTED.value},
+                format='json', **headers)
+            self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        self.assertEqual(Order.objects.get(pk=self.orders[0].id).status, Order.DeliveryStatuses.DELIVERED)
+
+    def test_orders_update_not_found(self):
+        update_url = reverse('order:order-detail', args=[max(order.id for order in self.orders) + 1])
+        response = self.client.patch(
+            update_url, data={"status": Order.DeliveryStatuses.ACCEPTED.value}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_orders_not_update(self):
         instance = self.orders[-1]
         instance.status = Order.DeliveryStatuses.DELIVERED
@@ -147,9 +756,875 @@ class OrderViewSetTestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
 
+class MergeDuplicateCustomersTestCase(TestCase):
+
+    def test_merge_duplicate_customers(self):
+        customers = [
+            Customer.objects.create(full_name="John", email=f"john_{n}@example.com")
+            for n in range(3)
+        ]
+        orders = [Order.objects.create(customer=customer) for customer in customers]
+        # rows written before emails were normalized
+        Customer.objects.filter(pk=customers[1].pk).update(email="John_0@Example.com")
+        Customer.objects.filter(pk=customers[2].pk).update(email=" JOHN_0@example.com")
+
+        removed = merge_duplicate_customers(Customer, Order, batch_size=1)
+
+        self.assertEqual(removed, 2)
+        self.assertEqual(Customer.objects.count(), 1)
+        kept = Customer.objects.get()
+        self.assertEqual(kept.pk, customers[2].pk)
+        self.assertEqual(kept.email, "john_0@example.com")
+        self.assertEqual(
+            set(kept.orders.values_list('pk', flat=True)),
+            {order.pk for order in orders}
+        )
+
+
+class CustomerUniqueEmailMigrationTestCase(TransactionTestCase):
+    migrate_from = [('order', '0004_customer_trigram_indexes')]
+    migrate_to = [('order', '0006_customer_unique_email')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self) -> None:
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_merged_before_unique_email(self):
+        apps = self.migrate(self.migrate_from)
+        HistoricalCustomer = apps.get_model('order', 'Customer')
+        HistoricalOrder = apps.get_model('order', 'Order')
+        customers = [
+            HistoricalCustomer.objects.create(full_name="John", email=email)
+            for email in ("john@example.com", "John@Example.com", " JOHN@example.com")
+        ]
+        orders = [HistoricalOrder.objects.create(customer=customer) for customer in customers]
+
+        apps = self.migrate(self.migrate_to)
+
+        HistoricalCustomer = apps.get_model('order', 'Customer')
+        kept = HistoricalCustomer.objects.get()
+        self.assertEqual(kept.pk, customers[-1].pk)
+        self.assertEqual(kept.email, "john@example.com")
+        self.assertEqual(
+            list(apps.get_model('order', 'Order').objects.filter(pk__in=[order.pk for order in orders])
+                 .values_list('customer_id', flat=True)),
+            [kept.pk] * len(orders)
+        )
+
+
+class OrderQueryPlanTestCase(TestCase):
+
+    def setUp(self) -> None:
+        customer = Customer.objects.create(
+            full_name="John Doe", email="john@example.com")
+        Order.objects.create(
+            customer=customer, status=Order.DeliveryStatuses.NEW)
+
+        # tiny tables are always cheaper to scan, so make the planner
+        # show whether an index can serve the query at all
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def get_list_queryset(self, params):
+        view = OrderViewSet()
+        view.action = 'list'
+        view.request = Request(APIRequestFactory().get('/', params))
+        view.kwargs = {}
+        return view.filter_queryset(view.get_queryset())
+
+    def assertUsesIndexes(self, queryset):
+        plan = queryset.explain()
+        self.assertIn('Index', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_status_filter_plan(self):
+        queryset = self.get_list_queryset({'status': Order.DeliveryStatuses.NEW})
+        self.assertUsesIndexes(queryset[:20])
+
+    def test_default_ordering_plan(self):
+        queryset = self.get_list_queryset({})
+        self.assertUsesIndexes(queryset[:20])
+
+    def test_customer_search_plan(self):
+        queryset = self.get_list_queryset({'search': 'john'})
+        self.assertUsesIndexes(queryset[:20])
+
+        # The join may as well find the customers by key and check their
+        # vector, so the index is asserted on the match alone. Unordered,
+        # since the index is the only one it can use then.
+        matches = Customer.objects.filter(search_vector=SearchQuery(
+            'john:*', config=CustomerSearchFilter.search_config, search_type='raw',
+        )).order_by()
+        self.assertIn('order_customer_search_idx', matches.explain())
+
+
+@mock.patch.object(order_list_cache, 'timeout', 0)
+class CustomerSearchTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        self.list_url = reverse('order:order-list')
+        self.orders = {
+            name: Order.objects.create(
+                customer=Customer.objects.create(full_name=name, email=email),
+                status=Order.DeliveryStatuses.NEW,
+            )
+            for name, email in (
+                ("John Doe", "jd@example.com"),
+                ("Jane Roe", "john.roe@example.org"),
+                ("Mary Major", "mary@example.net"),
+            )
+        }
+
+    def search(self, text):
+        response = self.client.get(self.list_url, {'search': text})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [order['customer']['full_name'] for order in response.data['results']]
+
+    def test_prefix_words(self):
+        self.assertEqual(set(self.search('jo')), {"John Doe", "Jane Roe"})
+        self.assertEqual(self.search('jo do'), ["John Doe"])
+        self.assertEqual(self.search('example.net'), ["Mary Major"])
+        self.assertEqual(self.search('ohn'), [])
+
+    def test_ranked_by_weight(self):
+        # a name match ranks above an email match
+        self.assertEqual(self.search('john'), ["John Doe", "Jane Roe"])
+
+    @override_settings(ORDER_SEARCH_RANK_THRESHOLD=1)
+    def test_broad_search_not_ranked(self):
+        # newest first instead
+        self.assertEqual(self.search('john'), ["Jane Roe", "John Doe"])
+
+    def test_operators_are_ignored(self):
+        self.assertEqual(self.search("mary:* | !(jo) & 'x"), [])
+        self.assertEqual(len(self.search('!&|')), 3)
+
+    def test_vector_follows_changes(self):
+        customer = self.orders["Mary Major"].customer
+        customer.full_name = "Mary Minor"
+        customer.save()
+        self.assertEqual(self.search('minor'), ["Mary Minor"])
+
+        Customer.objects.filter(pk=customer.pk).update(email='queen@example.com')
+        self.assertEqual(self.search('queen'), ["Mary Minor"])
+        self.assertEqual(self.search('mary@'), ["Mary Minor"])
+
+        upserted = Customer.objects.upsert("Peter Pan", "peter@example.com")
+        Order.objects.create(customer=upserted, status=Order.DeliveryStatuses.NEW)
+        self.assertEqual(self.search('pet'), ["Peter Pan"])
+
+    def test_typo_tolerance(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('pg_trgm extension is not available')
+
+        self.assertEqual(self.search('jonh doe')[0], "John Doe")
+
+
+class CompiledSerializerTestCase(TestCase):
+
+    def setUp(self) -> None:
+        customer = Customer.objects.create(full_name="John Doe", email="john@example.com")
+        pizzas = [Pizza.objects.create(name=name) for name in ("Margherita", "Pepperoni \u2028")]
+        self.orders = [
+            Order.objects.create(customer=customer, status=status)
+            for status in (Order.DeliveryStatuses.NEW, Order.DeliveryStatuses.DELIVERED)
+        ]
+        for pizza in pizzas:
+            OrderItem.objects.create(
+                order=self.orders[0], pizza=pizza, size=OrderItem.Sizes.LARGE, count=2)
+
+    def assertSameOutput(self, serializer_class, instance, **kwargs):
+        with override_settings(COMPILED_SERIALIZERS=False):
+            expected = serializer_class(instance, **kwargs).data
+        data = serializer_class(instance, **kwargs).data
+
+        self.assertEqual(data, expected)
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(expected))
+        return data
+
+    def test_order_read_serializer(self):
+        orders = list(Order.objects.with_details().order_by('pk'))
+        data = self.assertSameOutput(OrderReadSerializer, orders, many=True)
+
+        self.assertEqual(len(data[0]['items']), 2)
+        self.assertEqual(data[1]['items'], [])
+        self.assertEqual(data[1]['status'], Order.DeliveryStatuses.DELIVERED)
+
+    def test_missing_values(self):
+        order = Order(pk=1, customer=None, status='')
+        self.assertSameOutput(OrderReadSerializer, order)
+
+    def test_fields_outside_the_model(self):
+        class OrderSummarySerializer(CompiledSerializerMixin, serializers.ModelSerializer):
+            email = serializers.EmailField(source='customer.email')
+            label = serializers.SerializerMethodField()
+            items = OrderItemReadSerializer(many=True, source='orderitem_set')
+
+            class Meta:
+                model = Order
+                fields = ['id', 'email', 'label', 'items', 'updated_at']
+
+            def get_label(self, order):
+                return f'{self.context["prefix"]}{order.pk}'
+
+        data = self.assertSameOutput(
+            OrderSummarySerializer, self.orders, many=True, context={'prefix': '#'})
+
+        self.assertEqual(data[0]['email'], 'john@example.com')
+        self.assertEqual(data[0]['label'], f'#{self.orders[0].pk}')
+
+    @override_settings(COMPILED_SERIALIZERS_CACHE_SIZE=2)
+    def test_factories_bounded(self):
+        order = self.orders[0]
+        compile_representation(OrderReadSerializer())
+        compile_representation(OrderItemReadSerializer())
+        # used again, so kept over the item serializer
+        compile_representation(OrderReadSerializer())
+        representation = compile_representation(PizzaSerializer())
+
+        self.assertEqual(len(compiled._factories), 2)
+        self.assertEqual(
+            representation(order.orderitem_set.first().pizza),
+            PizzaSerializer(order.orderitem_set.first().pizza).data,
+        )
+        self.assertEqual(
+            [key[0] for key in compiled._factories],
+            [('serializer', OrderReadSerializer), ('serializer', PizzaSerializer)],
+        )
+
+    def test_renderer(self):
+        data = {
+            'text': 'caf\u00e9 \u2028\u2029',
+            'lazy': gettext_lazy('Not found.'),
+            'decimal': decimal.Decimal('1.50'),
+            'datetime': timezone.now(),
+            'date': datetime.date(2021, 4, 1),
+            'integer_keys': {1: 'one'},
+            'tuple': (1, 2),
+            'huge': 2 ** 70,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+
+class ListResultCacheTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        caches[settings.ORDER_LIST_CACHE].clear()
+        self.list_url = reverse('order:order-list')
+        pizza = Pizza.objects.create(name="margarita")
+        customer = Customer.objects.create(full_name="John Doe", email="john@example.com")
+        self.orders = {}
+        for order_status in (Order.DeliveryStatuses.NEW, Order.DeliveryStatuses.ACCEPTED):
+            order = Order.objects.create(customer=customer, status=order_status)
+            OrderItem.objects.create(order=order, pizza=pizza, size=OrderItem.Sizes.SMALL, count=1)
+            self.orders[order_status] = order
+
+    def get_ids(self, params=None):
+        return [order['id'] for order in self.client.get(self.list_url, params).data['results']]
+
+    def test_cached_list(self):
+        response = self.client.get(self.list_url, {'search': 'John doe'})
+        hits = order_list_cache.stats()['hits']
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.list_url, {'search': ' DOE,john '})
+
+        self.assertEqual(cached.data, response.data)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(order_list_cache.stats()['hits'], hits + 1)
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                self.list_url, {'search': 'john doe'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_unknown_params_bypass(self):
+        self.client.get(self.list_url, {'page': 2})
+        bypasses = order_list_cache.stats()['bypasses']
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.list_url, {'page': 2})
+
+        self.assertTrue(queries)
+        self.assertEqual(order_list_cache.stats()['bypasses'], bypasses + 1)
+
+    def test_status_change_invalidation(self):
+        new, accepted = self.orders[Order.DeliveryStatuses.NEW], self.orders[Order.DeliveryStatuses.ACCEPTED]
+        self.assertEqual(self.get_ids({'status': 'NEW'}), [new.pk])
+        self.assertEqual(self.get_ids({'status': 'READY'}), [])
+        self.get_ids({'status': 'ACCEPTED'})
+        self.get_ids()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.set_status([new.pk], Order.DeliveryStatuses.READY)
+
+        # lists of other statuses are still cached
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_ids({'status': 'ACCEPTED'}), [accepted.pk])
+        self.assertEqual(self.get_ids({'status': 'NEW'}), [])
+        self.assertEqual(self.get_ids({'status': 'READY'}), [new.pk])
+        self.assertEqual(
+            [order['status'] for order in self.client.get(self.list_url).data['results']],
+            ['ACCEPTED', 'READY'],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            accepted.delete()
+        self.assertEqual(self.get_ids({'status': 'ACCEPTED'}), [])
+
+    def test_item_change_invalidation(self):
+        order = self.orders[Order.DeliveryStatuses.NEW]
+        item = order.orderitem_set.get()
+        self.client.get(self.list_url, {'status': 'NEW'})
+        item_url = reverse('order:order-items-detail', kwargs={"order_id": order.id, "pk": item.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(item_url, data={'count': 5}, format='json')
+
+        response = self.client.get(self.list_url, {'status': 'NEW'})
+        self.assertEqual(response.data['results'][0]['items'][0]['count'], 5)
+
+    def test_cache_stats(self):
+        url = reverse('order:order-cache-stats')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_login(get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('hits', response.data)
+        self.assertIn('hit_ratio', response.data)
+
+
+@override_settings(ORDER_EVENTS_BROKER='order.broker.InProcessBroker', ORDER_EVENTS_HEARTBEAT=1)
+class OrderEventStreamTestCase(TransactionTestCase):
+
+    def setUp(self) -> None:
+        customer = Customer.objects.create(full_name="Event Customer", email="events@example.com")
+        self.orders = [
+            Order.objects.create(customer=customer, status=Order.DeliveryStatuses.NEW)
+            for _ in range(3)
+        ]
+
+    def connect(self, query_string='', headers=()):
+        from app.asgi import application
+
+        return ApplicationCommunicator(application, {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/v1/orders/events/',
+            'query_string': query_string.encode(),
+            'headers': list(headers),
+        })
+
+    @staticmethod
+    def parse_event(message):
+        fields = dict(
+            line.split(': ', 1)
+            for line in message['body'].decode().splitlines() if line
+        )
+        return fields['id'], json.loads(fields['data'])
+
+    @async_to_sync
+    async def test_status_changes_streamed(self):
+        communicator = self.connect('status=READY')
+        await communicator.send_input({'type': 'http.request'})
+
+        start = await communicator.receive_output(1)
+        self.assertEqual(start['status'], status.HTTP_200_OK)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        await communicator.receive_output(1)  # retry
+
+        await sync_to_async(Order.objects.set_status)(
+            [self.orders[0].id], Order.DeliveryStatuses.ACCEPTED)
+        await sync_to_async(Order.objects.set_status)(
+            [self.orders[1].id], Order.DeliveryStatuses.READY)
+
+        # only READY is sent
+        event_id, data = self.parse_event(await communicator.receive_output(1))
+        self.assertEqual(data['id'], self.orders[1].id)
+        self.assertEqual(data['status'], Order.DeliveryStatuses.READY)
+
+        # idle streams are kept alive
+        heartbeat = await communicator.receive_output(2)
+        self.assertEqual(heartbeat['body'], b': ping\n\n')
+
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+
+    @async_to_sync
+    async def test_resume_from_last_event_id(self):
+        order = self.orders[0]
+        last_event_id = (await sync_to_async(Order.objects.get)(pk=order.id)).status_change.event_id
+
+        order.status = Order.DeliveryStatuses.SHIPPED
+        await sync_to_async(order.save)()
+
+        communicator = self.connect(headers=[(b'last-event-id', last_event_id.encode())])
+        await communicator.send_input({'type': 'http.request'})
+        await communicator.receive_output(1)  # response start
+        await communicator.receive_output(1)  # retry
+
+        # every status change after the given event
+        event_id, data = self.parse_event(await communicator.receive_output(1))
+        self.assertEqual(data['id'], self.orders[1].id)
+        event_id, data = self.parse_event(await communicator.receive_output(1))
+        self.assertEqual(data['id'], self.orders[2].id)
+        event_id, data = self.parse_event(await communicator.receive_output(1))
+        self.assertEqual(data, {**data, 'id': order.id, 'status': 'SHIPPED'})
+        self.assertTrue(await communicator.receive_nothing(0.2))
+
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+
+    @async_to_sync
+    async def test_resume_skips_other_changes(self):
+        order = self.orders[2]
+        last_event_id = (await sync_to_async(Order.objects.get)(pk=order.id)).status_change.event_id
+
+        # changes without a new status aren't events
+        await sync_to_async(self.orders[1].save)()
+        await sync_to_async(Order.objects.set_status)(
+            [self.orders[0].id], Order.DeliveryStatuses.ACCEPTED)
+
+        communicator = self.connect(headers=[(b'last-event-id', last_event_id.encode())])
+        await communicator.send_input({'type': 'http.request'})
+        await communicator.receive_output(1)  # response start
+        await communicator.receive_output(1)  # retry
+
+        event_id, data = self.parse_event(await communicator.receive_output(1))
+        self.assertEqual(data, {**data, 'id': self.orders[0].id, 'status': 'ACCEPTED'})
+        self.assertTrue(await communicator.receive_nothing(0.2))
+
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+
+    @async_to_sync
+    async def test_method_not_allowed(self):
+        communicator = self.connect()
+        communicator.scope['method'] = 'POST'
+        await communicator.send_input({'type': 'http.request'})
+
+        start = await communicator.receive_output(1)
+        self.assertEqual(start['status'], status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertIn((b'allow', b'GET'), start['headers'])
+
+    @async_to_sync
+    async def test_invalid_status(self):
+        communicator = self.connect('status=LOST')
+        await communicator.send_input({'type': 'http.request'})
+
+        start = await communicator.receive_output(1)
+        self.assertEqual(start['status'], status.HTTP_400_BAD_REQUEST)
+
+    def test_status_change_notified(self):
+        listener = PostgresBroker().connect()
+        try:
+            Order.objects.set_status([self.orders[0].id], Order.DeliveryStatuses.READY)
+            # saving without a status change is no event
+            self.orders[1].save()
+
+            self.assertTrue(select.select([listener], [], [], 1)[0])
+            listener.poll()
+            changes = [StatusChange.from_payload(notify.payload) for notify in listener.notifies]
+        finally:
+            listener.close()
+
+        order = Order.objects.get(pk=self.orders[0].id)
+        self.assertEqual(changes, [order.status_change])
+
+    def test_seeded_orders_not_notified(self):
+        listener = PostgresBroker().connect()
+        try:
+            Seeder(random.Random(0)).seed(pizzas=1, customers=1, orders=len(self.orders) + 2, items=1)
+            Order.objects.set_status([self.orders[0].id], Order.DeliveryStatuses.READY)
+
+            self.assertTrue(select.select([listener], [], [], 1)[0])
+            listener.poll()
+            changes = [StatusChange.from_payload(notify.payload) for notify in listener.notifies]
+        finally:
+            listener.close()
+
+        self.assertEqual(Order.objects.count(), len(self.orders) + 2)
+        self.assertEqual([change.order_id for change in changes], [self.orders[0].id])
+
+
+@mock.patch.object(order_list_cache, 'timeout', 0)
+class AsyncReadViewTestCase(TransactionTestCase):
+    async_urlconf = 'order.api.async_urls'
+
+    def setUp(self) -> None:
+        cache.clear()
+        pizza = Pizza.objects.create(name="margarita")
+        customer = Customer.objects.create(full_name="Async Customer", email="async@example.com")
+        self.order = Order.objects.create(customer=customer, status=Order.DeliveryStatuses.NEW)
+        OrderItem.objects.create(order=self.order, pizza=pizza, size=OrderItem.Sizes.LARGE, count=2)
+
+    def async_request(self, method, name, kwargs=None, data=None):
+        path = reverse(name, urlconf=self.async_urlconf, kwargs=kwargs)
+        match = resolve(path, urlconf=self.async_urlconf)
+        factory = AsyncRequestFactory()
+        if method == 'get':
+            request = factory.get(path)
+        else:
+            request = factory.post(path, data=json.dumps(data), content_type='application/json')
+        response = async_to_sync(match.func)(request, *match.args, **match.kwargs)
+        return response.status_code, json.loads(response.content)
+
+    def test_same_response_as_sync_views(self):
+        routes = [
+            ('order:order-list', None),
+            ('order:order-detail', {'pk': self.order.id}),
+            ('order:order-items-list', {'order_id': self.order.id}),
+            ('order:pizza-list', None),
+        ]
+        for name, kwargs in routes:
+            with self.subTest(name):
+                code, data = self.async_request('get', name.split(':')[1], kwargs)
+                response = self.client.get(reverse(name, kwargs=kwargs))
+
+                self.assertEqual(code, status.HTTP_200_OK)
+                self.assertEqual(data, response.json())
+
+    def test_writes_keep_sync_handling(self):
+        code, data = self.async_request('post', 'order-list', data={
+            "customer": {"full_name": "Async Customer", "email": "async@example.com"},
+            "items": [{"pizza": self.order.items.first().id, "size": "S", "count": 1}],
+        })
+
+        self.assertEqual(code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 2)
+
+    @mock.patch.object(OrderViewSet, 'export_chunk_size', 1)
+    @async_to_sync
+    async def test_export_streamed(self):
+        from app.asgi import application
+
+        customer = await sync_to_async(Customer.objects.get)()
+        await sync_to_async(Order.objects.create)(customer=customer)
+        communicator = ApplicationCommunicator(application, {
+            'type': 'http',
+            'method': 'GET',
+            'path': reverse('order:order-export'),
+            'query_string': b'format=ndjson',
+            'headers': [(b'host', b'localhost')],
+        })
+        await communicator.send_input({'type': 'http.request'})
+
+        start = await communicator.receive_output(1)
+        self.assertEqual(start['status'], status.HTTP_200_OK)
+        body = b''
+        while True:
+            message = await communicator.receive_output(1)
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        await communicator.wait(1)
+
+        self.assertEqual(len(body.decode().splitlines()), 2)
+
+
+class ConnectionPoolTestCase(TestCase):
+
+    def make_pool(self, **kwargs):
+        pool = ConnectionPool(
+            functools.partial(psycopg2.connect, **connection.get_connection_params()),
+            **kwargs,
+        )
+        self.addCleanup(pool.close_idle)
+        return pool
+
+    def test_connections_reused(self):
+        pool = self.make_pool(size=2)
+        first = pool.getconn()
+        pool.putconn(first)
+
+        self.assertIs(pool.getconn(), first)
+        stats = pool.stats()
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['idle'], 0)
+
+    def test_checkout_waits_then_times_out(self):
+        pool = self.make_pool(size=1, timeout=0.1)
+        busy = pool.getconn()
+
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+
+        pool.putconn(busy)
+        stats = pool.stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['max_wait_time'], 0.1)
+
+    def test_expired_connections_replaced(self):
+        pool = self.make_pool(size=1, max_lifetime=0)
+        first = pool.getconn()
+        pool.putconn(first)
+
+        self.assertTrue(first.closed)
+        self.assertIsNot(pool.getconn(), first)
+
+    def test_broken_connections_replaced_on_checkout(self):
+        pool = self.make_pool(size=1, check_idle=0)
+        first = pool.getconn()
+        pid = first.get_backend_pid()
+        pool.putconn(first)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+
+        second = pool.getconn()
+        self.assertIsNot(second, first)
+        self.assertEqual(pool.stats()['failed_checkouts'], 1)
+        pool.putconn(second)
+
+    def test_open_transaction_rolled_back(self):
+        pool = self.make_pool(size=1)
+        conn = pool.getconn()
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        pool.putconn(conn)
+
+        self.assertEqual(
+            conn.get_transaction_status(), psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+
+    def test_pooled_backend(self):
+        wrapper = DatabaseWrapper(
+            {**connection.settings_dict, 'POOL': {'SIZE': 1}}, alias='pooled')
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        self.addCleanup(wrapper.pool.close_idle)
+
+        wrapper.close()
+        self.assertFalse(raw.closed)
+        self.assertEqual(wrapper.pool.stats()['idle'], 1)
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIs(wrapper.connection, raw)
+        wrapper.close()
+
+    def test_pool_metrics_view(self):
+        url = reverse('db-pool')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(response.data['max_connections'], 0)
+        self.assertIn('pools', response.data)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+@mock.patch.object(order_list_cache, 'timeout', 0)
+class ReplicaRoutingTestCase(TransactionTestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpClass(cls):
+        # a second connection to the test database stands in for a replica
+        connections.databases['replica'] = {**connection.settings_dict, 'POOL': None}
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+
+    def setUp(self) -> None:
+        cache.clear()
+        replicas.reset()
+        lag_probe = mock.patch('app.db.routers.postgres_replication_lag', return_value=0)
+        self.replication_lag = lag_probe.start()
+        self.addCleanup(lag_probe.stop)
+
+        self.pizza = Pizza.objects.create(name="margarita")
+        customer = Customer.objects.create(full_name="Replica Customer", email="replica@example.com")
+        self.order = Order.objects.create(customer=customer, status=Order.DeliveryStatuses.NEW)
+
+    def test_reads_from_replica(self):
+        for name in ('order:order-list', 'order:pizza-list'):
+            with self.subTest(name):
+                with CaptureQueriesContext(connections['replica']) as replica_queries:
+                    with self.assertNumQueries(0, using='default'):
+                        response = self.client.get(reverse(name))
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertTrue(replica_queries.captured_queries)
+
+    def test_writes_pin_reads_to_primary(self):
+        response = self.client.post(reverse('order:order-list'), data={
+            "customer": {"full_name": "Replica Customer", "email": "replica@example.com"},
+            "items": [{"pizza": self.pizza.id, "size": "S", "count": 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get(reverse('order:order-list'))
+        self.assertEqual(response.data.get('count'), 2)
+        self.assertFalse(replica_queries.captured_queries)
+
+    def test_lagging_replica_skipped(self):
+        with override_settings(REPLICA_MAX_LAG=5):
+            self.replication_lag.return_value = 30
+            with CaptureQueriesContext(connections['replica']) as replica_queries:
+                self.client.get(reverse('order:order-list'))
+        self.assertFalse(replica_queries.captured_queries)
+
+    def test_unreachable_replica_skipped(self):
+        self.replication_lag.side_effect = OperationalError
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.client.get(reverse('order:order-list'))
+        self.assertFalse(replica_queries.captured_queries)
+
+    @override_settings(REPLICA_LAG_CHECK_INTERVAL=0, REPLICA_RETRY_INTERVAL=60)
+    def test_unreachable_replica_probed_again_later(self):
+        self.replication_lag.side_effect = OperationalError
+        self.client.get(reverse('order:order-list'))
+        self.client.get(reverse('order:order-list'))
+        self.assertEqual(self.replication_lag.call_count, 1)
+
+        self.replication_lag.side_effect = None
+        replicas.reset()
+        self.client.get(reverse('order:order-list'))
+        self.client.get(reverse('order:order-list'))
+        self.assertEqual(self.replication_lag.call_count, 3)
+
+
+class KitchenClaimTestCase(TransactionTestCase):
+
+    def setUp(self) -> None:
+        customer = Customer.objects.create(full_name="Kitchen Customer", email="kitchen@example.com")
+        self.orders = [
+            Order.objects.create(customer=customer, status=Order.DeliveryStatuses.NEW)
+            for _ in range(4)
+        ]
+        self.claim_url = reverse('order:order-claim')
+
+    def claim(self, station, limit=1):
+        response = self.client.post(
+            self.claim_url, data={'station': station, 'limit': limit}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data
+
+    def test_claim_oldest_orders(self):
+        claimed = self.claim('oven-1', limit=3)
+
+        self.assertEqual([order['id'] for order in claimed], [order.pk for order in self.orders[:3]])
+        self.assertTrue(all(order['status'] == 'ACCEPTED' for order in claimed))
+        self.assertTrue(all(order['claimed_by'] == 'oven-1' for order in claimed))
+        self.assertEqual([order['id'] for order in self.claim('oven-2', limit=3)], [self.orders[3].pk])
+        self.assertEqual(self.claim('oven-3'), [])
+
+    def test_claim_only_new_orders(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(status=Order.DeliveryStatuses.READY)
+
+        claimed = self.claim('oven-1', limit=4)
+
+        self.assertEqual([order['id'] for order in claimed], [order.pk for order in self.orders[1:]])
+
+    def test_claim_expired_lease(self):
+        self.claim('oven-1', limit=2)
+        Order.objects.filter(pk=self.orders[0].pk).update(
+            claimed_at=timezone.now() - datetime.timedelta(seconds=settings.ORDER_CLAIM_LEASE + 1))
+
+        claimed = self.claim('oven-2', limit=2)
+
+        self.assertEqual([order['id'] for order in claimed], [self.orders[0].pk, self.orders[2].pk])
+        self.assertEqual(Order.objects.get(pk=self.orders[0].pk).claimed_by, 'oven-2')
+        self.assertEqual(Order.objects.get(pk=self.orders[1].pk).claimed_by, 'oven-1')
+
+    def test_renew_claims(self):
+        self.claim('oven-1', limit=3)
+        expired = timezone.now() - datetime.timedelta(seconds=settings.ORDER_CLAIM_LEASE + 1)
+        Order.objects.filter(pk__in=[order.pk for order in self.orders[:3]]).update(claimed_at=expired)
+        Order.objects.filter(pk=self.orders[2].pk).update(status=Order.DeliveryStatuses.READY)
+
+        # renewed late, but before anyone else claimed them
+        response = self.client.post(reverse('order:order-renew-claims'), data={
+            'station': 'oven-1',
+            'ids': [order.pk for order in self.orders],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'renewed': [self.orders[0].pk, self.orders[1].pk],
+            'lost': [self.orders[2].pk, self.orders[3].pk],
+        })
+        self.assertEqual([order['id'] for order in self.claim('oven-2', limit=4)], [self.orders[3].pk])
+
+        # a station can't renew what another one took over
+        Order.objects.filter(pk=self.orders[0].pk).update(claimed_at=expired)
+        self.assertEqual([order['id'] for order in self.claim('oven-2')], [self.orders[0].pk])
+        self.assertEqual(Order.objects.renew_claims('oven-1', [self.orders[0].pk]), [])
+
+    def test_claim_invalid(self):
+        for data in ({}, {'station': 'oven-1', 'limit': 0},
+                     {'station': 'oven-1', 'limit': settings.ORDER_CLAIM_MAX_SIZE + 1}):
+            response = self.client.post(self.claim_url, data=data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.filter(status=Order.DeliveryStatuses.ACCEPTED).exists())
+
+    def test_concurrent_claims(self):
+        customer = Customer.objects.create(full_name="Busy Customer", email="busy@example.com")
+        Order.objects.bulk_create(
+            Order(customer=customer, status=Order.DeliveryStatuses.NEW) for _ in range(200))
+        queued = set(Order.objects.filter(status=Order.DeliveryStatuses.NEW).values_list('pk', flat=True))
+        claimed = {}
+        start = threading.Barrier(4)
+
+        def station(name):
+            try:
+                start.wait()
+                while True:
+                    ids = Order.objects.claim(name, 3)
+                    if not ids:
+                        return
+                    for pk in ids:
+                        claimed.setdefault(pk, []).append(name)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=station, args=(f'oven-{n}',)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(set(claimed), queued)
+        self.assertEqual([pk for pk, stations in claimed.items() if len(stations) > 1], [])
+        self.assertEqual(
+            dict(Order.objects.filter(pk__in=queued).values_list('pk', 'claimed_by')),
+            {pk: stations[0] for pk, stations in claimed.items()},
+        )
+
+
 class OrderItemViewSetTestCase(APITestCase):
 
     def setUp(self) -> None:
+        cache.clear()
         self.pizzas = [
             Pizza.objects.create(
                 name=flavor
@@ -174,6 +1649,28 @@ class OrderItemViewSetTestCase(APITestCase):
 
         return orders
 
+    def test_invalid_ids_not_found(self):
+        order_id = self.orders[0].id
+        item_id = self.orders[0].orderitem_set.first().id
+        requests = [
+            ('get', reverse('order:order-detail', args=['abc'])),
+            ('put', reverse('order:order-detail', args=['abc'])),
+            ('patch', reverse('order:order-detail', args=['abc'])),
+            ('patch', reverse('order:order-detail', args=[2 ** 63])),
+            ('get', reverse('order:order-items-list', args=['abc'])),
+            ('post', reverse('order:order-items-list', args=['abc'])),
+            ('put', reverse('order:order-items-list', args=['abc'])),
+            ('patch', reverse('order:order-items-list', args=['abc'])),
+            ('get', reverse('order:order-items-detail', args=['abc', item_id])),
+            ('patch', reverse('order:order-items-detail', args=['abc', item_id])),
+            ('patch', reverse('order:order-items-detail', args=[order_id, 'abc'])),
+            ('delete', reverse('order:order-items-detail', args=[order_id, 'abc'])),
+        ]
+        for method, url in requests:
+            with self.subTest(method=method, url=url):
+                response = getattr(self.client, method)(url, data={"count": 1}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_order_items_list(self):
         instance = self.orders[1]
         order_items_list_url = reverse('order:order-items-list', kwargs={"order_id": instance.id})
@@ -185,7 +1682,20 @@ class OrderItemViewSetTestCase(APITestCase):
         self.assertEqual(response.data.get('count'), len(queryset))
         self.assertEqual(response.data.get('results'), serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-    
+
+    def test_order_items_list_sparse_fields(self):
+        instance = self.orders[1]
+        order_items_list_url = reverse('order:order-items-list', kwargs={"order_id": instance.id})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(order_items_list_url, {'fields': 'pizza,count'})
+
+        self.assertEqual(
+            sorted((item['pizza'], item['count']) for item in response.data.get('results')),
+            sorted(instance.orderitem_set.values_list('pizza_id', 'count')),
+        )
+        self.assertNotIn('order_pizza', queries[-1]['sql'])
+
     def test_order_items_update(self):
         order = self.orders[1]
         item = order.orderitem_set.first()
@@ -226,3 +1736,390 @@ class OrderItemViewSetTestCase(APITestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+
+    def test_order_items_if_match(self):
+        order = self.orders[1]
+        item, other_item = order.orderitem_set.all()[:2]
+        order_url = reverse('order:order-detail', args=[order.id])
+        item_url = reverse('order:order-items-detail', kwargs={"order_id": order.id, "pk": item.id})
+        etag = self.client.get(order_url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.patch(item_url, data={"count": 77}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data.get('count'), 77)
+        self.assertEqual(Order.objects.get(pk=order.id).version, 2)
+
+        # the order moved on since `etag`
+        response = self.client.patch(item_url, data={"count": 78}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        other_url = reverse('order:order-items-detail', kwargs={"order_id": order.id, "pk": other_item.id})
+        response = self.client.delete(other_url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(OrderItem.objects.get(pk=item.id).count, 77)
+
+        etag = self.client.get(order_url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.delete(other_url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response['ETag'], '"3"')
+        self.assertFalse(OrderItem.objects.filter(pk=other_item.id).exists())
+
+        response = self.client.delete(other_url, HTTP_IF_MATCH='"3"')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Order.objects.get(pk=order.id).version, 3)
+
+    def test_order_items_not_destroy(self):
+        order = self.orders[-1]
+        Order.objects.set_status([order.id], Order.DeliveryStatuses.DELIVERED)
+        item = order.orderitem_set.first()
+
+        response = self.client.delete(reverse('order:order-items-detail', kwargs={
+            "order_id": order.id,
+            "pk": item.id,
+        }))
+
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        self.assertTrue(OrderItem.objects.filter(pk=item.id).exists())
+
+    def test_order_items_bulk_update(self):
+        order = self.orders[0]
+        margarita, marinara, salami = self.pizzas
+        OrderItem.objects.filter(order=order).delete()
+        kept = OrderItem.objects.create(order=order, pizza=margarita, size='S', count=1)
+        changed = OrderItem.objects.create(order=order, pizza=marinara, size='M', count=1)
+        OrderItem.objects.create(order=order, pizza=marinara, size='M', count=4)
+        OrderItem.objects.create(order=order, pizza=salami, size='L', count=1)
+        items_url = reverse('order:order-items-list', kwargs={"order_id": order.id})
+
+        with self.assertNumQueries(8):
+            response = self.client.put(items_url, data=[
+                {"pizza": margarita.id, "size": "S", "count": 1},
+                {"pizza": marinara.id, "size": "M", "count": 2},
+                {"pizza": salami.id, "size": "S", "count": 1},
+                {"pizza": salami.id, "size": "S", "count": 2},
+            ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        items = list(OrderItem.objects.filter(order=order).order_by('id').values_list(
+            'id', 'pizza_id', 'size', 'count'))
+        self.assertEqual(items[:2], [(kept.id, margarita.id, 'S', 1), (changed.id, marinara.id, 'M', 2)])
+        self.assertEqual(items[2][1:], (salami.id, 'S', 3))
+        self.assertEqual(
+            [(item['id'], item['pizza'], item['size'], item['count']) for item in response.data], items)
+        self.assertEqual(response['ETag'], '"2"')
+
+    def test_order_items_partial_bulk_update(self):
+        order = self.orders[0]
+        margarita, marinara, salami = self.pizzas
+        OrderItem.objects.filter(order=order).delete()
+        OrderItem.objects.create(order=order, pizza=margarita, size='S', count=1)
+        OrderItem.objects.create(order=order, pizza=marinara, size='M', count=1)
+        items_url = reverse('order:order-items-list', kwargs={"order_id": order.id})
+
+        response = self.client.patch(items_url, data=[
+            {"pizza": marinara.id, "size": "M", "count": 0},
+            {"pizza": salami.id, "size": "L", "count": 2},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(OrderItem.objects.filter(order=order).order_by('id').values_list('pizza_id', 'size', 'count')),
+            [(margarita.id, 'S', 1), (salami.id, 'L', 2)],
+        )
+        self.assertEqual(len(response.data), 2)
+
+    def test_order_items_bulk_update_refused(self):
+        order = self.orders[0]
+        items_url = reverse('order:order-items-list', kwargs={"order_id": order.id})
+        items = list(order.orderitem_set.values_list('pizza_id', 'size', 'count'))
+        data = [{"pizza": self.pizzas[0].id, "size": "S", "count": 9}]
+
+        response = self.client.put(items_url, data=[{"pizza": 0, "size": "S", "count": 1}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(
+            items_url, data=[{"pizza": max(pizza.id for pizza in self.pizzas) + 1, "size": "S", "count": 1}],
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pizza', response.data[0])
+
+        response = self.client.put(items_url, data=data, format='json', HTTP_IF_MATCH='"7"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        Order.objects.set_status([order.id], Order.DeliveryStatuses.DELIVERED)
+        response = self.client.patch(items_url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        self.assertEqual(list(order.orderitem_set.values_list('pizza_id', 'size', 'count')), items)
+
+class OrderStatusHistoryTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        status_history.flush()
+        self.customer = Customer.objects.create(full_name="History Customer", email="history@example.com")
+        self.pizza = Pizza.objects.create(name="margarita")
+
+    def get_history(self, order_id):
+        return list(OrderStatusEvent.objects.filter(order_id=order_id).values_list('previous_status', 'status'))
+
+    def test_status_changes_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('order:order-list'), data={
+                "customer": {"full_name": "History Customer", "email": "history@example.com"},
+                "items": [{"pizza": self.pizza.id, "size": "S", "count": 1}],
+            }, format='json')
+        order_id = response.data['id']
+        detail_url = reverse('order:order-detail', args=[order_id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail_url, data={"status": "ACCEPTED"}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('order:order-claim'), data={'station': 'oven-1'}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('order:order-bulk-status'), data={'ids': [order_id], 'status': 'READY'}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.get(pk=order_id)
+            order.status = Order.DeliveryStatuses.SHIPPED
+            order.save()
+
+        # buffered until flushed
+        self.assertEqual(self.get_history(order_id), [])
+        status_history.flush()
+
+        self.assertEqual(self.get_history(order_id), [
+            (None, 'NEW'), ('NEW', 'ACCEPTED'), ('ACCEPTED', 'READY'), ('READY', 'SHIPPED'),
+        ])
+        partition = f'{OrderStatusEvent._meta.db_table}_p{timezone.now():%Y_%m}'
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM ' + partition)
+            self.assertGreaterEqual(cursor.fetchone()[0], 4)
+
+    def test_batched_writes(self):
+        order = Order.objects.create(customer=self.customer, status=Order.DeliveryStatuses.NEW)
+        changes = [
+            StatusChange(order.pk, status, timezone.now(), previous)
+            for previous, status in (('NEW', 'ACCEPTED'), ('ACCEPTED', 'READY'), ('READY', 'SHIPPED'))
+        ]
+
+        with self.settings(ORDER_STATUS_HISTORY_BATCH_SIZE=2):
+            with self.assertNumQueries(0):
+                status_history.add(changes[:1])
+            status_history.add(changes[1:])
+
+        self.assertEqual(len(self.get_history(order.pk)), 3)
+
+    def test_full_batch_written_without_thread(self):
+        order = Order.objects.create(customer=self.customer, status=Order.DeliveryStatuses.NEW)
+        changes = [
+            StatusChange(order.pk, status, timezone.now(), previous)
+            for previous, status in (('NEW', 'ACCEPTED'), ('ACCEPTED', 'READY'))
+        ]
+
+        with self.settings(ORDER_STATUS_HISTORY_BATCH_SIZE=2, ORDER_STATUS_HISTORY_FLUSH_INTERVAL=60):
+            status_history.add(changes)
+
+        self.assertFalse(status_history.started)
+        self.assertEqual(len(self.get_history(order.pk)), 2)
+
+    def test_detached_partition_recreated(self):
+        order = Order.objects.create(customer=self.customer, status=Order.DeliveryStatuses.NEW)
+        changed_at = datetime.datetime(2001, 1, 15, tzinfo=datetime.timezone.utc)
+        # as if its partition had been detached and dropped since
+        known_partitions.add(month_start(changed_at))
+        self.addCleanup(forget_partitions)
+
+        OrderStatusEvent.objects.append([StatusChange(order.pk, 'ACCEPTED', changed_at, 'NEW')])
+
+        self.assertEqual(self.get_history(order.pk), [('NEW', 'ACCEPTED')])
+
+    def test_status_durations(self):
+        started = timezone.now() - datetime.timedelta(hours=1)
+        changes = []
+        for order_id, minutes in enumerate([1, 2, 3, 10], start=1):
+            accepted = started + datetime.timedelta(minutes=minutes)
+            changes += [
+                StatusChange(order_id, 'NEW', started),
+                StatusChange(order_id, 'ACCEPTED', accepted, 'NEW'),
+                StatusChange(order_id, 'READY', accepted + datetime.timedelta(seconds=30), 'ACCEPTED'),
+            ]
+        # before the window
+        changes += [
+            StatusChange(5, 'NEW', started - datetime.timedelta(days=30)),
+            StatusChange(5, 'ACCEPTED', started, 'NEW'),
+        ]
+        OrderStatusEvent.objects.append(changes)
+        durations_url = reverse('order:order-status-durations')
+
+        response = self.client.get(durations_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(get_user_model().objects.create(username='staff', is_staff=True))
+        response = self.client.get(durations_url, {'since': (started - datetime.timedelta(days=1)).isoformat()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['statuses']), ['NEW', 'ACCEPTED'])
+        self.assertEqual(response.data['statuses']['NEW']['count'], 4)
+        self.assertEqual(response.data['statuses']['NEW']['p50'], 150)
+        self.assertEqual(response.data['statuses']['NEW']['p95'], 537)
+        # order 5 is still ACCEPTED
+        self.assertEqual(response.data['statuses']['ACCEPTED'], {'count': 4, 'p50': 30, 'p95': 30, 'p99': 30})
+
+        response = self.client.get(durations_url, {'since': timezone.now().isoformat(), 'until': started.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+@mock.patch.object(order_list_cache, 'timeout', 0)
+class RequestTimingTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        self.list_url = reverse('order:order-list')
+        pizza = Pizza.objects.create(name="margarita")
+        for n in range(3):
+            order = Order.objects.create(
+                customer=Customer.objects.create(full_name="John Doe", email=f"john_{n}@example.com"),
+                status=Order.DeliveryStatuses.NEW,
+            )
+            OrderItem.objects.create(order=order, pizza=pizza, size=OrderItem.Sizes.SMALL, count=1)
+
+    def get_metrics(self, response):
+        return {
+            metric.split(';')[0]: metric
+            for metric in response['Server-Timing'].split(', ')
+        }
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.list_url)
+
+        metrics = self.get_metrics(response)
+        self.assertEqual(set(metrics), {'db', 'serialize', 'render', 'total'})
+        self.assertIn(f'desc="{len(queries)} queries"', metrics['db'])
+
+    def test_log_line(self):
+        with self.assertLogs('app.timing', 'INFO') as logs:
+            self.client.get(self.list_url)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'OrderViewSet')
+        self.assertEqual(line['action'], 'list')
+        self.assertEqual(line['status'], status.HTTP_200_OK)
+        self.assertEqual(line['query_budget'], OrderViewSet.query_budgets['list'])
+        self.assertGreater(line['serialize_ms'], 0)
+
+    def test_n_plus_one_over_budget(self):
+        # customers and items loaded per order
+        with mock.patch.object(OrderQuerySet, 'with_details', lambda queryset: queryset):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(self.list_url)
+
+    @override_settings(QUERY_BUDGETS_STRICT=False)
+    def test_over_budget_warning(self):
+        with mock.patch.dict(OrderViewSet.query_budgets, {'list': 1}):
+            with self.assertLogs('app.timing', 'WARNING') as logs:
+                response = self.client.get(self.list_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('OrderViewSet.list made', logs.output[0])
+
+
+class AsyncAPIURLConf:
+    urlpatterns = [
+        path('api/v1/', include(('order.api.async_urls', 'order'), namespace='order')),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncAPIURLConf)
+class AsyncRequestTimingTestCase(TransactionTestCase):
+    delay = 0.5
+
+    def setUp(self) -> None:
+        # every request reaches the view
+        list_cache_off = mock.patch.object(order_list_cache, 'timeout', 0)
+        list_cache_off.start()
+        self.addCleanup(list_cache_off.stop)
+        pizza = Pizza.objects.create(name="margarita")
+        self.order = Order.objects.create(
+            customer=Customer.objects.create(full_name="John Doe", email="john@example.com"),
+            status=Order.DeliveryStatuses.NEW,
+        )
+        self.item = OrderItem.objects.create(
+            order=self.order, pizza=pizza, size=OrderItem.Sizes.SMALL, count=1)
+
+    async def get(self, url):
+        from app.asgi import django_application
+
+        communicator = ApplicationCommunicator(django_application, {
+            'type': 'http',
+            'method': 'GET',
+            'path': url,
+            'query_string': b'',
+            'headers': [(b'host', b'localhost')],
+        })
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(5)
+        await communicator.receive_output(5)
+        await communicator.wait(1)
+        return start['status'], {name.lower(): value for name, value in start['headers']}
+
+    @async_to_sync
+    async def test_async_views_concurrent(self):
+        list_orders = OrderViewSet.list
+
+        def slow_list(view, request, *args, **kwargs):
+            time.sleep(self.delay)
+            return list_orders(view, request, *args, **kwargs)
+
+        url = reverse('order:order-list', urlconf=AsyncAPIURLConf)
+        with mock.patch.object(OrderViewSet, 'list', slow_list):
+            started = time.perf_counter()
+            responses = await asyncio.gather(*[self.get(url) for _ in range(4)])
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual([code for code, headers in responses], [status.HTTP_200_OK] * 4)
+        self.assertTrue(all(b'server-timing' in headers for code, headers in responses))
+        # one after the other they'd take 4 delays
+        self.assertLess(elapsed, 3 * self.delay)
+
+    @async_to_sync
+    async def test_sync_view_queries_counted(self):
+        url = reverse('order:order-items-detail', urlconf=AsyncAPIURLConf,
+                      args=[self.order.id, self.item.id])
+        code, headers = await self.get(url)
+
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertIn(b'desc="1 queries"', headers[b'server-timing'])
+
+
+class BenchmarkTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.added = Seeder(random.Random(0), batch_size=7).seed(
+            pizzas=3, customers=10, orders=50, items=2)
+
+    def test_seed(self):
+        self.assertEqual(self.added, {'pizzas': 3, 'customers': 10, 'orders': 50})
+        self.assertEqual(Order.objects.count(), 50)
+        self.assertFalse(Order.objects.filter(orderitem__isnull=True).exists())
+        self.assertFalse(Customer.objects.filter(search_vector__isnull=True).exists())
+        # primary keys were taken from the sequences
+        self.assertEqual(
+            Customer.objects.create(full_name="John Doe", email="john@example.com").pk,
+            Customer.objects.order_by('pk').values_list('pk', flat=True)[10 - 1] + 1,
+        )
+        # already there
+        self.assertEqual(
+            Seeder(random.Random(0)).seed(pizzas=3, customers=10, orders=50, items=2),
+            {'pizzas': 0, 'customers': 0, 'orders': 0},
+        )
+
+    def test_run(self):
+        results = Runner(requests=3, warmup=1).run()
+
+        self.assertEqual(set(results['scenarios']), set(SCENARIOS))
+        for name, result in results['scenarios'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertEqual(result['requests'], 3)
+            self.assertEqual(result['over_budget'], 0)
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+        # writes are rolled back
+        self.assertEqual(Order.objects.count(), 50)
+        json.dumps(results)